@@ -0,0 +1,3 @@
+"""Define the Tython benchmarks
+Author: Ty Brennan
+"""
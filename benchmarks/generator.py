@@ -0,0 +1,68 @@
+"""Define the generator of synthetic benchmark programs
+Author: Ty Brennan
+"""
+
+import random
+import typing
+import string
+
+# computed variables are REAL64 and every operator node averages its operands, so values stay bounded by the
+# loop counters and literals whatever the shape of the program: no overflow, infinities or division by zero
+VALUE_VARIABLES:list = list('ABCDEFGH')
+LABELS:list = [letter + digit for digit in [''] + list(string.digits) for letter in string.ascii_uppercase]
+LOOP_BODY_LINES:int = 12 # statements between the label and the back jump of a loop
+
+
+def generate(lines:int=100, depth:int=3, nesting:int=1, trip_count:int=10, seed:int=0, name:str='synthetic') -> str:
+    '''
+    Source of a deterministic program for benchmarks. The program is a sequence of GOTO loops whose bodies assign
+    random expressions inside nested conditional blocks, it prints every computed variable at the end.
+    @Params
+        lines:int           Approximate number of source lines
+        depth:int           Depth of every expression tree, an expression has up to 2**depth operands
+        nesting:int         Levels of conditional blocks nested inside each other. IF ... THEN blocks cannot
+                            contain IFs, so a block is skipped with IF <condition> / GOTO <label after it>
+        trip_count:int      Iterations of every loop
+        seed:int            Seed of the random choices
+        name:str            Program name
+    @Returns
+        str                 The source text
+    '''
+    rng = random.Random(seed)
+    out = [f'PROGRAM "{name}"']
+    out += [f'REAL64 {var}' for var in VALUE_VARIABLES]
+    out += [f'0 -> {var}' for var in VALUE_VARIABLES]
+    labels = iter(LABELS)
+    while len(out) < lines:
+        label = next(labels, None)
+        if label is None: # out of label names, the rest of the program is straight-line
+            out += _statements(rng, labels, LOOP_BODY_LINES, depth, nesting, 0)
+            continue
+        out += ['0 -> I', f'lbl {label}']
+        out += _statements(rng, labels, LOOP_BODY_LINES, depth, nesting, 0)
+        out += ['I + 1 -> I', f'if I < {trip_count}', f'goto {label}']
+    out += [f'disp {var}' for var in VALUE_VARIABLES]
+    return '\n'.join(out) + '\n'
+
+
+def _statements(rng:random.Random, labels:typing.Iterator, count:int, depth:int, nesting:int, level:int) -> list:
+    out = []
+    while len(out) < count:
+        label = next(labels, None) if level < nesting and rng.random() < 0.3 else None
+        if label is not None:
+            out += [f'if {_condition(rng)}', f'goto {label}']
+            out += ['    ' + line for line in _statements(rng, labels, max(count // 3, 1), depth, nesting, level + 1)]
+            out.append(f'lbl {label}')
+        else:
+            out.append(f'{_expression(rng, depth)} -> {rng.choice(VALUE_VARIABLES)}')
+    return out
+
+
+def _condition(rng:random.Random) -> str:
+    return f'{rng.choice(VALUE_VARIABLES)} {rng.choice(["<", ">", "<=", ">="])} {rng.choice(["I", str(rng.randint(0, 9))])}'
+
+
+def _expression(rng:random.Random, depth:int) -> str:
+    if depth == 0:
+        return rng.choice([rng.choice(VALUE_VARIABLES), 'I', str(rng.randint(1, 9))])
+    return f'( {_expression(rng, depth - 1)} {rng.choice("+-")} {_expression(rng, depth - 1)} ) * 0.5'
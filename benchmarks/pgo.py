@@ -0,0 +1,108 @@
+"""Define the benchmark of profile-guided against plain builds
+Author: Ty Brennan
+
+Usage: python -m benchmarks.pgo [--repeat N] [--json results.json]
+"""
+
+import os, sys
+import io
+import json
+import time
+import pathlib
+import argparse
+import tempfile
+import subprocess
+
+import tython_compiler as tc
+
+PROGRAM_DIRECTORY:pathlib.Path = pathlib.Path(__file__).parent / 'programs'
+# program: (training input, interpreter input, native executable input), every input being the value of N
+WORKLOADS:dict = {
+    'checksum': (1000, 20000, 100000000),
+    'collatz': (200, 2000, 2000000),
+    'primes': (500, 5000, 2000000),
+}
+
+
+def assemble(path:pathlib.Path) -> tc.Program:
+    with open(path, 'r') as f:
+        return tc.Assembler.assemble(tc.Parser.syntax_analysis(tc.Parser.lexical_analysis(f.read())))
+
+
+def train(program:tc.Program, n:int) -> dict:
+    '''Profile a run of program on the training input'''
+    interpreter = tc.Interpreter()
+    interpreter.profiler = tc.Profiler()
+    interpreter.output_sink = tc.NullSink()
+    interpreter.input_stream = io.StringIO(f'{n}\n')
+    interpreter.execute(program)
+    return interpreter.profiler.to_dict()
+
+
+def run_interpreted(program:tc.Program, n:int, cache_directory:str) -> tuple:
+    '''(seconds, output) of one interpreted run with the JIT'''
+    interpreter = tc.Interpreter(jit=tc.JIT(cache_directory=cache_directory))
+    interpreter.output_sink = tc.CaptureSink()
+    interpreter.input_stream = io.StringIO(f'{n}\n')
+    start = time.perf_counter()
+    interpreter.execute(program)
+    return time.perf_counter() - start, interpreter.output_sink.getvalue()
+
+
+def run_native(executable:str, n:int) -> tuple:
+    '''(seconds, output) of one run of a native executable'''
+    start = time.perf_counter()
+    result = subprocess.run([executable], input=f'{n}\n', capture_output=True, text=True, check=True)
+    return time.perf_counter() - start, result.stdout
+
+
+def best(runs:list) -> tuple:
+    '''Fastest run, after checking that every run printed the same'''
+    if len({output for _, output in runs}) != 1:
+        raise AssertionError(f'Runs printed different outputs: {[output for _, output in runs]}')
+    return min(seconds for seconds, _ in runs), runs[0][1]
+
+
+def benchmark(name:str, repeat:int, directory:str) -> dict:
+    training, interpreted_n, native_n = WORKLOADS[name]
+    plain = assemble(PROGRAM_DIRECTORY / f'{name}.ty')
+    optimized = tc.Optimizer.optimize(plain, train(plain, training))
+    result = {'program': name, 'inputs': {'training': training, 'interpreted': interpreted_n, 'native': native_n}}
+    outputs = {}
+    for variant, program in (('plain', plain), ('pgo', optimized)):
+        cache = os.path.join(directory, f'{name}-{variant}-jit')
+        seconds, outputs[('interpreted', variant)] = best([run_interpreted(program, interpreted_n, cache) for _ in range(repeat)])
+        result[f'interpreted_{variant}'] = seconds
+        if tc.Lowerer.find_compiler() is not None:
+            executable = os.path.join(directory, f'{name}-{variant}')
+            tc.Lowerer.build_executable(tc.Lowerer.lower_program(program), executable)
+            seconds, outputs[('native', variant)] = best([run_native(executable, native_n) for _ in range(repeat)])
+            result[f'native_{variant}'] = seconds
+    for engine in ('interpreted', 'native'):
+        if (engine, 'plain') in outputs and outputs[(engine, 'plain')] != outputs[(engine, 'pgo')]:
+            raise AssertionError(f'{name}: the PGO build printed {outputs[(engine, "pgo")]!r}, expected {outputs[(engine, "plain")]!r}')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare profile-guided and plain builds of the benchmark programs')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of every build, the fastest one counts')
+    parser.add_argument('--json', metavar='PATH', help='also write the results as JSON')
+    args = parser.parse_args()
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        print(f'{"program":<10} {"interpreted":>12} {"+pgo":>10} {"speedup":>8} {"native":>10} {"+pgo":>10} {"speedup":>8}')
+        for name in WORKLOADS:
+            r = benchmark(name, args.repeat, directory)
+            results.append(r)
+            row = f'{name:<10} {r["interpreted_plain"]:>11.3f}s {r["interpreted_pgo"]:>9.3f}s {r["interpreted_plain"] / r["interpreted_pgo"]:>7.2f}x'
+            if 'native_plain' in r:
+                row += f' {r["native_plain"]:>9.3f}s {r["native_pgo"]:>9.3f}s {r["native_plain"] / r["native_pgo"]:>7.2f}x'
+            print(row, flush=True)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
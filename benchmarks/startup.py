@@ -0,0 +1,65 @@
+"""Define the startup benchmark: the cost of importing the package and of running a tiny program
+Author: Ty Brennan
+
+Usage: python -m benchmarks.startup [--repeat N] [--importtime]
+"""
+
+import os, sys
+import time
+import pathlib
+import argparse
+import statistics
+import subprocess
+
+ROOT:pathlib.Path = pathlib.Path(__file__).parent.parent
+HELLO:pathlib.Path = pathlib.Path(__file__).parent / 'programs' / 'hello.ty'
+
+# name: arguments of the python interpreter, each run in a fresh process
+COMMANDS:dict = {
+    'python': ['-c', 'pass'],
+    'import': ['-c', 'import tython_compiler'],
+    'import parser+interpreter': ['-c', 'import tython_compiler as tc; tc.Parser; tc.Interpreter'],
+    'main.py hello.ty -i': [str(ROOT / 'main.py'), str(HELLO), '-i'],
+}
+
+
+def time_command(arguments:list, repeat:int) -> float:
+    '''Median wall time in seconds of repeat runs of python with the arguments'''
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *arguments], cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def slowest_imports(arguments:list, count:int=10) -> list:
+    '''[(cumulative microseconds, module)] of the count slowest imports reported by python -X importtime'''
+    result = subprocess.run([sys.executable, '-X', 'importtime', *arguments], cwd=ROOT, check=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            imports.append((int(fields[1]), fields[2].rstrip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Measure the import and startup time of the compiler')
+    parser.add_argument('--repeat', type=int, default=10, help='runs of every command, the median counts')
+    parser.add_argument('--importtime', action='store_true', help='list the slowest imports of every command')
+    args = parser.parse_args()
+    baseline = time_command(COMMANDS['python'], args.repeat)
+    print(f'{"command":<28} {"time (ms)":>10} {"over python (ms)":>17}')
+    for name, arguments in COMMANDS.items():
+        seconds = baseline if name == 'python' else time_command(arguments, args.repeat)
+        print(f'{name:<28} {seconds * 1e3:>10.1f} {(seconds - baseline) * 1e3:>17.1f}')
+        if args.importtime and name != 'python':
+            for microseconds, module in slowest_imports(arguments):
+                print(f'    {microseconds / 1e3:>8.1f} ms {module}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
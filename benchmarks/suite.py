@@ -0,0 +1,237 @@
+"""Define the benchmark suite of the compiler pipeline and execution engines
+Author: Ty Brennan
+
+Usage: python -m benchmarks.suite [--repeat N] [--scale X] [--only NAME ...] [--baseline PATH] [--save PATH]
+"""
+
+import os, sys
+import gc
+import io
+import json
+import time
+import pathlib
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+import tython_compiler as tc
+from .generator import generate
+
+SUITE_FORMAT_VERSION:int = 1
+PROGRAM_DIRECTORY:pathlib.Path = pathlib.Path(__file__).parent / 'programs'
+BASELINE_PATH:pathlib.Path = pathlib.Path(__file__).parent / 'baseline.json' # written by --save on the reference machine
+MIN_SAMPLE_TIME:float = 0.05 # seconds, short stages are repeated within a sample until it lasts this long
+TOLERANCE:float = 0.25 # relative slowdown or memory growth against the baseline that counts as a regression
+STAGES:tuple = ('lexical_analysis', 'syntax_analysis', 'assemble', 'lower', 'interpret', 'jit')
+UNITS:dict = {
+    'lexical_analysis': 'tokens',
+    'syntax_analysis': 'nodes',
+    'assemble': 'statements',
+    'lower': 'statements',
+    'interpret': 'statements',
+    'jit': 'statements',
+}
+
+
+def workloads(scale:float=1.0) -> dict:
+    '''workloads["name"] = (source, input) of every benchmark program, sizes multiplied by scale'''
+    def n(count:int) -> int:
+        return max(int(count * scale), 1)
+    def program(name:str) -> str:
+        with open(PROGRAM_DIRECTORY / f'{name}.ty', 'r') as f:
+            return f.read()
+    bank_input = ''.join(f'2\n{100 * k + 7}\n1\n3\n{k}\n' for k in range(n(100))) + '4\n'
+    quadratic_input = f'{n(100)}\n' + ''.join(f'{1 + k % 3}\n{-(k % 17) - 3}\n{k % 5}\n' for k in range(n(100)))
+    return {
+        # synthetic programs, each scaling one dimension
+        'synthetic-lines': (generate(lines=n(2000), depth=2, nesting=1, trip_count=1, name='lines'), ''),
+        'synthetic-depth': (generate(lines=n(100), depth=7, nesting=1, trip_count=1, name='depth'), ''),
+        'synthetic-nesting': (generate(lines=n(300), depth=2, nesting=4, trip_count=5, name='nesting'), ''),
+        'synthetic-loops': (generate(lines=40, depth=2, nesting=1, trip_count=n(500), name='loops'), ''),
+        # realistic programs, from test_programs/ and the README
+        'hello': (program('hello'), ''),
+        'fibonacci': (program('fibonacci'), f'{n(20)}\n'),
+        'bank': (program('bank'), bank_input),
+        'quadratic': (program('quadratic'), quadratic_input),
+        'primes': (program('primes'), f'{n(1000)}\n'),
+        'collatz': (program('collatz'), f'{n(50)}\n'),
+        'checksum': (program('checksum'), f'{n(2000)}\n'),
+        'orbit': (program('orbit'), f'{n(500)}\n'),
+    }
+
+
+class Workload(object):
+    '''One program with every intermediate result of the pipeline, so each stage can be run on its own'''
+    def __init__(self, name:str, source:str, input_text:str, cache_directory:str):
+        self.name:str = name
+        self.source:str = source
+        self.input_text:str = input_text
+        self.tokens:list = tc.Parser.lexical_analysis(source)
+        self.tree = tc.Parser.syntax_analysis(self.tokens)
+        self.program:tc.Program = tc.Assembler.assemble(self.tree)
+        self.jit:tc.JIT = tc.JIT(cache_directory=cache_directory) # shared by every run, so runs after the first are warm
+        self.output:str = self.execute(None)
+        self.check(self.execute(self.jit)) # compiles the hot loops
+        executed = self.executed_statements()
+        self.items:dict = {
+            'lexical_analysis': len(self.tokens),
+            'syntax_analysis': self.tree.size(),
+            'assemble': self.statements(),
+            'lower': self.statements(),
+            'interpret': executed,
+            'jit': executed,
+        }
+
+    def statements(self) -> int:
+        '''Source lines that emitted instructions'''
+        return len(set(self.program.line_numbers))
+
+    def executed_statements(self) -> int:
+        '''Statements executed by one run, counted once by the profiler'''
+        interpreter = tc.Interpreter()
+        interpreter.profiler = tc.Profiler()
+        interpreter.output_sink = tc.NullSink()
+        interpreter.input_stream = io.StringIO(self.input_text)
+        interpreter.execute(self.program)
+        counts, line_numbers = interpreter.profiler.program(self.program).counts, self.program.line_numbers
+        return sum(counts[ip] for ip in range(len(counts)) if ip == 0 or line_numbers[ip] != line_numbers[ip-1])
+
+    def execute(self, jit) -> str:
+        interpreter = tc.Interpreter(jit=jit)
+        interpreter.output_sink = tc.CaptureSink()
+        interpreter.input_stream = io.StringIO(self.input_text)
+        interpreter.execute(self.program)
+        return interpreter.output_sink.getvalue()
+
+    def stage(self, stage:str):
+        '''A function running one stage'''
+        if stage == 'lexical_analysis': return lambda: tc.Parser.lexical_analysis(self.source)
+        if stage == 'syntax_analysis': return lambda: tc.Parser.syntax_analysis(self.tokens)
+        if stage == 'assemble': return lambda: tc.Assembler.assemble(self.tree)
+        if stage == 'lower': return lambda: tc.Lowerer.lower_program(self.program)
+        if stage == 'interpret': return lambda: self.check(self.execute(None))
+        if stage == 'jit': return lambda: self.check(self.execute(self.jit))
+        raise ValueError(f'Unknown stage {stage}')
+
+    def check(self, output:str):
+        if output != self.output:
+            raise AssertionError(f'{self.name} printed {output!r}, expected {self.output!r}')
+
+
+def measure(run, repeat:int) -> tuple:
+    '''(seconds per run in the fastest of repeat samples, peak memory in bytes of a separate traced run).
+    Samples run with the garbage collector disabled, like timeit'''
+    seconds = float('inf')
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            runs, start = 0, time.perf_counter()
+            while True:
+                run()
+                runs += 1
+                elapsed = time.perf_counter() - start
+                if elapsed >= MIN_SAMPLE_TIME:
+                    break
+            seconds = min(seconds, elapsed / runs)
+    finally:
+        gc.enable()
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        run()
+        peak = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def run_suite(names:list, stages:list, repeat:int=3, scale:float=1.0) -> dict:
+    '''
+    Benchmark the stages of the named workloads
+    @Returns
+        dict    {"version", "python", "machine", "scale", "repeat", "results": {workload: {stage: {"seconds",
+                "items", "unit", "rate" (items per second), "peak_memory" (bytes)}}}}, the format of baselines
+    '''
+    available = workloads(scale)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in names:
+            workload = Workload(name, *available[name], directory)
+            results[name] = {}
+            for stage in stages:
+                if stage == 'jit' and not workload.jit.enabled:
+                    continue
+                seconds, peak = measure(workload.stage(stage), repeat)
+                results[name][stage] = {'seconds': seconds, 'items': workload.items[stage], 'unit': UNITS[stage],
+                                        'rate': workload.items[stage] / seconds, 'peak_memory': peak}
+    return {'version': SUITE_FORMAT_VERSION, 'python': platform.python_version(), 'machine': platform.machine(),
+            'scale': scale, 'repeat': repeat, 'results': results}
+
+
+def compare(results:dict, baseline:dict, tolerance:float=TOLERANCE) -> list:
+    '''[(workload, stage, message)] of every rate or peak memory that regressed against the baseline'''
+    regressions = []
+    for name, stages in results['results'].items():
+        for stage, result in stages.items():
+            old = baseline.get('results', {}).get(name, {}).get(stage)
+            if old is None:
+                continue
+            if result['rate'] < old['rate'] * (1 - tolerance):
+                regressions.append((name, stage, f'{result["rate"] / old["rate"]:.2f}x the baseline rate'))
+            if result['peak_memory'] > old['peak_memory'] * (1 + tolerance) + 65536:
+                regressions.append((name, stage, f'peak memory {result["peak_memory"]} bytes, baseline {old["peak_memory"]}'))
+    return regressions
+
+
+def format_rate(rate:float) -> str:
+    for factor, prefix in ((1e6, 'M'), (1e3, 'k')):
+        if rate >= factor:
+            return f'{rate / factor:.2f}{prefix}'
+    return f'{rate:.1f}'
+
+
+def report(results:dict, baseline:dict=None) -> str:
+    '''The results as a table, with the rate relative to the baseline if one is given'''
+    out = [f'{"workload":<18} {"stage":<17} {"time (ms)":>10} {"rate":>18} {"peak (KiB)":>11} {"vs baseline":>12}']
+    for name, stages in results['results'].items():
+        for stage, r in stages.items():
+            old = (baseline or {}).get('results', {}).get(name, {}).get(stage)
+            relative = f'{r["rate"] / old["rate"]:.2f}x' if old else '-'
+            rate = f'{format_rate(r["rate"])} {r["unit"]}/s'
+            out.append(f'{name:<18} {stage:<17} {r["seconds"] * 1e3:>10.2f} {rate:>18} {r["peak_memory"] / 1024:>11.1f} {relative:>12}')
+    return '\n'.join(out)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the lexer, parser, assembler, lowerer and execution engines')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs of every stage, the fastest one counts')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply the size of every workload')
+    parser.add_argument('--only', nargs='+', metavar='NAME', choices=list(workloads()), help='workloads to run')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES), help='stages to run')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help=f'results to compare with, if the file exists (default: {BASELINE_PATH.name})')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='relative change that counts as a regression')
+    parser.add_argument('--save', metavar='PATH', help='write the results as JSON, e.g. as the new baseline')
+    args = parser.parse_args()
+    baseline = None
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get('version') != SUITE_FORMAT_VERSION:
+            print(f'{args.baseline} is of another format version, not comparing', file=sys.stderr)
+            baseline = None
+    results = run_suite(args.only or list(workloads()), args.stages, args.repeat, args.scale)
+    print(report(results, baseline))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=1)
+    if baseline is None:
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    for name, stage, message in regressions:
+        print(f'REGRESSION {name} {stage}: {message}', file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
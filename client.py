@@ -0,0 +1,34 @@
+'''Thin client of the resident interpreter daemon (python main.py --serve).
+Accepts the same arguments as main.py: interpreting is forwarded to the daemon, everything else runs main.py'''
+import os
+import sys
+import pathlib
+
+from tython_compiler.cli import build_argument_parser
+from tython_compiler.protocol import request
+
+def main() -> int:
+    parser = build_argument_parser()
+    args = parser.parse_args()
+    if args.compile or args.batch or args.serve or not args.interpret or args.debug or args.lanes or args.profile is not None or args.pgo or args.metrics or args.fast_math or args.hash_cons or args.memory_report or args.map_array \
+            or args.max_instructions is not None or args.max_seconds is not None or args.max_array_bytes is not None:
+        main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+        os.execv(sys.executable, [sys.executable, main_path, *sys.argv[1:]])
+    if args.input_file is None:
+        parser.error('the following arguments are required: input_file')
+
+    message = {
+        'program': str(pathlib.Path(args.input_file).resolve()),
+        'no_jit': args.no_jit,
+        'state': str(pathlib.Path(args.state).resolve()) if args.state else None,
+        'catalog': str(pathlib.Path(args.catalog).resolve()) if args.catalog else None,
+    }
+    response = request(message, args.socket)
+    sys.stdout.write(response.get('output', ''))
+    if response['status'] != 'ok':
+        sys.stderr.write(response.get('error', 'unknown error') + '\n')
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,30 +1,108 @@
+import sys
+import json
 import pathlib
-import logging
+import contextlib
 import argparse
 import tython_compiler as tc
+from tython_compiler.cli import build_argument_parser
 
-VERSION:tuple = (-1, 1, 0)
+def make_linker(filepath:pathlib.Path, index_path:str=None) -> tc.Linker:
+    '''Linker searching the directory of the program, through a persistent catalog if an index is given'''
+    if index_path is None:
+        return tc.Linker([filepath.parent])
+    catalog = tc.Catalog(filepath.parent, index_path)
+    catalog.update()
+    catalog.save()
+    return tc.Linker([filepath.parent], catalog)
 
-def main() -> None:
-    logger:logging.Logger = logging.getLogger()
+def make_quotas(args:argparse.Namespace) -> tc.Quotas:
+    '''The limits given with --max-instructions, --max-seconds and --max-array-bytes, None without any'''
+    if args.max_instructions is None and args.max_seconds is None and args.max_array_bytes is None:
+        return None
+    return tc.Quotas(args.max_instructions, args.max_seconds, args.max_array_bytes)
+
+def report_memory(args:argparse.Namespace, tokens:list=None, tree:tc.Node=None, program:tc.Program=None, interpreter:tc.Interpreter=None):
+    '''Print the memory report asked for with --memory-report to standard error'''
+    report = tc.MemoryReport()
+    name = pathlib.Path(args.input_file).name
+    if tokens is not None: report.add_tokens(tokens, name)
+    if tree is not None: report.add_tree(tree, name)
+    if interpreter is not None: report.add_interpreter(interpreter)
+    elif program is not None: report.add_program(program)
+    print(json.dumps(report.to_dict()) if args.memory_report == 'json' else report.report(), file=sys.stderr)
+
+def parse_array_mapping(spec:str) -> tuple:
+    '''("@A", "FILE") of a --map-array argument'''
+    a_var, separator, path = spec.partition('=')
+    if not separator or not a_var.startswith('@') or not path:
+        raise SyntaxError(f"Expected @A=FILE, got {spec!r}")
+    return a_var.upper(), path
+
+def interpret(filepath:pathlib.Path, program, args:argparse.Namespace, tokens:list=None, tree:tc.Node=None):
+    '''Interpret a parsed tree or assembled program, reporting its profile and memory afterwards if asked to'''
+    interpreter = tc.Interpreter(jit=None if args.no_jit else tc.JIT(), linker=make_linker(filepath, args.catalog),
+                                 snapshot_path=args.state)
+    interpreter.quotas = make_quotas(args)
+    mapped = [interpreter.map_array(a_var, path, program.type_map.get(a_var)) for a_var, path in map(parse_array_mapping, args.map_array)]
+    try:
+        run_interpreter(interpreter, filepath, program, args)
+    finally:
+        if args.memory_report is not None:
+            report_memory(args, tokens, tree, interpreter=interpreter)
+        for a in mapped:
+            a.close()
+
+def run_interpreter(interpreter:tc.Interpreter, filepath:pathlib.Path, program, args:argparse.Namespace):
+    '''Run the program, with the profiler if --profile is given'''
+    if args.profile is None:
+        interpreter.interpret(program)
+        return
+    interpreter.profiler = tc.Profiler()
+    try:
+        interpreter.interpret(program)
+    finally:
+        profile_path = filepath.with_suffix('.profile.json') if args.profile is True else pathlib.Path(args.profile)
+        interpreter.profiler.dump(profile_path)
+        print(interpreter.profiler.report(), file=sys.stderr)
+        print(f'Profile written to {profile_path}', file=sys.stderr)
+
+def optimize(program:tc.Program, args:argparse.Namespace) -> tc.Program:
+    '''Apply the profile given with --pgo, if any'''
+    if args.pgo is None:
+        return program
+    optimized = tc.Optimizer.optimize(program, tc.Profiler.load(args.pgo))
+    if optimized is program:
+        print(f'{args.pgo} was not recorded for this version of "{program.name}", ignoring it', file=sys.stderr)
+    return optimized
 
+def main() -> None:
     # Argument Parser
-    parser = argparse.ArgumentParser(description=f'TYTHON Compiler {VERSION}')
-    parser.add_argument('input_file')
-    parser.add_argument('-o', '--output')
-    parser.add_argument('-c', '--compile', action='store_true', default=False)
-    parser.add_argument('-i', '--interpret', action='store_true', default=False)
-
-    parser.add_argument('--debug', action='store_true', default=False)
-    parser.add_argument('-v', '--version', action='version',
-                        version=f'Tython {VERSION[-1]}.{VERSION[1]}.{VERSION[2]}')
+    parser = build_argument_parser()
     args = parser.parse_args()
+    if args.metrics is None:
+        run(parser, args)
+        return
+
+    # Metrics of every phase, printed even if the program fails
+    with tc.Metrics() as metrics:
+        try:
+            run(parser, args)
+        finally:
+            print(json.dumps(metrics.to_dict()) if args.metrics == 'json' else metrics.report(), file=sys.stderr)
+
+def run(parser:argparse.ArgumentParser, args:argparse.Namespace) -> None:
+    # Resident daemon, programs are sent to it by client.py
+    if args.serve:
+        tc.serve(args.socket)
+        return
+    if args.input_file is None:
+        parser.error('the following arguments are required: input_file')
     filepath:pathlib.Path = pathlib.Path(args.input_file)
 
     # Configure Debug setting
     DEBUG = args.debug
-    if DEBUG: print(f'{args.debug=}')
-    if DEBUG: tc.set_debug()
+    if DEBUG: tc.init(debug=True)
+    if DEBUG: tc.output.debug(f'{args.debug=}')
     
     # Configure compilation setting
     if args.compile and args.interpret:
@@ -36,18 +114,57 @@ def main() -> None:
     if args.interpret:
         COMPILE = False
 
+    # Batch mode, one JSON line per finished job
+    if args.batch:
+        with open(args.output, 'w') if args.output else contextlib.nullcontext(sys.stdout) as f:
+            for result in tc.run_batch(filepath, processes=args.jobs, jit=not args.no_jit, quotas=make_quotas(args)):
+                f.write(json.dumps(result) + '\n')
+                f.flush()
+        return
+
+    # Data-parallel run over the rows of an input matrix, one JSON line per lane
+    if args.lanes:
+        import numpy as np
+        program = tc.Linker.compile(filepath)
+        result = tc.LaneInterpreter().run(program, np.loadtxt(args.lanes, ndmin=2))
+        with open(args.output, 'w') if args.output else contextlib.nullcontext(sys.stdout) as f:
+            for lane in range(result.lanes):
+                error = result.errors[lane]
+                f.write(json.dumps({'lane': lane, 'status': 'ok' if error is None else 'error',
+                                    **({} if error is None else {'error': f'{type(error).__name__}: {error}'}),
+                                    'output': ''.join(line + '\n' for line in result.outputs[lane])}) + '\n')
+        return
+
+    # Program images are already assembled, skip lexing and parsing entirely
+    if filepath.suffix == tc.IMAGE_SUFFIX:
+        if COMPILE:
+            raise SyntaxError(f"{filepath} is already compiled, run it with -i")
+        interpret(filepath, optimize(tc.ProgramImage.load(filepath), args), args)
+        return
+
     # Retrive file contents
     with open(filepath, 'r') as f:
         file_contents = f.read()
 
     # Initialize lexer
     tokens = tc.Parser.lexical_analysis(file_contents)
-    tree = tc.Parser.syntax_analysis(tokens)
+    tree = tc.Parser.syntax_analysis(tokens, tc.NodeTable() if args.hash_cons else None)
+    program = optimize(tc.Assembler.assemble(tree, fast_math=args.fast_math), args)
 
     if COMPILE:
-        raise NotImplementedError("Compilation not yet implemented!")
+        output_path:pathlib.Path = pathlib.Path(args.output) if args.output else filepath.with_suffix('')
+        if output_path == filepath:
+            output_path = filepath.with_suffix('.out')
+        if output_path.suffix == tc.IMAGE_SUFFIX:
+            tc.ProgramImage.dump(program, output_path)
+        elif output_path.suffix == '.c':
+            tc.Lowerer.write_to_file(output_path, tc.Lowerer.lower_program(program))
+        else:
+            tc.Lowerer.build_executable(tc.Lowerer.lower_program(program), output_path)
+        if args.memory_report is not None:
+            report_memory(args, tokens, tree, program)
     elif not COMPILE:
-        tc.Interpreter.interpret(tree)
+        interpret(filepath, program, args, tokens, tree)
 
 if __name__ == '__main__':
     main()
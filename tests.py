@@ -1,5 +1,13 @@
 import tython_compiler as tc
 import time
+import io
+import os
+import json
+import threading
+import subprocess
+import tempfile
+import asyncio
+import array
 
 IOTA = 1
 class TestCaseError(Exception):
@@ -72,6 +80,1099 @@ def test_case_3():
     tree = parser.syntax_analysis(tokens)
     print(tree)
 
+@test_case
+def test_case_4():
+    '''Test compilation to a native executable'''
+    program = '''
+    PROGRAM "test 4"
+    INT32 @I
+    20 -> DIM(@I)
+    1 -> @I[0]
+    1 -> @I[1]
+    2 -> I
+    lbl A
+    @I[I - 1] + @I[I - 2] -> @I[I]
+    I + 1 -> I
+    if I < DIM(@I)
+    goto A
+    disp @I[19]
+    1 + 2 * 3 -> X
+    disp X / 4
+    disp 7 / 2
+    disp "Done"
+    '''
+    tokens = tc.Parser.lexical_analysis(program)
+    tree = tc.Parser.syntax_analysis(tokens)
+    c_source = tc.Lowerer.lower(tree)
+    with tempfile.TemporaryDirectory() as directory:
+        executable = os.path.join(directory, 'test_4')
+        tc.Lowerer.build_executable(c_source, executable)
+        output = subprocess.run([executable], capture_output=True, text=True).stdout
+    print(output)
+    if output.split() != ['6765', '1.75', '3', 'Done']:
+        raise TestCaseError(f"Unexpected output {output!r}")
+    # signed overflow wraps around in native code like in the interpreter, and INT_MIN / -1 does not trap
+    overflow = '''PROGRAM "overflow"
+    INT64 K
+    2147483647 -> I
+    if I + 1 > I
+    disp "greater"
+    disp I + 1
+    0 - 2147483647 - 1 -> I
+    0 - 1 -> J
+    disp I / J
+    disp I * J
+    0 - 9223372036854775807 - 1 -> K
+    disp K / J
+    '''
+    program = tc.Assembler.compile(overflow)
+    interpreter = tc.Interpreter()
+    interpreter.output_sink = tc.CaptureSink()
+    interpreter.execute(program)
+    with tempfile.TemporaryDirectory() as directory:
+        executable = os.path.join(directory, 'overflow')
+        tc.Lowerer.build_executable(tc.Lowerer.lower_program(program), executable)
+        result = subprocess.run([executable], capture_output=True, text=True)
+    if result.returncode != 0 or result.stdout.split() != interpreter.output_sink.lines:
+        raise TestCaseError(f"Native code printed {result.stdout!r} ({result.returncode}), the interpreter {interpreter.output_sink.lines}")
+
+@test_case
+def test_case_5():
+    '''Test that hot loops compiled by the JIT agree with the interpreter'''
+    program = '''
+    PROGRAM "test 5"
+    REAL64 X
+    0 -> I
+    0 -> X
+    lbl A
+    I + 1 -> I
+    X + I / 2 -> X
+    if I < 1000
+    goto A
+    disp X
+    '''
+    tokens = tc.Parser.lexical_analysis(program)
+    tree = tc.Parser.syntax_analysis(tokens)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for jit in (None, tc.JIT(threshold=10, cache_directory=directory)):
+            interpreter = tc.Interpreter(jit=jit)
+            interpreter.clear_variables()
+            interpreter.interpret(tree)
+            results.append((interpreter.variables['I'].data.value, interpreter.variables['X'].data.value))
+        if jit.enabled and not os.listdir(directory):
+            raise TestCaseError("No native region was compiled")
+    if results[0] != results[1] or results[0] != (1000, 250000.0):
+        raise TestCaseError(f"Unexpected results {results}")
+    # a compiled loop wraps around on overflow and divides the minimum by -1 like the interpreter
+    overflow = tc.Assembler.compile('''PROGRAM "test 5 overflow"
+    2147483547 -> I
+    0 - 1 -> J
+    0 -> N
+    0 -> M
+    lbl A
+    I + 1 -> I
+    if I + 1 < I
+    N + 1 -> N
+    I / J + M -> M
+    if I != 0 - 2147483547
+    goto A
+    ''')
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for jit in (None, tc.JIT(threshold=10, cache_directory=directory)):
+            interpreter = tc.Interpreter(jit=jit)
+            interpreter.execute(overflow)
+            results.append(tuple(interpreter.get_variable(var) for var in 'INM'))
+    if results[0] != results[1] or results[0][1] != 1:
+        raise TestCaseError(f"A compiled loop overflowed to {results[1]}, the interpreter to {results[0]}")
+
+@test_case
+def test_case_6():
+    '''Test that a program survives a round trip through a .tyb image'''
+    program = '''
+    PROGRAM "test 6"
+    VERSION 1 2 3
+    REAL64 X
+    INT32 @A
+    3 -> DIM(@A)
+    0 -> I
+    lbl A
+    I * I -> @A[I]
+    I + 1 -> I
+    if I < DIM(@A)
+    goto A
+    @A[2] / 4.0 -> X
+    disp "X is"
+    disp X
+    '''
+    tokens = tc.Parser.lexical_analysis(program)
+    assembled = tc.Assembler.assemble(tc.Parser.syntax_analysis(tokens))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'test_6' + tc.IMAGE_SUFFIX)
+        tc.ProgramImage.dump(assembled, path)
+        loaded = tc.ProgramImage.load(path)
+        for field in ('name', 'version', 'constants', 'constant_types', 'variables', 'array_variables', 'type_map', 'labels', 'label_table'):
+            if getattr(loaded, field) != getattr(assembled, field):
+                raise TestCaseError(f"{field} differs: {getattr(loaded, field)} != {getattr(assembled, field)}")
+        for field in ('opcodes', 'operands', 'line_numbers'):
+            if list(getattr(loaded, field)) != list(getattr(assembled, field)):
+                raise TestCaseError(f"{field} differs")
+        interpreter = tc.Interpreter()
+        interpreter.clear_variables()
+        interpreter.interpret(loaded)
+        del loaded # release the mapping before the directory is removed
+    if interpreter.variables['X'].data.value != 1.0:
+        raise TestCaseError(f"Unexpected X {interpreter.variables['X']}")
+
+@test_case
+def test_case_7():
+    '''Test CALL through the linker, including state persisting across programs and circular CALLs'''
+    programs = {
+        'main.ty': '''
+        PROGRAM "main"
+        0 -> I
+        0 -> N
+        lbl A
+        call "square"
+        N + Q -> N
+        I + 1 -> I
+        if I < 10
+        goto A
+        ''',
+        'helper.ty': '''
+        PROGRAM "square"
+        I * I -> Q
+        ''',
+        'loop_a.ty': '''
+        PROGRAM "loop_a"
+        call "loop_b"
+        ''',
+        'loop_b.ty': '''
+        PROGRAM "loop_b"
+        call "loop_a"
+        ''',
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for filename, program in programs.items():
+            with open(os.path.join(directory, filename), 'w') as f:
+                f.write(program)
+        linker = tc.Linker([directory])
+        interpreter = tc.Interpreter(linker=linker)
+        interpreter.clear_variables()
+        interpreter.interpret(linker.load('main'))
+        if interpreter.variables['N'].data.value != 285:
+            raise TestCaseError(f"Unexpected N {interpreter.variables['N']}")
+        if set(linker.modules) != {'main', 'square'}:
+            raise TestCaseError(f"Unexpected modules {linker.modules.keys()}")
+        try:
+            interpreter.interpret(linker.load('loop_a'))
+        except tc.error.LinkingError as e:
+            print(e)
+        else:
+            raise TestCaseError("Circular CALL was not rejected")
+
+@test_case
+def test_case_8():
+    '''Test the program catalog and its incremental updates'''
+    with tempfile.TemporaryDirectory() as directory:
+        os.makedirs(os.path.join(directory, 'helpers'))
+        with open(os.path.join(directory, 'main.ty'), 'w') as f:
+            f.write('# Entry point\nPROGRAM "main"\nVERSION 1 2 3\ncall "square"\nif 1 == 1\ncall "cube"\n')
+        with open(os.path.join(directory, 'helpers', 'sq.ty'), 'w') as f:
+            f.write('program "square"\nI * I -> Q\n')
+        index_path = os.path.join(directory, 'catalog.json')
+        catalog = tc.Catalog(directory, index_path)
+        if catalog.update() != 2:
+            raise TestCaseError("Expected both files to be read")
+        catalog.save()
+        main = catalog.lookup('main')
+        if main.version != (1, 2, 3) or main.calls != ['square', 'cube']:
+            raise TestCaseError(f"Unexpected entry {main.to_dict()}")
+        if catalog.lookup('square').path != os.path.join(directory, 'helpers', 'sq.ty'):
+            raise TestCaseError(f"Unexpected entry {catalog.lookup('square')}")
+        catalog = tc.Catalog(directory, index_path)
+        if catalog.update() != 0:
+            raise TestCaseError("Unchanged files were read again")
+        with open(os.path.join(directory, 'helpers', 'sq.ty'), 'a') as f:
+            f.write('I * Q -> C\n')
+        if catalog.update() != 1 or catalog.lookup('square') is None:
+            raise TestCaseError("Changed file was not read again")
+
+@test_case
+def test_case_9():
+    '''Test that variables persist across interpreters through a state snapshot'''
+    program = '''
+    PROGRAM "test 9"
+    REAL64 X
+    INT64 @B
+    if DIM(@B) == 0
+    1000 -> DIM(@B)
+    N + 1 -> N
+    X + 0.5 -> X
+    N * 3000000000 -> @B[N]
+    '''
+    tokens = tc.Parser.lexical_analysis(program)
+    tree = tc.Parser.syntax_analysis(tokens)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'state' + tc.SNAPSHOT_SUFFIX)
+        for run in range(3):
+            interpreter = tc.Interpreter(snapshot_path=path)
+            if run == 0:
+                interpreter.clear_variables()
+            interpreter.interpret(tree)
+        variables, array_variables, type_map = tc.Snapshot.load(path)
+    if variables['N'].data.value != 3 or variables['X'].data.value != 1.5:
+        raise TestCaseError(f"Unexpected variables {variables}")
+    if array_variables['@B'].dim != 1000 or array_variables['@B'].buffer[3] != 9000000000:
+        raise TestCaseError(f"Unexpected array {array_variables['@B']}")
+    if type_map != {'@B': tc.datatypes.Datatypes.INT64, 'N': tc.datatypes.Datatypes.INT32, 'X': tc.datatypes.Datatypes.REAL64}:
+        raise TestCaseError(f"Unexpected type map {type_map}")
+
+@test_case
+def test_case_10():
+    '''Test the batch runner with PROMPT input scripts'''
+    program = '''
+    PROGRAM "test 10"
+    REAL64 X
+    PROMPT N
+    PROMPT X
+    disp X * N
+    '''
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, 'scale.ty'), 'w') as f:
+            f.write(program)
+        inputs = ['3\n2.5\n', '4\n0.25\n', '1\n']
+        with open(os.path.join(directory, 'jobs.jsonl'), 'w') as manifest:
+            for k, text in enumerate(inputs):
+                with open(os.path.join(directory, f'{k}.in'), 'w') as f:
+                    f.write(text)
+                manifest.write(json.dumps({'program': 'scale.ty', 'input': f'{k}.in'}) + '\n')
+            # an empty program fails to assemble, which must not cost the other jobs their results
+            open(os.path.join(directory, 'empty.ty'), 'w').close()
+            manifest.write(json.dumps({'program': 'empty.ty'}) + '\n')
+        for processes in (1, 2):
+            results = sorted(tc.run_batch(os.path.join(directory, 'jobs.jsonl'), processes=processes), key=lambda r: r['job'])
+            print(results)
+            if [r['status'] for r in results] != ['ok', 'ok', 'error', 'error'] or [r['output'] for r in results[:2]] != ['7.5\n', '1\n']:
+                raise TestCaseError(f"Unexpected results {results}")
+            if 'end of input' not in results[2]['error']:
+                raise TestCaseError(f"Unexpected error {results[2]['error']}")
+
+@test_case
+def test_case_11():
+    '''Test concurrent clients of the daemon, with isolated variables and shared state snapshots'''
+    program = '''
+    PROGRAM "test 11"
+    PROMPT N
+    N + T -> T
+    disp T
+    '''
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'sum.ty')
+        with open(path, 'w') as f:
+            f.write(program)
+        socket_path = os.path.join(directory, 'daemon.sock')
+        daemon = tc.Daemon(socket_path)
+        threading.Thread(target=daemon.serve_forever, daemon=True).start()
+        try:
+            responses = [None] * 8
+            def client(k):
+                responses[k] = tc.protocol.request({'program': path}, socket_path, io.StringIO(f'{k}\n'))
+            clients = [threading.Thread(target=client, args=(k,)) for k in range(8)]
+            for c in clients: c.start()
+            for c in clients: c.join()
+            if [r['output'] for r in responses] != [f'{k}\n' for k in range(8)]:
+                raise TestCaseError(f"Clients were not isolated {responses}")
+            state = os.path.join(directory, 'state' + tc.SNAPSHOT_SUFFIX)
+            for k in range(1, 4):
+                response = tc.protocol.request({'program': path, 'state': state}, socket_path, io.StringIO(f'{k}\n'))
+            if response['output'] != '6\n' or tc.Snapshot.load(state)[0]['T'].data.value != 6:
+                raise TestCaseError(f"State did not persist {response}")
+            # a run failing partway leaves the state as the last successful run saved it
+            failing = os.path.join(directory, 'fail.ty')
+            with open(failing, 'w') as f:
+                f.write('PROGRAM "fail"\n100 -> T\n0 -> J\n1 / J -> I\n')
+            response = tc.protocol.request({'program': failing, 'state': state}, socket_path, io.StringIO(''))
+            if response['status'] != 'error':
+                raise TestCaseError(f"Dividing by zero succeeded {response}")
+            response = tc.protocol.request({'program': path, 'state': state}, socket_path, io.StringIO('0\n'))
+            if response['output'] != '6\n':
+                raise TestCaseError(f"A failed run changed the shared state {response}")
+            # CALLed programs are as fresh as the program itself, whether edited or added since the last request
+            caller = os.path.join(directory, 'caller.ty')
+            with open(caller, 'w') as f:
+                f.write('PROGRAM "caller"\ncall "helper"\ncall "late"\n')
+            with open(os.path.join(directory, 'helper.ty'), 'w') as f:
+                f.write('PROGRAM "helper"\ndisp 1\n')
+            response = tc.protocol.request({'program': caller}, socket_path, io.StringIO(''))
+            if response['status'] != 'error' or 'late' not in response['error']:
+                raise TestCaseError(f"A missing program was found {response}")
+            with open(os.path.join(directory, 'helper.ty'), 'w') as f:
+                f.write('PROGRAM "helper"\ndisp 2\n')
+            os.utime(os.path.join(directory, 'helper.ty'), (0, 0)) # a different mtime, however coarse the clock
+            with open(os.path.join(directory, 'added_later.ty'), 'w') as f:
+                f.write('PROGRAM "late"\ndisp 3\n')
+            response = tc.protocol.request({'program': caller}, socket_path, io.StringIO(''))
+            if response['output'] != '2\n3\n':
+                raise TestCaseError(f"The daemon ran stale programs {response}")
+            # any exception raised while loading a program is an error response, not a dropped connection
+            empty = os.path.join(directory, 'empty.ty')
+            open(empty, 'w').close()
+            response = tc.protocol.request({'program': empty}, socket_path, io.StringIO(''))
+            if response['status'] != 'error':
+                raise TestCaseError(f"An empty program succeeded {response}")
+        finally:
+            daemon.shutdown()
+            daemon.server_close()
+
+@test_case
+def test_case_12():
+    '''Test that every lane of a data-parallel run matches scalar execution, including divergent loops and errors'''
+    if tc.lanes.np is None:
+        print("NumPy is not installed, skipping lanes")
+        return
+    program = '''
+    PROGRAM "test 12"
+    REAL32 X
+    INT32 @A
+    PROMPT N
+    PROMPT X
+    N -> DIM(@A)
+    0 -> I
+    lbl A
+    if I < N
+    I * I -> @A[I]
+    I + 1 -> I
+    if I < N
+    goto A
+    disp X / N
+    disp 7 / N
+    '''
+    inputs = [[3, 2.5], [-4, 0.25], [0, 1.5], [5, -7.75], [1, 3]]
+    assembled = tc.Assembler.assemble(tc.Parser.syntax_analysis(tc.Parser.lexical_analysis(program)))
+    result = tc.LaneInterpreter().run(assembled, inputs)
+    for lane, row in enumerate(inputs):
+        interpreter = tc.Interpreter()
+        interpreter.clear_variables()
+        interpreter.input_stream = io.StringIO(''.join(f'{v}\n' for v in row))
+        interpreter.output_stream = io.StringIO()
+        try:
+            interpreter.execute(assembled)
+            error = None
+        except tc.error.InterpreterError as e:
+            error = str(e)
+        print(lane, result.outputs[lane], result.errors[lane])
+        if result.outputs[lane] != interpreter.output_stream.getvalue().splitlines():
+            raise TestCaseError(f"Lane {lane} printed {result.outputs[lane]}, expected {interpreter.output_stream.getvalue()!r}")
+        if (None if result.errors[lane] is None else str(result.errors[lane])) != error:
+            raise TestCaseError(f"Lane {lane} failed with {result.errors[lane]}, expected {error}")
+        if error is None:
+            for var in assembled.variables:
+                if result.variables[var][lane].item() != interpreter.variables[var].data.value:
+                    raise TestCaseError(f"Lane {lane} has {var} = {result.variables[var][lane]}")
+            if list(result.array_variables['@A'][lane]) != list(interpreter.array_variables['@A'].buffer):
+                raise TestCaseError(f"Lane {lane} has @A = {result.array_variables['@A'][lane]}")
+    # integer lanes fail on REAL64 input they cannot read exactly, instead of casting it to garbage
+    assembled = tc.Assembler.assemble(tc.Parser.syntax_analysis(tc.Parser.lexical_analysis('PROGRAM "wide"\nINT64 N\nPROMPT N\ndisp N\n')))
+    result = tc.LaneInterpreter().run(assembled, [[float('nan')], [2.0**53 + 2], [-7.5]])
+    for lane, text in [(0, 'nan\n'), (2, '-7.5\n')]:
+        interpreter = tc.Interpreter()
+        interpreter.clear_variables()
+        interpreter.input_stream = io.StringIO(text)
+        interpreter.output_stream = io.StringIO()
+        try:
+            interpreter.execute(assembled)
+            error = None
+        except tc.error.InterpreterError as e:
+            error = str(e)
+        if (None if result.errors[lane] is None else str(result.errors[lane])) != error or result.outputs[lane] != interpreter.output_stream.getvalue().splitlines():
+            raise TestCaseError(f"Lane {lane} read {text!r} as {result.outputs[lane]} {result.errors[lane]}, expected {error}")
+    if result.errors[1] is None:
+        raise TestCaseError(f"An inexact INT64 input was accepted {result.outputs[1]}")
+    result = tc.LaneInterpreter().run(assembled, tc.lanes.np.array([[2**53 + 1], [2**63 - 1]], dtype=tc.lanes.np.int64))
+    if result.outputs != [[str(2**53 + 1)], [str(2**63 - 1)]]:
+        raise TestCaseError(f"Integer inputs were not read exactly {result.outputs}")
+
+@test_case
+def test_case_13():
+    '''Test that many asyncio sessions waiting on PROMPT multiplex on one event loop'''
+    program = '''
+    PROGRAM "test 13"
+    PROMPT N
+    0 -> I
+    lbl A
+    I + 1 -> I
+    T + N -> T
+    if I < 20
+    goto A
+    disp T
+    PROMPT N
+    disp T + N
+    '''
+    assembled = tc.Assembler.assemble(tc.Parser.syntax_analysis(tc.Parser.lexical_analysis(program)))
+    async def main(count):
+        inputs = [asyncio.Queue() for _ in range(count)]
+        outputs = [asyncio.Queue() for _ in range(count)]
+        sessions = [tc.Session(assembled, tc.sessions.QueueInput(i), tc.sessions.QueueOutput(o), timeslice=5) for i, o in zip(inputs, outputs)]
+        tasks = [asyncio.create_task(s.run()) for s in sessions]
+        await asyncio.sleep(0)
+        for k in reversed(range(count)): # every session is now suspended in its first PROMPT
+            await inputs[k].put(f'{k}\n')
+        firsts = [await o.get() for o in outputs]
+        for k in range(count):
+            await inputs[k].put('1\n' if k else None)
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        seconds = [await o.get() for o in outputs[1:]]
+        return firsts, seconds, results
+    firsts, seconds, results = asyncio.run(main(1000))
+    if firsts != [f'{k * 20}\n' for k in range(1000)] or seconds != [f'{k * 20 + 1}\n' for k in range(1, 1000)]:
+        raise TestCaseError(f"Sessions were not isolated {firsts[:4]} {seconds[:4]}")
+    if not isinstance(results[0], tc.error.InterpreterError) or any(results[1:]):
+        raise TestCaseError(f"Unexpected results {results[:4]}")
+    # a session compiling a hot loop keeps interpreting it, the compile does not hold up the other sessions
+    hot = tc.Assembler.assemble(tc.Parser.syntax_analysis(tc.Parser.lexical_analysis(
+        'PROGRAM "hot"\n0 -> I\nlbl A\nI + 1 -> I\nif I < 100000\ngoto A\ndisp I\n')))
+    compiled = []
+    class SlowJIT(tc.JIT):
+        def compile_region(self, program, label_ip):
+            time.sleep(0.5)
+            compiled.append(super().compile_region(program, label_ip))
+            return compiled[-1]
+    async def race(jit):
+        outputs = [asyncio.Queue(), asyncio.Queue()]
+        sessions = [tc.Session(hot, tc.sessions.QueueInput(asyncio.Queue()), tc.sessions.QueueOutput(outputs[0]), jit, timeslice=5),
+                    tc.Session(assembled, tc.sessions.QueueInput(asyncio.Queue()), tc.sessions.QueueOutput(outputs[1]), timeslice=5)]
+        await sessions[1].input_stream.queue.put('3\n')
+        await sessions[1].input_stream.queue.put('1\n')
+        tasks = [asyncio.create_task(s.run()) for s in sessions]
+        await tasks[1]
+        finished_during_compile = not compiled
+        await tasks[0]
+        return finished_during_compile, await outputs[0].get(), [await outputs[1].get(), await outputs[1].get()]
+    with tempfile.TemporaryDirectory() as directory:
+        jit = SlowJIT(threshold=10, cache_directory=directory)
+        if jit.enabled:
+            finished_during_compile, hot_output, outputs = asyncio.run(race(jit))
+            if not finished_during_compile or outputs != ['60\n', '61\n']:
+                raise TestCaseError(f"A session waited for another session's compile {outputs}")
+            if hot_output != '100000\n' or compiled[0] is None:
+                raise TestCaseError(f"The hot loop printed {hot_output!r} and compiled to {compiled}")
+
+@test_case
+def test_case_14():
+    '''Test that interpreters on parallel threads sharing a JIT and a linker keep their own state'''
+    program = '''
+    PROGRAM "test 14"
+    PROMPT K
+    0 -> I
+    0 -> T
+    lbl A
+    I + 1 -> I
+    T + 100 / (K - I) -> T
+    if I < 200
+    goto A
+    disp T
+    '''
+    count = 16
+    results = [None] * count
+    with tempfile.TemporaryDirectory() as directory:
+        jit = tc.JIT(threshold=10, cache_directory=directory)
+        linker = tc.Linker([directory])
+        barrier = threading.Barrier(count)
+        def run(k):
+            # even threads divide by zero inside the compiled loop, odd ones never do
+            assembled = tc.Assembler.assemble(tc.Parser.syntax_analysis(tc.Parser.lexical_analysis(program)))
+            interpreter = tc.Interpreter(jit=jit, linker=linker)
+            interpreter.input_stream = io.StringIO(f'{k * 10 + 10 if k % 2 == 0 else 1000 + k}\n')
+            interpreter.output_stream = io.StringIO()
+            barrier.wait()
+            try:
+                interpreter.execute(assembled)
+                results[k] = (interpreter.variables['I'].data.value, interpreter.output_stream.getvalue())
+            except tc.error.InterpreterError as e:
+                results[k] = (interpreter.variables['I'].data.value, str(e))
+        threads = [threading.Thread(target=run, args=(k,)) for k in range(count)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+    for k, (i, text) in enumerate(results):
+        if k % 2 == 0 and (i != k * 10 + 10 or text != 'integer division by zero (line 8)'):
+            raise TestCaseError(f"Thread {k} ended with {results[k]}")
+        if k % 2 == 1 and (i != 200 or text != f'{sum(100 // (1000 + k - i) for i in range(1, 201))}\n'):
+            raise TestCaseError(f"Thread {k} ended with {results[k]}")
+    if tc.Interpreter().variables:
+        raise TestCaseError("Interpreters share variables")
+
+@test_case
+def test_case_15():
+    '''Test that DISP output is buffered into few writes, flushed before PROMPT, and can be captured or discarded'''
+    program = '''
+    PROGRAM "test 15"
+    0 -> I
+    lbl A
+    I + 1 -> I
+    disp I
+    if I < 100
+    goto A
+    PROMPT N
+    disp N
+    '''
+    assembled = tc.Assembler.assemble(tc.Parser.syntax_analysis(tc.Parser.lexical_analysis(program)))
+    class CountingStream(io.StringIO):
+        writes = 0
+        def write(self, text):
+            self.writes += 1
+            return super().write(text)
+    output = CountingStream()
+    class CheckedInput(io.StringIO):
+        def readline(self):
+            if output.getvalue() != ''.join(f'{k}\n' for k in range(1, 101)):
+                raise TestCaseError("Output was not flushed before PROMPT")
+            return super().readline()
+    interpreter = tc.Interpreter()
+    interpreter.output_sink = tc.BufferedSink(output, buffer_lines=64, flush_interval=None)
+    interpreter.input_stream = CheckedInput('7\n')
+    interpreter.execute(assembled)
+    if output.writes != 3 or not output.getvalue().endswith('100\n7\n'):
+        raise TestCaseError(f"Unexpected output in {output.writes} writes")
+    capture = tc.CaptureSink()
+    for sink in (capture, tc.NullSink()):
+        interpreter = tc.Interpreter()
+        interpreter.output_sink = sink
+        interpreter.input_stream = io.StringIO('8\n')
+        interpreter.execute(assembled)
+    if capture.lines != [str(k) for k in range(1, 101)] + ['8']:
+        raise TestCaseError(f"Unexpected capture {capture.lines[-3:]}")
+    # a line written before a long loop comes out while the loop runs, interpreted or native
+    class LoopStream(io.StringIO):
+        def write(self, text):
+            self.counters = getattr(self, 'counters', []) + [interpreter.get_variable('I')]
+            return super().write(text)
+    with tempfile.TemporaryDirectory() as directory:
+        for jit, n in ((None, 30000), (tc.JIT(threshold=10, cache_directory=directory), 100000000)):
+            looping = tc.Assembler.compile(f'PROGRAM "loop"\ndisp 1\n0 -> I\nlbl A\nI + 1 -> I\nif I < {n}\ngoto A\ndisp 2\n')
+            interpreter = tc.Interpreter(jit=jit)
+            stream = LoopStream()
+            interpreter.output_sink = tc.BufferedSink(stream, flush_interval=0.01)
+            interpreter.execute(looping)
+            if stream.getvalue() != '1\n2\n' or not stream.counters[0] < n:
+                raise TestCaseError(f"The first line was written after {stream.counters[0]} of {n} iterations")
+
+@test_case
+def test_case_16():
+    '''Test that the profiler counts every line, label and jump exactly'''
+    program = '''
+    PROGRAM "test 16"
+    0 -> I
+    lbl A
+    I + 1 -> I
+    if I == 7 * (I / 7)
+    T + 1 -> T
+    if I < 700
+    goto A
+    disp T
+    '''
+    assembled = tc.Assembler.assemble(tc.Parser.syntax_analysis(tc.Parser.lexical_analysis(program)))
+    interpreter = tc.Interpreter(jit=tc.JIT(threshold=10))
+    interpreter.output_sink = tc.CaptureSink()
+    interpreter.profiler = tc.Profiler()
+    interpreter.execute(assembled)
+    profile = interpreter.profiler.to_dict()['programs']['test 16']
+    print(interpreter.profiler.report())
+    counts = {entry['line']: entry['count'] for entry in profile['lines']}
+    if [counts[line] for line in range(3, 11)] != [1, 700, 700, 700, 100, 700, 699, 1]:
+        raise TestCaseError(f"Unexpected line counts {counts}")
+    if profile['labels'][0]['label'] != 'A' or profile['labels'][0]['entries'] != 700:
+        raise TestCaseError(f"Unexpected labels {profile['labels']}")
+    edges = {(edge['kind'], edge['line']): edge['count'] for edge in profile['edges']}
+    if edges != {('IF', 6): 600, ('IF', 8): 1, ('GOTO', 9): 699} or profile['edges'][-1].get('label') != 'A':
+        raise TestCaseError(f"Unexpected edges {profile['edges']}")
+    if interpreter.output_sink.lines != ['100'] or json.loads(json.dumps(interpreter.profiler.to_dict()))['total_time'] <= 0:
+        raise TestCaseError(f"Unexpected output {interpreter.output_sink.lines}")
+
+@test_case
+def test_case_17():
+    '''Test that profile-guided optimization moves cold blocks out of hot loops without changing the output'''
+    program = '''
+    PROGRAM "test 17"
+    0 -> I
+    lbl A
+    I + 1 -> I
+    if I == 500
+    goto B
+    T + I -> T
+    lbl C
+    if I < 3000
+    goto A
+    disp T
+    goto E
+    lbl B
+    disp I
+    goto C
+    lbl E
+    '''
+    assembled = tc.Assembler.assemble(tc.Parser.syntax_analysis(tc.Parser.lexical_analysis(program)))
+    def run(program:tc.Program) -> list:
+        interpreter = tc.Interpreter(jit=tc.JIT(threshold=10 ** 9))
+        interpreter.output_sink = tc.CaptureSink()
+        interpreter.profiler = tc.Profiler()
+        interpreter.execute(program)
+        return interpreter.output_sink.lines, interpreter.profiler.to_dict()
+    lines, profile = run(assembled)
+    profile = json.loads(json.dumps(profile))
+    optimized = tc.Optimizer.optimize(assembled, profile)
+    optimized_lines, _ = run(optimized)
+    if optimized_lines != lines or lines != ['500', '4501000']:
+        raise TestCaseError(f"Unexpected output {optimized_lines}, expected {lines}")
+    OPCODE = tc.opcodes.OPCODE
+    loop_end = max(ip for ip, opcode in enumerate(optimized.opcodes) if opcode == OPCODE.JUMP and optimized.operands[ip] == optimized.label_table['A'])
+    if any(opcode == OPCODE.DISP for opcode in optimized.opcodes[:loop_end]):
+        raise TestCaseError(f"The cold blocks were not moved, labels at {optimized.label_table}")
+    probabilities = sorted(optimized.branch_probabilities.values())
+    if len(probabilities) != 2 or probabilities[0] > 0.01 or probabilities[1] < 0.99:
+        raise TestCaseError(f"Unexpected branch probabilities {optimized.branch_probabilities}")
+    if optimized.jit_thresholds.get('A') != 1:
+        raise TestCaseError(f"Unexpected JIT thresholds {optimized.jit_thresholds}")
+    profile['programs']['test 17']['fingerprint'] = 'stale'
+    if tc.Optimizer.optimize(assembled, profile) is not assembled:
+        raise TestCaseError("A profile of another program was used")
+
+@test_case
+def test_case_18():
+    '''Test that metrics record every phase with its item counts, and nothing while inactive'''
+    program = '''
+    PROGRAM "test 18"
+    0 -> I
+    lbl A
+    I + 1 -> I
+    if I < 50
+    goto A
+    disp I
+    '''
+    with tc.Metrics() as metrics:
+        tokens = tc.Parser.lexical_analysis(program)
+        tree = tc.Parser.syntax_analysis(tokens)
+        assembled = tc.Assembler.assemble(tree)
+        interpreter = tc.Interpreter()
+        interpreter.output_sink = tc.CaptureSink()
+        interpreter.profiler = tc.Profiler()
+        interpreter.execute(assembled)
+    tc.Interpreter().load(assembled) # not recorded
+    phases = json.loads(json.dumps(metrics.to_dict()))['phases']
+    print(metrics.report())
+    if list(phases) != ['lexical_analysis', 'syntax_analysis', 'assemble', 'execute', 'load']:
+        raise TestCaseError(f"Unexpected phases {list(phases)}")
+    expected = {
+        'lexical_analysis': {'tokens': len(tokens)},
+        'syntax_analysis': {'nodes': tree.size()},
+        'assemble': {'instructions': len(assembled)},
+        'execute': {'instructions': sum(interpreter.profiler.programs['test 18'].counts), 'native_region_calls': 0},
+        'load': {'programs': 1, 'variables': 1, 'arrays': 0},
+    }
+    for name, items in expected.items():
+        if phases[name]['items'] != items or phases[name]['calls'] != 1 or phases[name]['wall_time'] <= 0:
+            raise TestCaseError(f"Unexpected metrics of {name}: {phases[name]}, expected items {items}")
+    if phases['execute']['wall_time'] < phases['load']['wall_time']:
+        raise TestCaseError("execute does not include load")
+
+@test_case
+def test_case_19():
+    '''Test that synthetic benchmark programs scale and run, and that the suite flags regressions'''
+    from benchmarks import generator, suite
+    small, large = generator.generate(lines=40), generator.generate(lines=400, depth=4, nesting=3, trip_count=3)
+    if len(large.splitlines()) < 400 or len(small.splitlines()) >= len(large.splitlines()) or small != generator.generate(lines=40):
+        raise TestCaseError("The generator does not scale deterministically")
+    program = tc.Assembler.assemble(tc.Parser.syntax_analysis(tc.Parser.lexical_analysis(large)))
+    interpreter = tc.Interpreter()
+    interpreter.output_sink = tc.CaptureSink()
+    interpreter.execute(program)
+    if len(interpreter.output_sink.lines) != len(generator.VALUE_VARIABLES):
+        raise TestCaseError(f"Unexpected output {interpreter.output_sink.lines}")
+    results = json.loads(json.dumps(suite.run_suite(['hello', 'bank'], ['lexical_analysis', 'interpret'], repeat=1, scale=0.1)))
+    print(suite.report(results, results))
+    bank = results['results']['bank']
+    if bank['lexical_analysis']['unit'] != 'tokens' or bank['interpret']['items'] <= 0 or bank['interpret']['rate'] <= 0:
+        raise TestCaseError(f"Unexpected results {bank}")
+    if suite.compare(results, results):
+        raise TestCaseError("Results regressed against themselves")
+    baseline = json.loads(json.dumps(results))
+    baseline['results']['bank']['interpret']['rate'] *= 2
+    baseline['results']['hello']['lexical_analysis']['peak_memory'] -= 10 ** 6
+    regressions = [(name, stage) for name, stage, _ in suite.compare(results, baseline)]
+    if regressions != [('hello', 'lexical_analysis'), ('bank', 'interpret')]:
+        raise TestCaseError(f"Unexpected regressions {regressions}")
+
+@test_case
+def test_case_20():
+    '''Test that importing the package loads nothing until used, and that pure Python arithmetic matches the library'''
+    check = ("import sys, tython_compiler as tc\n"
+             "loaded = sorted(m for m in sys.modules if m.startswith('tython_compiler.') or m in ('asyncio', 'numpy', 'ctypes'))\n"
+             "assert not loaded, loaded\n"
+             "assert tc.Parser is tc.parser.Parser and 'tython_compiler.parser' in sys.modules\n"
+             "assert 'ctypes' not in sys.modules or tc.datatypes._operator_library is None\n")
+    subprocess.run(['python3', '-c', check], check=True)
+    source = "\n".join([
+        'PROGRAM "arithmetic"', 'INT64 K', 'REAL64 D',
+        '2147483647 + 1 -> I', 'disp I', '0 - 7 / 2 -> J', 'disp J', '7 * ( 0 - 1 ) / 2 -> J', 'disp J',
+        '9223372036854775807 -> K', 'K + 1 -> K', 'disp K', '1.0 / 3.0 -> A', 'disp A', '1.0 / 3.0 -> D', 'disp D',
+        '1.0 / 0.0 -> A', 'disp A', '0.0 - 1.0 / 0.0 -> A', 'disp A', '65536 * 65536 -> I', 'disp I',
+        '0 - 2147483647 - 1 -> I', '0 - 1 -> J', 'I / J -> K', 'disp I', 'disp K', 'disp I / J',
+        '0 - 9223372036854775807 - 1 -> K', 'disp K / J',
+    ]) + "\n"
+    run = ("import sys, tython_compiler as tc\n"
+           "tc.Interpreter().execute(tc.Assembler.assemble(tc.Parser.syntax_analysis(tc.Parser.lexical_analysis(sys.stdin.read()))))\n")
+    outputs = []
+    for pure in ('', '1'):
+        env = dict(os.environ, TYTHON_PURE_PYTHON=pure)
+        outputs.append(subprocess.run(['python3', '-c', run], input=source, env=env, check=True, capture_output=True, text=True).stdout)
+    print(outputs[1])
+    if outputs[0] != outputs[1]:
+        raise TestCaseError(f"Pure Python arithmetic printed {outputs[1]!r}, the library {outputs[0]!r}")
+
+@test_case
+def test_case_21():
+    '''Test the math functions: rounding per datatype, IEEE results outside of the domain, the reduced precision
+    REAL32 mode, vectorized evaluation and identical results of the interpreter and the JIT'''
+    import math, array
+    mathlib, OPCODE, Datatypes, np = tc.mathlib, tc.opcodes.OPCODE, tc.datatypes.Datatypes, tc.lanes.np
+    names = ['sin', 'cos', 'tan', 'cot', 'sec', 'csc', 'arcsin', 'arccos', 'arctan', 'arccot', 'arcsec', 'arccsc']
+    source = 'PROGRAM "functions"\nREAL64 D\n0.75 -> D\n0.75 -> X\n' + ''.join(
+        f'disp {name} ( D )\ndisp {name} ( X )\ndisp {name} ( 2 )\n' for name in names) + 'disp arcsin ( 2 )\ndisp cot ( 0 )\n'
+    interpreter = tc.Interpreter()
+    interpreter.output_sink = tc.CaptureSink()
+    interpreter.execute(tc.Assembler.assemble(tc.Parser.syntax_analysis(tc.Parser.lexical_analysis(source))))
+    expected = []
+    for name in names:
+        function = mathlib.DOUBLE_FUNCTIONS[OPCODE[name.upper()]]
+        expected += [tc.datatypes.Float64(function(0.75)).true_repr(), tc.datatypes.Float32(mathlib.round_single(function(0.75))).true_repr(),
+                     tc.datatypes.Float64(function(2)).true_repr()]
+    expected += ['nan', 'inf']
+    if interpreter.output_sink.lines != expected:
+        raise TestCaseError(f"Math functions printed {interpreter.output_sink.lines}, expected {expected}")
+    if mathlib.DOUBLE_FUNCTIONS[OPCODE.ARCCOT](-1e10) <= 3.14159 or mathlib.DOUBLE_FUNCTIONS[OPCODE.ARCCOT](1e10) != 1e-10:
+        raise TestCaseError("ARCCOT is not continuous in (0, pi)")
+    # reduced precision REAL32: a few ulp off, and the same bits one by one and over arrays
+    operands = [mathlib.round_single(k * 0.173 - 40) for k in range(500)] + [0.0, -0.0, 1e4, math.inf, -math.inf, math.nan]
+    for opcode, fast in mathlib.FAST_FUNCTIONS.items():
+        exact = mathlib.scalar_function(opcode, Datatypes.REAL32)
+        for x in operands[:500]:
+            e = mathlib.DOUBLE_FUNCTIONS[opcode](x)
+            if math.isfinite(e) and abs(e) > 1e-30 and abs(fast(x) - e) > 4 * math.ulp(exact(x)) * 2 ** 29:
+                raise TestCaseError(f"Fast {opcode.name}({x}) = {fast(x)}, exact {e}")
+        scalar = [fast(x) for x in operands]
+        vectors = [mathlib.evaluate_array(opcode, array.array('f', operands), Datatypes.REAL32, tc.opcodes.MATH_FAST)]
+        if np is not None:
+            vectors.append(mathlib.evaluate_array(opcode, np.array(operands, dtype=np.float32), Datatypes.REAL32, tc.opcodes.MATH_FAST))
+        for vector in vectors:
+            if any(a != b and not (math.isnan(a) and math.isnan(b)) for a, b in zip(scalar, vector)):
+                raise TestCaseError(f"Vectorized fast {opcode.name} differs from the scalar version")
+    if list(mathlib.evaluate_array(OPCODE.SIN, array.array('i', [0, 1, 2]), Datatypes.INT32)) != [math.sin(k) for k in range(3)]:
+        raise TestCaseError("SIN of an INT32 array is not REAL64")
+    # a trigonometric loop, interpreted and compiled to native code in both precisions
+    loop = '\n'.join(['PROGRAM "loop"', 'REAL64 D', '1 -> I', '0 -> S', '0 -> D', 'lbl A', 'I * 0.37 -> X',
+                       'S + sin ( X ) + cos ( X ) * tan ( X ) + cot ( X ) + sec ( X ) + csc ( X ) -> S',
+                       'S + arctan ( X ) + arccot ( X - 3 ) + arcsin ( X / 1000 ) + arcsec ( X + 1 ) -> S',
+                       'D + sin ( I ) + arccsc ( D + 1 ) + arccos ( 0.5 ) -> D', 'I + 1 -> I', 'if I < 300', 'goto A', 'disp S', 'disp D']) + '\n'
+    with tempfile.TemporaryDirectory() as directory:
+        for fast_math in (False, True):
+            program = tc.Assembler.assemble(tc.Parser.syntax_analysis(tc.Parser.lexical_analysis(loop)), fast_math=fast_math)
+            if fast_math != ('fast' in program.disassemble()):
+                raise TestCaseError("MATH_FAST is not recorded in the instructions")
+            outputs = []
+            for jit in (None, tc.JIT(threshold=10, cache_directory=directory)):
+                interpreter = tc.Interpreter(jit=jit)
+                interpreter.output_sink = tc.CaptureSink()
+                interpreter.execute(program)
+                outputs.append(interpreter.output_sink.lines)
+            if np is not None:
+                outputs.append(tc.LaneInterpreter().run(program, [[0], [0]]).outputs[1])
+            print(fast_math, outputs)
+            if any(output != outputs[0] for output in outputs):
+                raise TestCaseError(f"Native code and lanes printed {outputs[1:]}, the interpreter {outputs[0]}")
+
+@test_case
+def test_case_22():
+    """Test CHAR8 strings: byte backed arrays, string assignment and DISPSTR in every execution engine, snapshots
+    of CHAR8 arrays and a JIT compiled loop over the bytes of a string"""
+    source = '\n'.join(['PROGRAM "strings"', 'CHAR8 @M0', '"Hello, Wörld!" -> @M0', 'DISPSTR @M0', 'disp DIM ( @M0 )',
+                        '@M0 [ 0 ] + 1 -> @M0 [ 0 ]', 'DISPSTR @M0', '"" -> @M0', 'DISPSTR @M0', 'disp DIM ( @M0 )',
+                        '"abc" -> @M0', '0 -> I', '0 -> J', 'lbl A', 'J + @M0 [ I - I / 3 * 3 ] -> J', 'I + 1 -> I',
+                        'if I < 300', 'goto A', 'disp J', 'DISPSTR @M0']) + '\n'
+    expected = ['Hello, Wörld!', '14', 'Iello, Wörld!', '', '0', str(100 * (97 + 98 + 99)), 'abc']
+    program = tc.Assembler.assemble(tc.Parser.syntax_analysis(tc.Parser.lexical_analysis(source)))
+    outputs = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, jit in (('interpreter', None), ('jit', tc.JIT(threshold=10, cache_directory=directory))):
+            interpreter = tc.Interpreter(jit=jit)
+            interpreter.output_sink = tc.CaptureSink()
+            interpreter.execute(program)
+            outputs[name] = interpreter.output_sink.lines
+        executable = os.path.join(directory, 'test_22')
+        tc.Lowerer.build_executable(tc.Lowerer.lower_program(program), executable)
+        outputs['native'] = subprocess.run([executable], capture_output=True, text=True).stdout.split('\n')[:-1]
+    if tc.lanes.np is not None:
+        outputs['lanes'] = tc.LaneInterpreter().run(program, [[0], [0]]).outputs[1]
+    for name, output in outputs.items():
+        if output != expected:
+            raise TestCaseError(f"The {name} printed {output}, expected {expected}")
+    # one byte per character and a round trip through a snapshot
+    Datatypes = tc.datatypes.Datatypes
+    text = tc.datatypes.Array(Datatypes.CHAR8)
+    text.assign_bytes('Grüße'.encode('utf-8'))
+    if not isinstance(text.buffer, bytearray) or text.dim != 7 or text.size != 7:
+        raise TestCaseError(f"A CHAR8 array is not byte backed: {text!r}")
+    _, arrays, _ = tc.Snapshot.loads(tc.Snapshot.dumps({}, {'@M0': text}, {'@M0': Datatypes.CHAR8}))
+    if bytes(arrays['@M0'].buffer) != bytes(text.buffer) or not isinstance(arrays['@M0'].buffer, bytearray):
+        raise TestCaseError("A CHAR8 array changed in a snapshot round trip")
+    for line in ('"text" -> @A0', 'DISPSTR @A0'):
+        try:
+            tc.Assembler.assemble(tc.Parser.syntax_analysis(tc.Parser.lexical_analysis(f'PROGRAM "bad"\nINT32 @A0\n{line}\n')))
+        except tc.error.LoweringError:
+            pass
+        else:
+            raise TestCaseError(f"{line} on an INT32 array was assembled")
+
+@test_case
+def test_case_23():
+    """Test that IF conditions run as short-circuit compare and branch instructions with the same results in every
+    execution engine, including comparisons of integers with reals"""
+    import itertools
+    OPCODE = tc.opcodes.OPCODE
+    operators = {'and': lambda a, b: a and b, 'or': lambda a, b: a or b, 'nand': lambda a, b: not (a and b),
+                 'nor': lambda a, b: not (a or b), 'xor': lambda a, b: a != b}
+    conditions = [(f'( A > 0 ) {name} ( B <= 1 )', lambda a, b, f=f: f(a > 0, b <= 1)) for name, f in operators.items()]
+    conditions += [('not ( ( A == B ) or ( not ( B != 2 ) ) )', lambda a, b: not (a == b or b == 2)),
+                   ('( ( A >= 1 ) nand ( B < 2 ) ) xor ( A == 2 )', lambda a, b: (not (a >= 1 and b < 2)) != (a == 2))]
+    lines, expected = ['PROGRAM "conditions"'], []
+    for a, b in itertools.product(range(3), repeat=2):
+        lines += [f'{a} -> A', f'{b} -> B']
+        for k, (condition, value) in enumerate(conditions):
+            lines += [f'if {condition}', f'disp {k}']
+            expected += [str(k)] if value(a, b) else []
+    # the second operand would fail, and an INT32 compared with a REAL32 in single precision
+    lines += ['DIM ( @A0 ) -> N', 'N -> I', 'if ( I < N ) and ( @A0 [ I ] > 0 )', 'disp "read"',
+              'if ( I >= N ) or ( @A0 [ I ] > 0 )', 'disp "short"', '16777217 -> J', '16777216 -> X', 'if J == X', 'disp "equal"']
+    expected += ['short', 'equal']
+    # a loop whose condition the JIT compiles
+    lines += ['0 -> K', '0 -> L', 'lbl A', 'if ( K - K / 3 * 3 == 0 ) or ( K > 290 )', 'L + 1 -> L', 'K + 1 -> K',
+              'if not ( K >= 300 )', 'goto A', 'disp L']
+    expected += ['106']
+    program = tc.Assembler.assemble(tc.Parser.syntax_analysis(tc.Parser.lexical_analysis('\n'.join(lines) + '\n')))
+    emitted = set(program.opcodes)
+    if emitted & {OPCODE.JUMP_IF_FALSE, OPCODE.LOGICAL_AND, OPCODE.LOGICAL_OR, OPCODE.LOGICAL_NOT} or not emitted & set(tc.opcodes.BRANCH_COMPARISONS):
+        raise TestCaseError(f"Conditions were computed as values:\n{program.disassemble()}")
+    outputs = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, jit in (('interpreter', None), ('jit', tc.JIT(threshold=10, cache_directory=directory))):
+            interpreter = tc.Interpreter(jit=jit)
+            interpreter.output_sink = tc.CaptureSink()
+            interpreter.execute(program)
+            outputs[name] = interpreter.output_sink.lines
+        executable = os.path.join(directory, 'test_23')
+        tc.Lowerer.build_executable(tc.Lowerer.lower_program(program), executable)
+        outputs['native'] = subprocess.run([executable], capture_output=True, text=True).stdout.split('\n')[:-1]
+    if tc.lanes.np is not None:
+        outputs['lanes'] = tc.LaneInterpreter().run(program, [[0], [0]]).outputs[1]
+    for name, output in outputs.items():
+        if output != expected:
+            raise TestCaseError(f"The {name} printed {output}, expected {expected}")
+
+@test_case
+def test_case_24():
+    """Test execution quotas: instruction and wall time limits of interpreted and native loops, array memory limits,
+    and that a run within its quotas prints what it prints without them"""
+    def run(source, quotas, jit=None):
+        program = tc.Assembler.assemble(tc.Parser.syntax_analysis(tc.Parser.lexical_analysis(source)))
+        interpreter = tc.Interpreter(jit=jit)
+        interpreter.output_sink = tc.CaptureSink()
+        interpreter.quotas = quotas
+        try:
+            interpreter.execute(program)
+        except tc.error.QuotaExceededError as e:
+            return interpreter.output_sink.lines, e
+        return interpreter.output_sink.lines, None
+    spin = 'PROGRAM "spin"\n0 -> I\nlbl A\nI + 1 -> I\ngoto A\n'
+    with tempfile.TemporaryDirectory() as directory:
+        for jit in (None, tc.JIT(threshold=10, cache_directory=directory)):
+            _, error = run(spin, tc.Quotas(max_instructions=50000), jit)
+            if error is None or error.quota != 'instructions' or not 50000 < error.used < 50100 or error.line_number != 3:
+                raise TestCaseError(f"An endless loop was not stopped after 50000 instructions: {error!r}")
+            start = time.perf_counter()
+            _, error = run(spin, tc.Quotas(max_seconds=0.2), jit)
+            if error is None or error.quota != 'seconds' or time.perf_counter() - start > 1:
+                raise TestCaseError(f"An endless loop was not stopped after 0.2 seconds: {error!r}")
+            lines, error = run('PROGRAM "count"\n0 -> I\nlbl A\nI + 1 -> I\nif I < 1000\ngoto A\ndisp I\n', tc.Quotas(10 ** 6, 60, 0), jit)
+            if lines != ['1000'] or error is not None:
+                raise TestCaseError(f"A run within its quotas printed {lines}, {error!r}")
+    grow = 'PROGRAM "grow"\nCHAR8 @M0\n"abcd" -> @M0\n1000 -> DIM ( @A0 )\ndisp 1\n0 -> DIM ( @A0 )\n"abcdefgh" -> @M0\ndisp 2\n1001 -> DIM ( @A0 )\ndisp 3\n'
+    lines, error = run(grow, tc.Quotas(max_array_bytes=4008))
+    if lines != ['1', '2'] or error is None or error.quota != 'array_bytes' or error.used != 4012 or error.line_number != 9:
+        raise TestCaseError(f"Array memory was not limited to 4008 bytes: {lines}, {error!r}")
+    if not isinstance(error, tc.error.InterpreterError):
+        raise TestCaseError("QuotaExceededError is not an InterpreterError")
+
+@test_case
+def test_case_25():
+    """Test memory accounting: array high-water marks of a run, the logical (DType.size) and real sizes reported for
+    variables, programs, tokens and trees, native regions after a JIT run, and a JSON-serializable report"""
+    source = 'PROGRAM "grow"\nINT64 K\n1000 -> DIM ( @A0 )\n0 -> DIM ( @A0 )\n3 -> K\n0 -> I\nlbl A\nI + 1 -> I\nif I < 100\ngoto A\ndisp I\n'
+    tokens = tc.Parser.lexical_analysis(source)
+    tree = tc.Parser.syntax_analysis(tokens)
+    program = tc.Assembler.assemble(tree)
+    with tempfile.TemporaryDirectory() as directory:
+        jit = tc.JIT(threshold=10, cache_directory=directory)
+        interpreter = tc.Interpreter(jit=jit)
+        interpreter.output_sink = tc.CaptureSink()
+        interpreter.execute(program)
+        if interpreter.high_water.get('array_bytes') != 4000 or interpreter.array_variables['@A0'].size != 0:
+            raise TestCaseError(f"The array high-water mark is {interpreter.high_water}, expected 4000 bytes")
+        report = tc.MemoryReport()
+        report.add_tokens(tokens, 'grow.ty')
+        report.add_tree(tree, 'grow.ty')
+        report.add_interpreter(interpreter)
+        entries = {(e['category'], e['name']): e for e in report.entries}
+        expected = {('scalar', 'K'): 8, ('scalar', 'I'): 4, ('array', '@A0'): 0, ('tokens', 'grow.ty'): None,
+                    ('ast', 'grow.ty'): None, ('program', 'grow'): tc.memory.program_size(program)}
+        for key, logical in expected.items():
+            if key not in entries or entries[key]['logical'] != logical or entries[key]['real'] <= 0:
+                raise TestCaseError(f"Memory report entry {key} is {entries.get(key)}, expected logical size {logical}")
+        if jit.enabled and not any(e['category'] == 'native' and e['real'] > 0 for e in report.entries):
+            raise TestCaseError("The memory report has no native region after a JIT run")
+        dumped = json.loads(json.dumps(report.to_dict()))
+        if dumped['high_water']['array_bytes'] != 4000 or dumped['totals']['scalar']['logical'] != 12:
+            raise TestCaseError(f"The JSON memory report is {dumped}")
+        if 'peak' not in report.report():
+            raise TestCaseError("The text memory report has no high-water marks")
+
+@test_case
+def test_case_26():
+    """Test hash-consing of expressions: identical subtrees are one shared node, the tree takes less memory and
+    assembles to the same program, line numbers included"""
+    source = ('PROGRAM "shared"\nPROMPT A\nPROMPT B\nPROMPT C\nB * B - 4 * A * C -> D\n'
+              'if ( B * B - 4 * A * C > 0 ) and ( A != 0 )\ndisp B * B - 4 * A * C\n2 * ( B * B - 4 * A * C ) -> E\ndisp E\n')
+    tokens = tc.Parser.lexical_analysis(source)
+    table = tc.NodeTable()
+    plain, dag = tc.Parser.syntax_analysis(tokens), tc.Parser.syntax_analysis(tokens, table)
+    statements = dag.children
+    discriminant = statements[4].children[1]
+    condition = statements[5].children[0].children[0]
+    if statements[5].children[1].children[0].children[0] is not discriminant or table.hits == 0:
+        raise TestCaseError("An expression repeated on another line is not the same node")
+    if condition.children[0].children[0].children[0] is not discriminant:
+        raise TestCaseError("A repeated subexpression inside of a condition is not the same node")
+    if dag.size() != plain.size() or not tc.memory.deep_size(dag) < tc.memory.deep_size(plain):
+        raise TestCaseError(f"The shared tree has {dag.size()} nodes in {tc.memory.deep_size(dag)} bytes, "
+                            f"the plain one {plain.size()} nodes in {tc.memory.deep_size(plain)} bytes")
+    p1, p2 = tc.Assembler.assemble(plain), tc.Assembler.assemble(dag)
+    if (p1.opcodes, p1.operands, p1.line_numbers, p1.constants) != (p2.opcodes, p2.operands, p2.line_numbers, p2.constants):
+        raise TestCaseError("The shared tree assembles to another program")
+    interpreter = tc.Interpreter()
+    interpreter.output_sink = tc.CaptureSink()
+    interpreter.input_stream = io.StringIO('1\n5\n2\n')
+    interpreter.execute(p2)
+    if interpreter.output_sink.lines != ['17', '34']:
+        raise TestCaseError(f"The shared tree printed {interpreter.output_sink.lines}")
+
+@test_case
+def test_case_27():
+    """Test the embedding API: a program compiled once and run many times with scalars set and read by name, and
+    array variables bound to caller buffers without copying, read back as views"""
+    program = tc.Assembler.compile('PROGRAM "scale"\nREAL64 @X\n0 -> I\nlbl A\n@X[I] * F -> @X[I]\nI + 1 -> I\n'
+                                   'if I < DIM ( @X )\ngoto A\nR + 1 -> R\n')
+    with tempfile.TemporaryDirectory() as directory:
+        for jit in (None, tc.JIT(threshold=2, cache_directory=directory)):
+            interpreter = tc.Interpreter(jit=jit)
+            interpreter.output_sink = tc.NullSink()
+            x = array.array('d', [0.0, 1.0, 2.0, 3.0])
+            interpreter.bind_array('@x', x)
+            interpreter.set_variable('F', 2)
+            for _ in range(3):
+                interpreter.execute(program)
+            if list(x) != [0.0, 8.0, 16.0, 24.0] or interpreter.get_variable('r') != 3.0:
+                raise TestCaseError(f"Runs on a bound buffer left {list(x)}, {interpreter.get_variable('R')} runs")
+            view = interpreter.array_view('@X')
+            if view.tolist() != list(x) or view.obj is not interpreter.array_variables['@X'].buffer.obj:
+                raise TestCaseError("The array view is not a view of the bound buffer")
+    # bound buffers keep their size and datatype
+    interpreter = tc.Interpreter()
+    interpreter.bind_array('@A', array.array('f', [1.0]))
+    for source, message in (('PROGRAM "grow"\n3 -> DIM ( @A )\n', 'cannot be resized'), ('PROGRAM "retype"\nINT32 @A\n', 'declares it INT32')):
+        try:
+            interpreter.execute(tc.Assembler.compile(source))
+        except tc.error.InterpreterError as e:
+            if message not in str(e):
+                raise TestCaseError(f"Unexpected error {e}")
+        else:
+            raise TestCaseError(f"{source!r} changed a bound buffer")
+    # views of owned arrays survive a resize with the old contents
+    interpreter.execute(tc.Assembler.compile('PROGRAM "own"\n2 -> DIM ( @B )\n7 -> @B[1]\n'))
+    view = interpreter.array_view('@B')
+    interpreter.execute(tc.Assembler.compile('PROGRAM "own"\n4 -> DIM ( @B )\n'))
+    if view.tolist() != [0.0, 7.0] or interpreter.array_view('@B').tolist() != [0.0, 7.0, 0.0, 0.0]:
+        raise TestCaseError("Resizing an array with a view held changed the view")
+    if tc.lanes.np is None:
+        return
+    np = tc.lanes.np
+    matrix = np.arange(6, dtype=np.int32).reshape(2, 3)
+    interpreter.bind_array('@M', matrix)
+    interpreter.execute(tc.Assembler.compile('PROGRAM "numpy"\n0 -> K\nlbl A\n@M[K] * @M[K] -> @M[K]\nK + 1 -> K\nif K < DIM ( @M )\ngoto A\n'))
+    if matrix.tolist() != [[0, 1, 4], [9, 16, 25]] or np.asarray(interpreter.array_view('@M')).sum() != 55:
+        raise TestCaseError(f"A bound NumPy array holds {matrix.tolist()}")
+    try:
+        interpreter.bind_array('@N', np.zeros(3, dtype=np.uint16))
+    except TypeError:
+        pass
+    else:
+        raise TestCaseError("An array was bound to a buffer of unsigned 16 bit elements")
+
+@test_case
+def test_case_28():
+    """Test memory-mapped array variables: programs read and write the file in place, interpreted and native,
+    copy-on-write maps leave the file alone, mapped arrays keep their dimension, and batch jobs map files too"""
+    source = 'PROGRAM "double"\n0 -> I\n0 -> S\nlbl A\nS + @K[I] -> S\n@K[I] * 2 -> @K[I]\nI + 1 -> I\nif I < DIM ( @K )\ngoto A\ndisp S\n'
+    program = tc.Assembler.compile(source)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'k.bin')
+        with open(path, 'wb') as f:
+            f.write(array.array('i', range(100)).tobytes())
+        for jit in (None, tc.JIT(threshold=10, cache_directory=directory)):
+            interpreter = tc.Interpreter(jit=jit)
+            interpreter.output_sink = tc.CaptureSink()
+            a = interpreter.map_array('@K', path)
+            interpreter.execute(program)
+            a.close()
+            with open(path, 'rb') as f:
+                data = array.array('i', f.read())
+            expected = 4950 if jit is None else 9900 # the second run sees the first run's writes
+            if interpreter.output_sink.lines != [str(expected)] or list(data) != [k * 2 * expected // 4950 for k in range(100)]:
+                raise TestCaseError(f"A mapped array printed {interpreter.output_sink.lines} and left {list(data)[:4]}...")
+        interpreter = tc.Interpreter()
+        interpreter.output_sink = tc.NullSink()
+        a = interpreter.map_array('@K', path, mode='c')
+        interpreter.execute(program)
+        a.close()
+        with open(path, 'rb') as f:
+            if array.array('i', f.read())[1] != 4:
+                raise TestCaseError("A copy-on-write map changed its file")
+        a = interpreter.map_array('@X', os.path.join(directory, 'x.bin'), tc.datatypes.Datatypes.REAL64, 8, 'w+')
+        if os.path.getsize(os.path.join(directory, 'x.bin')) != 64 or a.dim != 8:
+            raise TestCaseError("A new file was not mapped as 8 REAL64 elements")
+        try:
+            interpreter.execute(tc.Assembler.compile('PROGRAM "grow"\n16 -> DIM ( @X )\n'))
+        except tc.error.InterpreterError:
+            pass
+        else:
+            raise TestCaseError("A mapped array was resized")
+        a.close()
+        with open(os.path.join(directory, 'double.ty'), 'w') as f:
+            f.write(source)
+        with open(os.path.join(directory, 'jobs.jsonl'), 'w') as f:
+            f.write(json.dumps({'program': 'double.ty', 'arrays': {'@K': 'k.bin'}}) + '\n')
+            f.write(json.dumps({'program': 'double.ty', 'arrays': {'@K': 'x.bin'}}) + '\n')
+        results = sorted(tc.run_batch(os.path.join(directory, 'jobs.jsonl'), processes=1, jit=False), key=lambda r: r['job'])
+        if results[0]['output'] != '19800\n' or results[1]['status'] != 'ok' or results[1]['output'] != '0\n':
+            raise TestCaseError(f"Batch jobs with mapped arrays returned {results}")
+
 @test_case
 def test_shunting_yard_algorithm():
     input_tokens = []
@@ -91,5 +1192,30 @@ if __name__ == '__main__':
     test_case_1() 
     test_case_2()
     test_case_3()
+    test_case_4()
+    test_case_5()
+    test_case_6()
+    test_case_7()
+    test_case_8()
+    test_case_9()
+    test_case_10()
+    test_case_11()
+    test_case_12()
+    test_case_13()
+    test_case_14()
+    test_case_15()
+    test_case_16()
+    test_case_17()
+    test_case_18()
+    test_case_19()
+    test_case_20()
+    test_case_21()
+    test_case_22()
+    test_case_23()
+    test_case_24()
+    test_case_25()
+    test_case_26()
+    test_case_27()
+    test_case_28()
     # test_shunting_yard_algorithm()
     print(f"All test cases passed in {(time.time() - start_time):0.4f} seconds")
@@ -1,16 +1,69 @@
-from .token_types import TOKEN_TYPE, ORDER_OF_OPERATIONS, REQUIRES_VALUE, NUMERALS
-from .parser import *
-import token
-from .interpreter import Interpreter
-from .shunting_yard_algorithm import *
-from .utils import *
-# import node # BUG
+'''The Tython compiler. Submodules are imported on first use of one of their names, so that "import tython_compiler"
+stays cheap for short command line invocations'''
+import os
+import importlib
+
+# public name: submodule defining it
+_EXPORTS:dict = {
+    'TOKEN_TYPE': 'token_types',
+    'ORDER_OF_OPERATIONS': 'token_types',
+    'REQUIRES_VALUE': 'token_types',
+    'NUMERALS': 'token_types',
+    'Token': 'token',
+    'Node': 'node',
+    'NodeTable': 'node',
+    'Parser': 'parser',
+    'ParsingError': 'error',
+    'Interpreter': 'interpreter',
+    'Assembler': 'assembler',
+    'Program': 'assembler',
+    'Lowerer': 'lowerer',
+    'JIT': 'jit',
+    'ProgramImage': 'image',
+    'IMAGE_SUFFIX': 'image',
+    'Catalog': 'catalog',
+    'Linker': 'linker',
+    'Snapshot': 'snapshot',
+    'SNAPSHOT_SUFFIX': 'snapshot',
+    'run_batch': 'batch',
+    'Daemon': 'daemon',
+    'serve': 'daemon',
+    'LaneInterpreter': 'lanes',
+    'Session': 'sessions',
+    'serve_sessions': 'sessions',
+    'BufferedSink': 'output',
+    'CaptureSink': 'output',
+    'NullSink': 'output',
+    'Profiler': 'profiler',
+    'Optimizer': 'optimizer',
+    'Metrics': 'metrics',
+    'Quotas': 'quotas',
+    'MemoryReport': 'memory',
+    'shunting_yard': 'shunting_yard_algorithm',
+    'get_ordinal': 'shunting_yard_algorithm',
+    'print_plain_string': 'utils',
+}
+__all__ = list(_EXPORTS) + ['init']
+
+def __getattr__(name:str):
+    module = _EXPORTS.get(name)
+    if module is not None:
+        value = getattr(importlib.import_module(f'.{module}', __name__), name)
+    elif os.path.exists(os.path.join(os.path.dirname(__file__), f'{name}.py')):
+        value = importlib.import_module(f'.{name}', __name__) # e.g. tc.utils
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value # found directly from now on
+    return value
+
+def __dir__() -> list:
+    return sorted(set(globals()) | set(__all__))
 
 def init(debug=False, tab_width=3):
     '''Set debug flag in nessesary modules to \'True\''''
+    from . import parser, token, interpreter # the package modules, not the standard library token
     if debug:
         parser.DEBUG = True
         token.DEBUG = True
         interpreter.DEBUG = True
     #n.TAB_WIDTH = tab_width
-
@@ -0,0 +1,369 @@
+"""Define AST->bytecode Assembler
+Author: Ty Brennan
+"""
+
+import typing
+import array
+import hashlib
+
+from .token_types import *
+from .token import Token
+from .node import Node, NodeTable
+from .opcodes import *
+from .error import LoweringError
+from .datatypes import Datatypes, match_token_to_datatype, match_literal_to_datatype, get_default_type
+from .metrics import measured
+
+
+class Program(object):
+    '''A flat, slot-addressed instruction stream. Every instruction is an (opcode, operand, line number) triple
+    stored column-wise, expressions are in postfix order and evaluated on a value stack.'''
+    def __init__(self, name:str):
+        self.name:str = name
+        self.version:typing.Optional[tuple] = None
+        self.opcodes:list = []
+        self.operands:list = []
+        self.line_numbers:list = []
+        self.constants:list = [] # constants[k] = int | float | str
+        self.constant_types:list = [] # constant_types[k] = Datatypes | None (strings)
+        self.variables:list = [] # variables[slot] = "A0"
+        self.array_variables:list = [] # array_variables[slot] = "@A0"
+        self.type_map:dict = dict() # type_map["A0"] = Datatypes.[...]
+        self.labels:list = [] # labels[k] = "L"
+        self.label_table:dict = dict() # label_table["L"] = instruction pointer
+        # profile-guided hints set by the Optimizer, not part of images
+        self.branch_probabilities:dict = dict() # branch_probabilities[ip] = fraction of executions the jump at ip is taken
+        self.jit_thresholds:dict = dict() # jit_thresholds["L"] = executions of LBL L before its loop is compiled
+
+    def __len__(self) -> int:
+        return len(self.opcodes)
+
+    def emit(self, opcode:OPCODE, operand:int=0, line_number:int=-1) -> int:
+        '''Append an instruction and return its instruction pointer'''
+        self.opcodes.append(opcode)
+        self.operands.append(operand)
+        self.line_numbers.append(line_number)
+        return len(self.opcodes) - 1
+
+    def constant(self, value, dtype:typing.Optional[Datatypes]) -> int:
+        '''Index of a constant in the constant pool, adding it if needed'''
+        for k, (c, t) in enumerate(zip(self.constants, self.constant_types)):
+            if t == dtype and type(c) == type(value) and c == value:
+                return k
+        self.constants.append(value)
+        self.constant_types.append(dtype)
+        return len(self.constants) - 1
+
+    def slot(self, var:str) -> int:
+        '''Slot of a scalar variable, allocating it if needed'''
+        if var not in self.variables:
+            self.variables.append(var)
+        return self.variables.index(var)
+
+    def array_slot(self, a_var:str) -> int:
+        '''Slot of an array variable, allocating it if needed'''
+        if a_var not in self.array_variables:
+            self.array_variables.append(a_var)
+        return self.array_variables.index(a_var)
+
+    def label(self, name:str) -> int:
+        '''Index of a label, adding it if needed'''
+        if name not in self.labels:
+            self.labels.append(name)
+        return self.labels.index(name)
+
+    def jump_targets(self) -> set:
+        '''Instruction pointers that are the target of some jump'''
+        return {self.operands[ip] for ip in range(len(self)) if self.opcodes[ip] in JUMP_OPCODES}
+
+    def fingerprint(self) -> str:
+        '''Hash of the instruction stream, identifies the program a profile was recorded for'''
+        columns = array.array('i', self.opcodes).tobytes() + array.array('i', self.operands).tobytes()
+        return hashlib.sha256(self.name.encode('utf-8') + b'\0' + columns).hexdigest()
+
+    def calls(self) -> list:
+        '''Names of the programs this program CALLs, in order of first appearance'''
+        ret = []
+        for ip in range(len(self)):
+            if self.opcodes[ip] == OPCODE.CALL and self.constants[self.operands[ip]] not in ret:
+                ret.append(self.constants[self.operands[ip]])
+        return ret
+
+    def disassemble(self) -> str:
+        '''Human-readable listing of the instruction stream'''
+        ret = f'PROGRAM "{self.name}"\n'
+        for ip in range(len(self)):
+            opcode = OPCODE(self.opcodes[ip])
+            operand = self.operands[ip]
+            if opcode in {OPCODE.LOAD, OPCODE.STORE, OPCODE.PROMPT}: comment = self.variables[operand]
+            elif opcode in {OPCODE.LOAD_ELEMENT, OPCODE.STORE_ELEMENT, OPCODE.LOAD_DIM, OPCODE.STORE_DIM, OPCODE.STORE_STRING, OPCODE.DISP_STR}: comment = self.array_variables[operand]
+            elif opcode in {OPCODE.PUSH_CONST, OPCODE.CALL}: comment = repr(self.constants[operand])
+            elif opcode == OPCODE.LABEL: comment = self.labels[operand]
+            elif opcode in MATH_OPCODES.values() and operand == MATH_FAST: comment = 'fast'
+            else: comment = ''
+            ret += f'{ip:>5} {opcode.name:<22}{operand:<6}{comment:<12}line {self.line_numbers[ip]}\n'
+        return ret
+
+    def __repr__(self):
+        return self.disassemble()
+
+
+class Assembler():
+    '''Assemble an AST into a Program'''
+
+    @classmethod
+    @measured('assemble', lambda program: {'instructions': len(program)})
+    def assemble(cls, tree:Node, fast_math:bool=False) -> Program:
+        '''Entry point of the assembler. Resolves types statically and emits the instruction stream.
+        With fast_math the math functions of REAL32 values use the reduced precision versions of mathlib'''
+        root_node:Node = tree
+        assert root_node.token.type == TOKEN_TYPE.PROG, f'Root node must be of type TT.PROG, got {root_node.token.type} instead'
+        program_node:Node = root_node.children[0]
+        assert program_node.token.type == TOKEN_TYPE.PROGRAM
+        program = Program(program_node.children[0].token.value.strip('"'))
+        cls.analyze_types(root_node, program)
+        gotos = []
+        cls.assemble_block(root_node, program, gotos)
+        program.emit(OPCODE.HALT)
+        # resolve labels now that all of them are known
+        for ip in gotos:
+            name = program.labels[program.operands[ip]]
+            if name not in program.label_table:
+                raise LoweringError(f"GOTO undefined label {name} on line {program.line_numbers[ip]}")
+            program.operands[ip] = program.label_table[name]
+        if fast_math:
+            math_opcodes = set(MATH_OPCODES.values())
+            for ip in range(len(program)):
+                if program.opcodes[ip] in math_opcodes:
+                    program.operands[ip] = MATH_FAST
+        return program
+
+    @classmethod
+    def compile(cls, source:str, fast_math:bool=False, table:typing.Optional[NodeTable]=None) -> Program:
+        '''Lex, parse and assemble the text of a program, which can then be executed any number of times.
+        With a table, identical expressions share their nodes while parsing, see NodeTable'''
+        from .parser import Parser # running a program image needs no parser
+        return cls.assemble(Parser.syntax_analysis(Parser.lexical_analysis(source), table), fast_math)
+
+    @classmethod
+    def analyze_types(cls, root_node:Node, program:Program):
+        '''Collect explicit and implicit type declarations. A variable has exactly one type for the whole program'''
+        for node in root_node.children:
+            tt = node.token.type
+            if tt in DATA_TYPES:
+                var = node.children[0].token.value.upper()
+                cls.declare(program, var, match_token_to_datatype(node.token), node.token.line_number)
+            elif tt == TOKEN_TYPE.IMPLICIT:
+                var = node.children[1].token.value.upper()
+                cls.declare(program, var, match_token_to_datatype(node.children[0].token), node.token.line_number)
+            elif tt == TOKEN_TYPE.IF:
+                cls.analyze_types(node.children[1], program)
+
+    @classmethod
+    def declare(cls, program:Program, var:str, dtype:Datatypes, line_number:int):
+        if var in program.type_map and program.type_map[var] != dtype:
+            raise LoweringError(f"{var} declared as {dtype.name} on line {line_number} but is already {program.type_map[var].name}")
+        program.type_map[var] = dtype
+        if var.startswith('@'): program.array_slot(var)
+        else: program.slot(var)
+
+    @classmethod
+    def variable_slot(cls, program:Program, var:str) -> int:
+        var = var.upper()
+        if var not in program.type_map:
+            program.type_map[var] = get_default_type(var)
+        return program.slot(var)
+
+    @classmethod
+    def array_variable_slot(cls, program:Program, a_var:str) -> int:
+        a_var = a_var.upper()
+        if a_var not in program.type_map:
+            program.type_map[a_var] = get_default_type(a_var[1:])
+        return program.array_slot(a_var)
+
+    @classmethod
+    def char_array_slot(cls, program:Program, a_var:str, line_number:int) -> int:
+        '''Slot of an array variable holding a string'''
+        slot = cls.array_variable_slot(program, a_var)
+        if program.type_map[a_var.upper()] != Datatypes.CHAR8:
+            raise LoweringError(f"{a_var} is {program.type_map[a_var.upper()].name}, strings need a CHAR8 array (line {line_number})")
+        return slot
+
+    @classmethod
+    def assemble_block(cls, root_node:Node, program:Program, gotos:list):
+        '''Emit the instructions of every statement in a PROG or BLOCK node'''
+        for node in root_node.children:
+            token:Token = node.token
+            children:list = node.children
+            line_number:int = token.line_number
+            if token.type == TOKEN_TYPE.ASSIGN and children[0].token.type == TOKEN_TYPE.ARRAY_VAR and children[0].is_leaf():
+                # a whole CHAR8 array from a string literal
+                value:Node = children[1]
+                while value.token.type == TOKEN_TYPE.EXPR and len(value.children) == 1:
+                    value = value.children[0]
+                if value.token.type != TOKEN_TYPE.STR_LIT:
+                    raise LoweringError(f"Only a string literal can be assigned to the whole array {children[0].token.value} on line {line_number}")
+                program.emit(OPCODE.PUSH_CONST, program.constant(value.token.value[1:-1], None), line_number)
+                program.emit(OPCODE.STORE_STRING, cls.char_array_slot(program, children[0].token.value, line_number), line_number)
+            elif token.type == TOKEN_TYPE.ASSIGN:
+                target:Node = children[0]
+                cls.assemble_expression(children[1], program, line_number)
+                if target.token.type == TOKEN_TYPE.VAR:
+                    program.emit(OPCODE.STORE, cls.variable_slot(program, target.token.value), line_number)
+                elif target.token.type == TOKEN_TYPE.ARRAY_VAR:
+                    cls.assemble_expression(target.children[0], program, line_number)
+                    program.emit(OPCODE.STORE_ELEMENT, cls.array_variable_slot(program, target.token.value), line_number)
+                elif target.token.type == TOKEN_TYPE.DIM:
+                    program.emit(OPCODE.STORE_DIM, cls.array_variable_slot(program, cls.dim_argument(target, line_number)), line_number)
+                else:
+                    raise LoweringError(f"Cannot assign to {target.token} on line {line_number}")
+            elif token.type == TOKEN_TYPE.IF:
+                jumps = cls.assemble_branch(children[0], program, False, line_number)
+                cls.assemble_block(children[1], program, gotos)
+                cls.patch(program, jumps)
+            elif token.type == TOKEN_TYPE.LABEL:
+                name = children[0].token.value.upper()
+                if name in program.label_table:
+                    raise LoweringError(f"Label {name} defined twice, again on line {line_number}")
+                program.label_table[name] = program.emit(OPCODE.LABEL, program.label(name), line_number)
+            elif token.type == TOKEN_TYPE.GOTO:
+                gotos.append(program.emit(OPCODE.JUMP, program.label(children[0].token.value.upper()), line_number))
+            elif token.type == TOKEN_TYPE.DISP:
+                c:Node = children[0]
+                if c.token.type == TOKEN_TYPE.STR_LIT:
+                    program.emit(OPCODE.PUSH_CONST, program.constant(c.token.value[1:-1], None), line_number)
+                else:
+                    cls.assemble_expression(c, program, line_number)
+                program.emit(OPCODE.DISP, 0, line_number)
+            elif token.type == TOKEN_TYPE.DISP_STR:
+                program.emit(OPCODE.DISP_STR, cls.char_array_slot(program, children[0].token.value, line_number), line_number)
+            elif token.type == TOKEN_TYPE.PROMPT:
+                program.emit(OPCODE.PROMPT, cls.variable_slot(program, children[0].token.value), line_number)
+            elif token.type == TOKEN_TYPE.CALL:
+                program.emit(OPCODE.CALL, program.constant(children[0].token.value.strip('"'), None), line_number)
+            elif token.type == TOKEN_TYPE.VERSION:
+                program.version = tuple(int(c.token.value) for c in children)
+            elif token.type in DATA_TYPES or token.type in {TOKEN_TYPE.IMPLICIT, TOKEN_TYPE.PROGRAM, TOKEN_TYPE.EXPR}:
+                pass # declarations are resolved statically, lone expressions have no effect
+            else:
+                raise LoweringError(f"Cannot assemble statement {token} on line {line_number}")
+
+    @classmethod
+    def dim_argument(cls, dim_node:Node, line_number:int) -> str:
+        '''The array variable inside of a DIM(@A) node'''
+        arg:Node = dim_node.children[0]
+        while arg.token.type == TOKEN_TYPE.EXPR and len(arg.children) == 1:
+            arg = arg.children[0]
+        if arg.token.type != TOKEN_TYPE.ARRAY_VAR or not arg.is_leaf():
+            raise LoweringError(f"DIM expects an array variable on line {line_number}, got {arg.token} instead")
+        return arg.token.value
+
+    @classmethod
+    def assemble_expression(cls, node:Node, program:Program, line_number:int):
+        '''Emit the postfix instructions of an EXPR node'''
+        tt = node.token.type
+        if tt == TOKEN_TYPE.EXPR:
+            if len(node.children) != 1:
+                raise LoweringError(f"Malformed expression on line {line_number}: {node.children}")
+            cls.assemble_expression(node.children[0], program, line_number)
+        elif tt in NUMERALS or tt == TOKEN_TYPE.CHAR_LIT:
+            dtype = match_literal_to_datatype(node.token)
+            if tt == TOKEN_TYPE.INT_LIT: value = int(node.token.value)
+            elif tt == TOKEN_TYPE.FLOAT_LIT: value = float(node.token.value)
+            else: value = ord(node.token.value[1])
+            program.emit(OPCODE.PUSH_CONST, program.constant(value, dtype), line_number)
+        elif tt == TOKEN_TYPE.VAR:
+            program.emit(OPCODE.LOAD, cls.variable_slot(program, node.token.value), line_number)
+        elif tt == TOKEN_TYPE.ARRAY_VAR:
+            if node.is_leaf():
+                raise LoweringError(f"Array {node.token.value} used without subscript on line {line_number}")
+            cls.assemble_expression(node.children[0], program, line_number)
+            program.emit(OPCODE.LOAD_ELEMENT, cls.array_variable_slot(program, node.token.value), line_number)
+        elif tt == TOKEN_TYPE.DIM:
+            program.emit(OPCODE.LOAD_DIM, cls.array_variable_slot(program, cls.dim_argument(node, line_number)), line_number)
+        elif tt in ARITHMETIC_OPCODES:
+            cls.assemble_expression(node.children[0], program, line_number)
+            cls.assemble_expression(node.children[1], program, line_number)
+            program.emit(ARITHMETIC_OPCODES[tt], 0, line_number)
+        elif tt in MATH_OPCODES:
+            cls.assemble_expression(node.children[0], program, line_number)
+            program.emit(MATH_OPCODES[tt], MATH_EXACT, line_number)
+        else:
+            raise LoweringError(f"Cannot assemble expression node {node.token} on line {line_number}")
+
+    @classmethod
+    def assemble_branch(cls, node:Node, program:Program, when:bool, line_number:int) -> list:
+        '''
+        Emit the instructions of a BOOL_EXPR or LOGIC_EXPR node as jumps, without computing its value.
+        Comparisons become compare and branch instructions, and the operands of AND, OR, NAND and NOR
+        are only evaluated until the result is known. Operands of XOR are always evaluated in full.
+        @Params
+            when:bool           The value of the condition for which the jumps are taken, otherwise execution falls through
+            line_number:int     Line of the statement, an interned condition may be shared by several lines
+        @Returns
+            list        Instruction pointers of the jumps, whose targets the caller sets with patch
+        '''
+        tt = node.token.type
+        if tt in {TOKEN_TYPE.BOOL_EXPR, TOKEN_TYPE.LOGIC_EXPR}:
+            return cls.assemble_branch(node.children[0], program, when, line_number)
+        if tt in COMPARISON_OPCODES:
+            cls.assemble_expression(node.children[0], program, line_number)
+            cls.assemble_expression(node.children[1], program, line_number)
+            unless = program.emit(BRANCH_OPCODES[COMPARISON_OPCODES[tt]], -1, line_number)
+            if not when:
+                return [unless]
+            jump = program.emit(OPCODE.JUMP, -1, line_number)
+            cls.patch(program, [unless])
+            return [jump]
+        if tt not in LOGICAL_OPCODES:
+            raise LoweringError(f"Cannot assemble condition node {node.token} on line {line_number}")
+        operands = cls.logical_operands(node, line_number)
+        if tt == TOKEN_TYPE.LOGICAL_NOT:
+            return cls.assemble_branch(operands[0], program, not when, line_number)
+        if tt == TOKEN_TYPE.LOGICAL_XOR:
+            cls.assemble_condition(operands[0], program, line_number)
+            cls.assemble_condition(operands[1], program, line_number)
+            return [program.emit(OPCODE.JUMP_UNLESS_EQUAL if when else OPCODE.JUMP_UNLESS_NOT_EQUAL, -1, line_number)]
+        # AND and NAND are decided by a false operand, OR and NOR by a true one
+        deciding = tt in {TOKEN_TYPE.LOGICAL_OR, TOKEN_TYPE.LOGICAL_NOR}
+        if (when != (tt in {TOKEN_TYPE.LOGICAL_NAND, TOKEN_TYPE.LOGICAL_NOR})) == deciding: # jump as soon as one operand decides
+            return cls.assemble_branch(operands[0], program, deciding, line_number) + cls.assemble_branch(operands[1], program, deciding, line_number)
+        decided = cls.assemble_branch(operands[0], program, deciding, line_number) # skips the second operand
+        jumps = cls.assemble_branch(operands[1], program, not deciding, line_number)
+        cls.patch(program, decided)
+        return jumps
+
+    @classmethod
+    def patch(cls, program:Program, jumps:list):
+        '''Point jumps at the next instruction to be emitted'''
+        for ip in jumps:
+            program.operands[ip] = len(program)
+
+    @classmethod
+    def logical_operands(cls, node:Node, line_number:int) -> list:
+        '''The conditions a logical operator applies to'''
+        tt = node.token.type
+        arity = 1 if tt == TOKEN_TYPE.LOGICAL_NOT else 2
+        if len(node.children) != arity:
+            raise LoweringError(f"{tt.value} expects {arity} parenthesized operand(s) on line {line_number}")
+        for c in node.children:
+            if c.token.type not in {TOKEN_TYPE.BOOL_EXPR, TOKEN_TYPE.LOGIC_EXPR}:
+                raise LoweringError(f"Operands of {tt.value} must be parenthesized conditions on line {line_number}")
+        return node.children
+
+    @classmethod
+    def assemble_condition(cls, node:Node, program:Program, line_number:int):
+        '''Emit the instructions of a BOOL_EXPR or LOGIC_EXPR node, leaving 1 or 0 on the stack, for the operands of XOR'''
+        tt = node.token.type
+        if tt in {TOKEN_TYPE.BOOL_EXPR, TOKEN_TYPE.LOGIC_EXPR}:
+            cls.assemble_condition(node.children[0], program, line_number)
+        elif tt in COMPARISON_OPCODES:
+            cls.assemble_expression(node.children[0], program, line_number)
+            cls.assemble_expression(node.children[1], program, line_number)
+            program.emit(COMPARISON_OPCODES[tt], 0, line_number)
+        elif tt in LOGICAL_OPCODES:
+            for c in cls.logical_operands(node, line_number):
+                cls.assemble_condition(c, program, line_number)
+            program.emit(LOGICAL_OPCODES[tt], 0, line_number)
+        else:
+            raise LoweringError(f"Cannot assemble condition node {node.token} on line {line_number}")
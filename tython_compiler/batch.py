@@ -0,0 +1,127 @@
+"""Define the batch runner
+Author: Ty Brennan
+"""
+
+import os, sys
+import io
+import json
+import time
+import pathlib
+import contextlib
+import multiprocessing
+import typing
+
+from .linker import Linker, ProgramCache
+from .jit import JIT
+from .interpreter import Interpreter
+from .quotas import Quotas
+from .error import QuotaExceededError
+
+
+class BatchJob(object):
+    '''One line of a manifest: a program, the input script its PROMPTs read from and the files its arrays map'''
+    def __init__(self, index:int, program:str, input:typing.Optional[str]=None, arrays:typing.Optional[dict]=None):
+        self.index:int = index
+        self.program:str = program
+        self.input:typing.Optional[str] = input
+        self.arrays:dict = arrays if arrays is not None else dict() # arrays["@A"] = path of the file backing @A
+
+    @classmethod
+    def read_manifest(cls, path:typing.Union[os.PathLike, str]) -> list:
+        '''
+        A manifest has one JSON object per line, {"program": "a.ty", "input": "a.in", "arrays": {"@A": "a.bin"}},
+        "input" and "arrays" being optional. Every file in "arrays" is memory-mapped as the array variable naming it.
+        Blank lines and lines starting with # are skipped, relative paths are relative to the manifest.
+        '''
+        path = pathlib.Path(path)
+        jobs = []
+        with open(path, 'r') as f:
+            for line_number, line in enumerate(f, 1):
+                if line.strip() == '' or line.lstrip().startswith('#'):
+                    continue
+                try:
+                    entry = json.loads(line)
+                    program = entry['program']
+                    arrays = {a_var.upper(): str(path.parent / file) for a_var, file in entry.get('arrays', {}).items()}
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    raise ValueError(f'{path}:{line_number}: expected {{"program": ..., "input": ...}}, got {line.strip()!r}') from None
+                input = entry.get('input')
+                jobs.append(cls(len(jobs), str(path.parent / program), str(path.parent / input) if input is not None else None, arrays))
+        return jobs
+
+
+class BatchWorker():
+    '''Runs jobs inside one process. Compiled programs, linkers and JIT regions stay warm between jobs'''
+    def __init__(self, jit:bool=True, quotas:typing.Optional[Quotas]=None):
+        self.interpreter:Interpreter = Interpreter(jit=JIT() if jit else None)
+        self.interpreter.quotas = quotas
+        self.linkers:dict = dict() # linkers["directory"] = Linker
+        self.programs:ProgramCache = ProgramCache()
+
+    def run(self, job:BatchJob) -> dict:
+        '''Run a job from a clean variable state and report its result'''
+        result = {'job': job.index, 'program': job.program, 'input': job.input}
+        output = io.StringIO()
+        start = time.perf_counter()
+        loaded = None
+        mapped = []
+        try:
+            program = self.programs.load(job.program)
+            loaded = time.perf_counter()
+            directory = os.path.dirname(job.program)
+            if directory not in self.linkers:
+                self.linkers[directory] = Linker([directory])
+            self.interpreter.linker = self.linkers[directory]
+            self.interpreter.clear_variables()
+            for a_var, path in job.arrays.items():
+                mapped.append(self.interpreter.map_array(a_var, path, program.type_map.get(a_var)))
+            with open(job.input, 'r') if job.input is not None else contextlib.nullcontext(io.StringIO()) as input_stream:
+                self.interpreter.input_stream = input_stream
+                self.interpreter.output_stream = output
+                self.interpreter.execute(program)
+            result['status'] = 'ok'
+        except Exception as e: # a job that fails for any reason is reported, the rest of the batch still runs
+            result['status'] = 'error'
+            result['error'] = f'{type(e).__name__}: {e}'
+            if isinstance(e, QuotaExceededError):
+                result['quota'] = e.quota
+        finally:
+            for a in mapped:
+                a.close()
+        end = time.perf_counter()
+        if loaded is None: loaded = end
+        result['output'] = output.getvalue()
+        result['timings'] = {'load': loaded - start, 'execute': end - loaded, 'total': end - start}
+        return result
+
+
+_worker:typing.Optional[BatchWorker] = None # one per process of the pool
+
+def _initialize_worker(jit:bool, quotas:typing.Optional[Quotas]):
+    global _worker
+    _worker = BatchWorker(jit, quotas)
+
+def _run_job(job:BatchJob) -> dict:
+    return _worker.run(job)
+
+
+def run_batch(manifest_path:typing.Union[os.PathLike, str], processes:typing.Optional[int]=None, jit:bool=True,
+              quotas:typing.Optional[Quotas]=None) -> typing.Iterator[dict]:
+    '''
+    @Params
+        manifest_path:str       The manifest of jobs, see BatchJob.read_manifest
+        processes:int           Size of the process pool, os.cpu_count() by default. 1 runs in this process
+        jit:bool                Whether workers compile hot loops to native code
+        quotas:Quotas           Limits of every job, None for no limits
+    @Returns
+        Iterator[dict]          One result per job, in order of completion: {"job", "program", "input", "status",
+                                "error"?, "quota"? (the exceeded quota), "output", "timings"}
+    '''
+    jobs = BatchJob.read_manifest(manifest_path)
+    if processes == 1:
+        worker = BatchWorker(jit, quotas)
+        for job in jobs:
+            yield worker.run(job)
+        return
+    with multiprocessing.Pool(processes, initializer=_initialize_worker, initargs=(jit, quotas)) as pool:
+        yield from pool.imap_unordered(_run_job, jobs)
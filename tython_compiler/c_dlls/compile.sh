@@ -1,3 +1,3 @@
 #!/bin/bash
-gcc -fPIC -shared -o integer_operators.so integer_operators.c -O3
-gcc -fPIC -shared -o float_operators.so float_operators.c -O3
+# one library for every arithmetic operator, loaded by datatypes.operator_library
+gcc -fPIC -shared -o operators.so integer_operators.c float_operators.c -O3 -fwrapv # integers wrap around like in C on every machine
@@ -16,7 +16,9 @@ i64 i64_negate(i64 i) {
 i64 i64_multiply(i64 i1, i64 i2) {
     return i1 * i2;
 }
+/* INT_MIN / -1 traps, it wraps around to INT_MIN like the other operators instead */
 i64 i64_divide(i64 i1, i64 i2) {
+    if (i2 == -1) return (i64)(0u - (uint64_t)i1);
     return i1 / i2;
 }
 
@@ -33,6 +35,7 @@ i32 i32_multiply(i32 i1, i32 i2) {
     return i1 * i2;
 }
 i32 i32_divide(i32 i1, i32 i2) {
+    if (i2 == -1) return (i32)(0u - (uint32_t)i1);
     return i1 / i2;
 }
 
@@ -49,5 +52,6 @@ i16 i16_multiply(i16 i1, i16 i2) {
     return i1 * i2;
 }
 i16 i16_divide(i16 i1, i16 i2) {
+    if (i2 == -1) return (i16)(0u - (uint16_t)i1);
     return i1 / i2;
 }
\ No newline at end of file
@@ -0,0 +1,154 @@
+"""Define the program Catalog
+Author: Ty Brennan
+"""
+
+import os, sys
+import re
+import json
+import hashlib
+import pathlib
+import typing
+
+from .image import ProgramImage, IMAGE_SUFFIX
+from .error import ImageError
+
+CATALOG_FORMAT_VERSION:int = 1
+SOURCE_SUFFIXES:tuple = ('.ty', IMAGE_SUFFIX)
+
+PROGRAM_PATTERN = re.compile(r'^\s*PROGRAM\s+"([^"]*)"', re.IGNORECASE)
+VERSION_PATTERN = re.compile(r'^\s*VERSION\s+(\d+)\s+(\d+)\s+(\d+)', re.IGNORECASE)
+CALL_PATTERN = re.compile(r'^\s*CALL\s+"([^"]*)"', re.IGNORECASE | re.MULTILINE)
+
+
+class CatalogEntry(object):
+    '''What the catalog knows about one program file'''
+    def __init__(self, path:str, name:typing.Optional[str], version:typing.Optional[tuple], mtime:float, size:int, hash:str, calls:list):
+        self.path:str = path
+        self.name:typing.Optional[str] = name
+        self.version:typing.Optional[tuple] = version
+        self.mtime:float = mtime
+        self.size:int = size
+        self.hash:str = hash
+        self.calls:list = calls
+
+    def to_dict(self) -> dict:
+        return {'path': self.path, 'name': self.name, 'version': self.version, 'mtime': self.mtime,
+                'size': self.size, 'hash': self.hash, 'calls': self.calls}
+
+    @classmethod
+    def from_dict(cls, d:dict) -> 'CatalogEntry':
+        return cls(d['path'], d['name'], tuple(d['version']) if d['version'] is not None else None,
+                   d['mtime'], d['size'], d['hash'], list(d['calls']))
+
+    def __repr__(self):
+        return f'CatalogEntry({self.name!r}, {self.path!r}, version={self.version})'
+
+
+class Catalog():
+    '''Index of every program in a directory tree: name -> path, version, mtime, content hash and CALL edges.
+    Files are never lexed, only their PROGRAM and VERSION header and CALL statements are matched line by line.
+    The index can be saved to disk and is updated incrementally, unchanged files (same mtime and size) are not read.'''
+    def __init__(self, root:typing.Union[os.PathLike, str], index_path:typing.Union[os.PathLike, str, None]=None, recursive:bool=True):
+        self.root:pathlib.Path = pathlib.Path(root)
+        self.index_path:typing.Optional[pathlib.Path] = pathlib.Path(index_path) if index_path is not None else None
+        self.recursive:bool = recursive
+        self.entries:dict = dict() # entries["path"] = CatalogEntry
+        self.names:dict = dict() # names["NAME"] = "path"
+        if self.index_path is not None and self.index_path.exists():
+            self.load()
+
+    @classmethod
+    def read_header(cls, text:str) -> tuple:
+        '''
+        @Returns
+            (name, version)     From the PROGRAM and VERSION statements, which have to precede every other statement
+        '''
+        name = version = None
+        for line in text.splitlines():
+            if line.strip() == '' or line.strip().startswith('#'):
+                continue
+            m = PROGRAM_PATTERN.match(line)
+            if m and name is None:
+                name = m.group(1)
+                continue
+            m = VERSION_PATTERN.match(line)
+            if m and version is None:
+                version = tuple(int(v) for v in m.groups())
+                continue
+            break # the header is over
+        return name, version
+
+    @classmethod
+    def read_entry(cls, path:pathlib.Path, stat:os.stat_result) -> CatalogEntry:
+        '''Catalog a single file'''
+        with open(path, 'rb') as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()
+        if path.suffix == IMAGE_SUFFIX:
+            try:
+                program = ProgramImage.loads(content, str(path))
+            except ImageError:
+                return CatalogEntry(str(path), None, None, stat.st_mtime, stat.st_size, digest, [])
+            return CatalogEntry(str(path), program.name, program.version, stat.st_mtime, stat.st_size, digest, program.calls())
+        text = content.decode('utf-8', errors='replace')
+        name, version = cls.read_header(text)
+        calls = []
+        for callee in CALL_PATTERN.findall(text):
+            if callee not in calls: calls.append(callee)
+        return CatalogEntry(str(path), name, version, stat.st_mtime, stat.st_size, digest, calls)
+
+    def files(self) -> typing.Iterator[pathlib.Path]:
+        '''Every program file under the root'''
+        for suffix in SOURCE_SUFFIXES:
+            yield from (self.root.rglob(f'*{suffix}') if self.recursive else self.root.glob(f'*{suffix}'))
+
+    def update(self) -> int:
+        '''Bring the index up to date with the tree, returns the number of files that had to be read'''
+        entries = dict()
+        read = 0
+        for path in sorted(self.files()):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entry = self.entries.get(str(path))
+            if entry is None or entry.mtime != stat.st_mtime or entry.size != stat.st_size:
+                entry = self.read_entry(path, stat)
+                read += 1
+            entries[str(path)] = entry
+        self.entries = entries
+        self.index_names()
+        return read
+
+    def index_names(self):
+        '''Rebuild the name -> path map, the first file (in path order) declaring a name wins'''
+        self.names = dict()
+        for path, entry in sorted(self.entries.items()):
+            if entry.name is not None:
+                self.names.setdefault(entry.name, path)
+
+    def lookup(self, name:str) -> typing.Optional[CatalogEntry]:
+        '''The entry of the program called name, None if there is none'''
+        path = self.names.get(name)
+        return self.entries[path] if path is not None else None
+
+    def call_graph(self) -> dict:
+        '''graph["NAME"] = names of the programs it CALLs'''
+        return {name: self.entries[path].calls for name, path in self.names.items()}
+
+    def load(self):
+        '''Read the index from index_path. An index of another format version is ignored'''
+        with open(self.index_path, 'r') as f:
+            index = json.load(f)
+        if index.get('version') != CATALOG_FORMAT_VERSION or index.get('root') != str(self.root):
+            return
+        self.entries = {d['path']: CatalogEntry.from_dict(d) for d in index['entries']}
+        self.index_names()
+
+    def save(self):
+        '''Write the index to index_path, atomically'''
+        temporary_path = self.index_path.with_name(self.index_path.name + '.tmp')
+        with open(temporary_path, 'w') as f:
+            json.dump({'version': CATALOG_FORMAT_VERSION, 'root': str(self.root),
+                       'entries': [e.to_dict() for e in self.entries.values()]}, f)
+        os.replace(temporary_path, self.index_path)
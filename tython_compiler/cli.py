@@ -0,0 +1,64 @@
+"""Define the command line arguments shared by main.py and client.py
+Author: Ty Brennan
+"""
+
+import argparse
+
+VERSION:tuple = (-1, 1, 0)
+
+def build_argument_parser() -> argparse.ArgumentParser:
+    '''Arguments of the compiler CLI. Only depends on the standard library so that the thin client starts fast'''
+    parser = argparse.ArgumentParser(description=f'TYTHON Compiler {VERSION}')
+    parser.add_argument('input_file', nargs='?')
+    parser.add_argument('-o', '--output')
+    parser.add_argument('-c', '--compile', action='store_true', default=False)
+    parser.add_argument('-i', '--interpret', action='store_true', default=False)
+    parser.add_argument('--no-jit', action='store_true', default=False,
+                        help='never compile hot loops to native code while interpreting')
+    parser.add_argument('--batch', action='store_true', default=False,
+                        help='treat input_file as a manifest of jobs and stream their results as JSON lines')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes in batch mode (default: one per CPU)')
+    parser.add_argument('--lanes', metavar='MATRIX',
+                        help='run input_file once per row of the whitespace separated MATRIX, row k feeding the PROMPTs '
+                             'of lane k, and print one JSON line per lane (needs NumPy)')
+    parser.add_argument('--profile', metavar='JSON', nargs='?', const=True, default=None,
+                        help='count and time every line, label and jump while interpreting, print the hot spots and '
+                             'write the profile to JSON (default: input_file with suffix .profile.json)')
+    parser.add_argument('--pgo', metavar='PROFILE',
+                        help='optimize with a profile written by --profile: hot code laid out together, branch hints '
+                             'for the C compiler and hot loops compiled on first entry')
+    parser.add_argument('--fast-math', action='store_true', default=False,
+                        help='reduced precision SIN, COS, TAN, COT, SEC, CSC, ARCTAN and ARCCOT of REAL32 values, '
+                             'a few units in the last place off but faster in native code')
+    parser.add_argument('--hash-cons', action='store_true', default=False,
+                        help='share the nodes of identical expressions in the AST, less memory for generated programs '
+                             'repeating the same expressions')
+    parser.add_argument('--metrics', choices=('json', 'text'),
+                        help='record wall time, allocations and item counts of every compiler phase and print them to '
+                             'standard error at exit')
+    parser.add_argument('--max-instructions', type=int, metavar='N',
+                        help='stop a program once it has executed N instructions, checked at every label')
+    parser.add_argument('--max-seconds', type=float, metavar='S',
+                        help='stop a program once it has run for S seconds of wall time, checked at every label')
+    parser.add_argument('--max-array-bytes', type=int, metavar='BYTES',
+                        help='stop a program that resizes its arrays to more than BYTES bytes in total')
+    parser.add_argument('--memory-report', choices=('json', 'text'), nargs='?', const='text',
+                        help='print the bytes used by every variable, array, compiled program, token stream and AST, '
+                             'declared and allocated, and the high-water marks of the run to standard error at exit')
+    parser.add_argument('--map-array', metavar='@A=FILE', action='append', default=[],
+                        help='back array variable @A with FILE, raw elements of its datatype in native byte order, '
+                             'memory-mapped so the program reads and writes the file in place (repeatable)')
+    parser.add_argument('--state', metavar='SNAPSHOT',
+                        help='restore variables from SNAPSHOT before interpreting and save them to it afterwards')
+    parser.add_argument('--catalog', metavar='INDEX',
+                        help='resolve CALLs through a catalog of the program directory tree, kept up to date in INDEX')
+    parser.add_argument('--serve', action='store_true', default=False,
+                        help='run the resident interpreter daemon, see client.py')
+    parser.add_argument('--socket', metavar='PATH',
+                        help='Unix socket of the daemon (default: $TYTHON_SOCKET or one per user in the temp directory)')
+
+    parser.add_argument('--debug', action='store_true', default=False)
+    parser.add_argument('-v', '--version', action='version',
+                        version=f'Tython {VERSION[-1]}.{VERSION[1]}.{VERSION[2]}')
+    return parser
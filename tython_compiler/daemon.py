@@ -0,0 +1,167 @@
+"""Define the resident interpreter daemon
+Author: Ty Brennan
+"""
+
+import os, sys
+import io
+import copy
+import time
+import signal
+import socket
+import threading
+import socketserver
+import typing
+
+from .linker import Linker, ProgramCache
+from .catalog import Catalog
+from .jit import JIT
+from .interpreter import Interpreter
+from .snapshot import Snapshot
+from .protocol import send_frame, receive_frame, ProtocolError, DEFAULT_SOCKET_PATH
+
+
+class SharedState(object):
+    '''Variables of a --state snapshot, kept in memory between requests and written through to disk'''
+    def __init__(self, path:str):
+        self.path:str = path
+        self.lock:threading.Lock = threading.Lock() # requests on the same state run one after another
+        self.reload()
+
+    def reload(self):
+        '''Replace the variables in memory by those of the snapshot, e.g. after a run that failed partway'''
+        if os.path.exists(self.path):
+            self.variables, self.array_variables, self.type_map = Snapshot.load(self.path)
+        else:
+            self.variables, self.array_variables, self.type_map = dict(), dict(), dict()
+
+
+class ClientInput(object):
+    '''Input stream of a request, every line is asked from the client when a PROMPT needs it'''
+    def __init__(self, connection:socket.socket):
+        self.connection:socket.socket = connection
+
+    def readline(self) -> str:
+        send_frame(self.connection, {'input': True})
+        message = receive_frame(self.connection)
+        if message is None:
+            raise ProtocolError('Client closed the connection while its program was waiting for input')
+        return message.get('line') or ''
+
+
+class Daemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    '''Hold compiled programs, JIT libraries and snapshot states in memory and run requests for clients.
+    Every request gets its own Interpreter, so concurrent clients never see each other's variables.
+
+    Request:    {"program": "/abs/a.ty", "no_jit": false, "state": "/abs/s.tys" | null, "catalog": "/abs/i.json" | null}
+    Input:      {"input": true} from the daemon, answered by {"line": "..."}, for every PROMPT
+    Response:   {"status": "ok" | "error", "output": "...", "error"?: "...", "timings": {"load", "execute", "total"}}'''
+    daemon_threads = True
+
+    def __init__(self, socket_path:str=DEFAULT_SOCKET_PATH):
+        self.socket_path:str = socket_path
+        self.jit:JIT = JIT()
+        self.programs:ProgramCache = ProgramCache()
+        self.catalogs:dict = dict() # catalogs[("directory", "index")] = Catalog
+        self.states:dict = dict() # states["path"] = SharedState
+        self.lock:threading.Lock = threading.Lock()
+        self.remove_stale_socket()
+        super().__init__(socket_path, DaemonHandler)
+
+    def remove_stale_socket(self):
+        '''A socket left behind by a daemon that died is removed, one that still answers is an error'''
+        if not os.path.exists(self.socket_path):
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(self.socket_path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.remove(self.socket_path)
+                return
+        raise OSError(f'A daemon is already listening on {self.socket_path}')
+
+    def linker(self, directory:str, index_path:typing.Optional[str]) -> Linker:
+        '''A Linker for one request, so CALLed programs are as fresh as with main.py: they are compiled through
+        the shared ProgramCache, which recompiles edited files, and the catalog is updated to see new files'''
+        with self.lock:
+            key = (directory, index_path)
+            catalog = self.catalogs.get(key)
+            if catalog is None:
+                catalog = Catalog(directory, index_path) if index_path is not None else Catalog(directory, recursive=False)
+                self.catalogs[key] = catalog
+            paths = catalog.entries.keys()
+            if (catalog.update() or catalog.entries.keys() != paths) and index_path is not None:
+                catalog.save()
+            # update() replaces the entries instead of changing them, so the copy stays consistent for this request
+            return Linker([directory], copy.copy(catalog), self.programs)
+
+    def state(self, path:str) -> SharedState:
+        with self.lock:
+            if path not in self.states:
+                self.states[path] = SharedState(path)
+            return self.states[path]
+
+    def run(self, message:dict, input_stream:typing.TextIO) -> dict:
+        '''Handle one request'''
+        output = io.StringIO()
+        start = time.perf_counter()
+        loaded = None
+        try:
+            path = message['program']
+            program = self.programs.load(path)
+            linker = self.linker(os.path.dirname(path), message.get('catalog'))
+            loaded = time.perf_counter()
+            interpreter = Interpreter(jit=None if message.get('no_jit') else self.jit, linker=linker)
+            interpreter.clear_variables()
+            interpreter.input_stream = input_stream
+            interpreter.output_stream = output
+            if message.get('state') is None:
+                interpreter.execute(program)
+            else:
+                state = self.state(message['state'])
+                with state.lock:
+                    interpreter.variables, interpreter.array_variables, interpreter.type_map = state.variables, state.array_variables, state.type_map
+                    try:
+                        interpreter.execute(program)
+                        Snapshot.dump(state.path, state.variables, state.array_variables, state.type_map)
+                    except BaseException:
+                        state.reload() # only successful runs reach the snapshot, the next request must not see this one
+                        raise
+            response = {'status': 'ok'}
+        except (KeyError, TypeError) as e:
+            response = {'status': 'error', 'error': f'Malformed request: {e!r}'}
+        except Exception as e: # whatever a request raises is its error response, the daemon keeps serving
+            response = {'status': 'error', 'error': f'{type(e).__name__}: {e}'}
+        end = time.perf_counter()
+        if loaded is None: loaded = end
+        response['output'] = output.getvalue()
+        response['timings'] = {'load': loaded - start, 'execute': end - loaded, 'total': end - start}
+        return response
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+class DaemonHandler(socketserver.BaseRequestHandler):
+    '''One client connection, which may send any number of requests'''
+    def handle(self):
+        while True:
+            try:
+                message = receive_frame(self.request)
+            except (ProtocolError, ValueError) as e:
+                send_frame(self.request, {'status': 'error', 'error': f'ProtocolError: {e}', 'output': ''})
+                return
+            if message is None:
+                return
+            send_frame(self.request, self.server.run(message, ClientInput(self.request)))
+
+
+def serve(socket_path:typing.Optional[str]=None):
+    '''Run the daemon until interrupted or terminated'''
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0)) # removes the socket on the way out
+    with Daemon(socket_path or DEFAULT_SOCKET_PATH) as daemon:
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
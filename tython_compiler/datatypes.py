@@ -1,18 +1,19 @@
 import os, sys
-import functools
-import time
 import enum
+import math
 import typing
-import re
 import abc
 import ctypes
+import array
+import mmap
 
-from pprint import pprint
 from .token_types import *
 from .token import Token
-from .node import Node
 from .error import InterpreterError
 
+OPERATOR_LIBRARY_PATH:str = os.path.join(os.path.dirname(__file__), 'c_dlls', 'operators.so') # built by compile.sh
+_operator_library:typing.Union[ctypes.CDLL, bool, None] = None # False once it turned out to be unavailable
+
 @enum.unique
 class Datatypes(enum.Enum):
     INT32 = enum.auto()
@@ -54,6 +55,118 @@ def get_default_type(var:str) -> Datatypes:
     else:
         return Datatypes.REAL32
 
+def match_literal_to_datatype(token) -> Datatypes:
+    '''
+    @Params
+        token:Token
+            A numeral literal token
+    @Returns
+        Datatypes
+            The narrowest datatype that can hold the literal
+    '''
+    assert isinstance(token, Token)
+    t = token.type
+    if t == TOKEN_TYPE.INT_LIT:
+        value = int(token.value)
+        if -2**31 <= value < 2**31:
+            return Datatypes.INT32
+        elif -2**63 <= value < 2**63:
+            return Datatypes.INT64
+        raise ValueError(f"Integer literal {value} does not fit in 64 bits")
+    elif t == TOKEN_TYPE.FLOAT_LIT:
+        return Datatypes.REAL32
+    elif t == TOKEN_TYPE.CHAR_LIT:
+        return Datatypes.CHAR8
+    else:
+        raise ValueError("Token is not a numeral literal")
+
+# Arithmetic follows the usual arithmetic conversions of C: CHAR8 is widened to INT32
+# and the operand that is further along this list decides the type of the result
+PROMOTION_ORDER:list = [
+    Datatypes.INT32,
+    Datatypes.INT64,
+    Datatypes.REAL32,
+    Datatypes.REAL64,
+]
+INTEGER_DATATYPES:set = {
+    Datatypes.INT32,
+    Datatypes.INT64,
+    Datatypes.CHAR8,
+}
+
+def promote_datatypes(d1:Datatypes, d2:Datatypes) -> Datatypes:
+    '''
+    @Params
+        d1:Datatypes, d2:Datatypes
+            The datatypes of the two operands of an arithmetic operation
+    @Returns
+        Datatypes
+            The datatype the operation is carried out in
+    '''
+    if d1 == Datatypes.CHAR8: d1 = Datatypes.INT32
+    if d2 == Datatypes.CHAR8: d2 = Datatypes.INT32
+    return max(d1, d2, key=PROMOTION_ORDER.index)
+
+def operator_library() -> typing.Optional[ctypes.CDLL]:
+    '''The shared library of the arithmetic operators, loaded once on first use. None if it was not built (see
+    c_dlls/compile.sh) or TYTHON_PURE_PYTHON is set, arithmetic then runs in Python with the same results'''
+    global _operator_library
+    if _operator_library is None:
+        try:
+            if os.environ.get('TYTHON_PURE_PYTHON'):
+                raise OSError('disabled by TYTHON_PURE_PYTHON')
+            _operator_library = ctypes.CDLL(OPERATOR_LIBRARY_PATH)
+        except OSError:
+            _operator_library = False
+    return _operator_library or None
+
+def _divide_integers(a:int, b:int) -> int:
+    '''Division truncating toward zero, like C'''
+    quotient = abs(a) // abs(b)
+    return quotient if (a < 0) == (b < 0) else -quotient
+
+def _divide_reals(a:float, b:float) -> float:
+    '''IEEE 754 division, infinite or NaN instead of ZeroDivisionError'''
+    try:
+        return a / b
+    except ZeroDivisionError:
+        if a == 0 or math.isnan(a):
+            return math.nan
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+
+# Python versions of the operators of the library. Results are wrapped (integers) or rounded (REAL32) to the
+# datatype when the value is constructed, which gives the same result as the C operation
+PYTHON_OPERATORS:dict = {
+    'add': lambda a, b: a.value + b.value,
+    'subtract': lambda a, b: a.value - b.value,
+    'multiply': lambda a, b: a.value * b.value,
+    'negate': lambda a: -a.value,
+    'integer_divide': lambda a, b: _divide_integers(a.value, b.value),
+    'divide': lambda a, b: _divide_reals(a.value, b.value),
+}
+
+class _Operator(object):
+    '''An arithmetic function of a datatype class, resolved on first use so that importing loads no library'''
+    def __init__(self, operation:str, arity:int=2):
+        self.operation:str = operation
+        self.arity:int = arity
+
+    def __set_name__(self, owner:type, name:str):
+        self.name:str = name
+
+    def __get__(self, instance, owner:type):
+        library = operator_library()
+        if library is not None:
+            function = getattr(library, f'{owner._symbol_prefix}_{self.operation}')
+            function.argtypes = (owner._type,) * self.arity
+            function.restype = owner._type
+        elif self.operation == 'divide' and owner._meta_dtype in INTEGER_DATATYPES:
+            function = PYTHON_OPERATORS['integer_divide']
+        else:
+            function = PYTHON_OPERATORS[self.operation]
+        setattr(owner, self.name, staticmethod(function)) # later lookups find the function itself
+        return function
+
 class DType(abc.ABC):
     '''Abstract Data Type Base-Class'''
     @property
@@ -107,13 +220,21 @@ class Integer(DType):
     def type(self):
         return self._type
 
+    def true_repr(self):
+        '''Representation used by DISP'''
+        return str(self.data.value)
+
     def add(self, other:'Integer'):
         return self.__class__(self._add_function(self.data, other.data))
     def subtract(self, other:'Integer'):
-        return self.__class__(self._sub_function(self.data, other.data))
+        return self.__class__(self._subtract_function(self.data, other.data))
     def multiply(self, other:'Integer'):
         return self.__class__(self._multiply_function(self.data, other.data))
     def devide(self, other:'Integer'):
+        if other.data.value == 0:
+            raise InterpreterError('integer division by zero')
+        if other.data.value == -1: # the minimum / -1 traps in C, it wraps around like the negation
+            return self.__class__(self._negate_function(self.data))
         return self.__class__(self._divide_function(self.data, other.data))
     def negate(self):
         return self.__class__(self._negate_function(self.data))
@@ -140,57 +261,41 @@ class Integer(DType):
         return cls(cls._multiply_function(i1.data, i2.data))
     @classmethod
     def static_divide(cls, i1:'Integer', i2:'Integer'):
-        return cls(cls._divide_function(i1.data, i2.data))
+        return i1.devide(i2)
     @classmethod
     def static_negate(cls, i:'Integer'):
-        return cls(cls._negate_function(i))
+        return cls(cls._negate_function(i.data))
 
 
 class Integer32(Integer):
     _size = 4
     _meta_dtype = Datatypes.INT32
     _type = ctypes.c_int32
-    _cdll = ctypes.CDLL(os.path.join(os.path.dirname(__file__), 'c_dlls/integer_operators.so'))
-    _add_function = _cdll.i32_add
-    _add_function.argtypes = (ctypes.c_int32, ctypes.c_int32)
-    _negate_function = _cdll.i32_negate
-    _negate_function.argtypes = (ctypes.c_int32, ctypes.c_int32)
-    _subtract_function = _cdll.i32_subtract
-    _subtract_function.argtypes = (ctypes.c_int32, ctypes.c_int32)
-    _multiply_function = _cdll.i32_multiply
-    _multiply_function.argtypes = (ctypes.c_int32, ctypes.c_int32)
-    _divide_function = _cdll.i32_divide
-    _divide_function.argtypes = (ctypes.c_int32, ctypes.c_int32)
+    _symbol_prefix = 'i32'
+    _add_function = _Operator('add')
+    _negate_function = _Operator('negate', 1)
+    _subtract_function = _Operator('subtract')
+    _multiply_function = _Operator('multiply')
+    _divide_function = _Operator('divide')
 
     def __init__(self, data, /, readonly=False):
         super().__init__(data, readonly)
 
-    def true_repr(self):
-        return repr(repr(self.data)[len("c_long")+1:-1])
-
 
 class Integer64(Integer):
     _size = 8
     _meta_dtype = Datatypes.INT64
     _type = ctypes.c_int64
-    _cdll = ctypes.CDLL(os.path.join(os.path.dirname(__file__), 'c_dlls/integer_operators.so'))
-    _add_function = _cdll.i64_add
-    _add_function.argtypes = (ctypes.c_int64, ctypes.c_int64)
-    _negate_function = _cdll.i64_negate
-    _negate_function.argtypes = (ctypes.c_int64, ctypes.c_int64)
-    _subtract_function = _cdll.i64_subtract
-    _subtract_function.argtypes = (ctypes.c_int64, ctypes.c_int64)
-    _multiply_function = _cdll.i64_multiply
-    _multiply_function.argtypes = (ctypes.c_int64, ctypes.c_int64)
-    _divide_function = _cdll.i64_divide
-    _divide_function.argtypes = (ctypes.c_int64, ctypes.c_int64)
+    _symbol_prefix = 'i64'
+    _add_function = _Operator('add')
+    _negate_function = _Operator('negate', 1)
+    _subtract_function = _Operator('subtract')
+    _multiply_function = _Operator('multiply')
+    _divide_function = _Operator('divide')
 
     def __init__(self, data, /, readonly=False):
         super().__init__(data, readonly)
 
-    def true_repr(self):
-        return repr(repr(self.data)[len("c_long_long")+1:-1])
-
 class Float(DType):
     '''Base class handling operations on Floats'''
     def __init__(self, data, /, readonly:bool=False):
@@ -223,14 +328,27 @@ class Float(DType):
     def type(self):
         return self._type
 
+    def true_repr(self):
+        '''Shortest representation that reads back as the same value, used by DISP.
+        Whole numbers below 10**precision are written out instead of in scientific notation'''
+        value = self.data.value
+        for precision in range(1, self._precision+1):
+            ret = '%.*g' % (precision, value)
+            if self._type(float(ret)).value == value: break
+        if 'e' in ret:
+            exponent = int(ret[ret.index('e')+1:])
+            if 0 <= exponent < self._precision:
+                ret = '%.*g' % (max(precision, exponent+1), value)
+        return ret
+
     def add(self, other:'Float'):
         return self.__class__(self._add_function(self.data, other.data))
     def subtract(self, other:'Float'):
-        return self.__class__(self._sub_function(self.data, other.data))
+        return self.__class__(self._subtract_function(self.data, other.data))
     def multiply(self, other:'Float'):
         return self.__class__(self._multiply_function(self.data, other.data))
     def devide(self, other:'Float'):
-        return self.__class__(self._devide_function(self.data, other.data))
+        return self.__class__(self._divide_function(self.data, other.data))
     def negate(self):
         return self.__class__(self._negate_function(self.data))
 
@@ -240,7 +358,7 @@ class Float(DType):
         return self.subtract(other)
     def __mul__(self, other:'Float'):
         return self.multiply(other)
-    def __div__(self, other:'Float'):
+    def __truediv__(self, other:'Float'):
         return self.devide(other)
     def __neg__(self):
         return self.negate()
@@ -259,45 +377,34 @@ class Float(DType):
         return cls(cls._divide_function(f1.data, f2.data))
     @classmethod
     def static_negate(cls, i:'Float'):
-        return cls(cls._negate_function(i))
+        return cls(cls._negate_function(i.data))
 
 class Float32(Float):
     _size = 4
     _meta_dtype = Datatypes.REAL32
     _type = ctypes.c_float
-    _cdll = ctypes.CDLL(os.path.join(os.path.dirname(__file__), 'c_dlls/float_operators.so'))
-    _add_function = _cdll.f32_add
-    _add_function.argtypes = (ctypes.c_float, ctypes.c_float)
-    _negate_function = _cdll.f32_negate
-    _negate_function.argtypes = (ctypes.c_float, ctypes.c_float)
-    _subtract_function = _cdll.f32_subtract
-    _subtract_function.argtypes = (ctypes.c_float, ctypes.c_float)
-    _multiply_function = _cdll.f32_multiply
-    _multiply_function.argtypes = (ctypes.c_float, ctypes.c_float)
-    _divide_function = _cdll.f32_divide
-    _divide_function.argtypes = (ctypes.c_float, ctypes.c_float)
+    _precision = 9
+    _symbol_prefix = 'f32'
+    _add_function = _Operator('add')
+    _negate_function = _Operator('negate', 1)
+    _subtract_function = _Operator('subtract')
+    _multiply_function = _Operator('multiply')
+    _divide_function = _Operator('divide')
 
     def __init__(self, data, /, readonly=False):
         super().__init__(data, readonly)
-    def true_repr(self):
-        return repr(repr(self.data)[len("c_float")+1:-1])
-    
 
 class Float64(Float):
     _size = 8
     _meta_dtype = Datatypes.REAL64
     _type = ctypes.c_double
-    _cdll = ctypes.CDLL(os.path.join(os.path.dirname(__file__), 'c_dlls/float_operators.so'))
-    _add_function = _cdll.f64_add
-    _add_function.argtypes = (ctypes.c_double, ctypes.c_double)
-    _negate_function = _cdll.f64_negate
-    _negate_function.argtypes = (ctypes.c_double, ctypes.c_double)
-    _subtract_function = _cdll.f64_subtract
-    _subtract_function.argtypes = (ctypes.c_double, ctypes.c_double)
-    _multiply_function = _cdll.f64_multiply
-    _multiply_function.argtypes = (ctypes.c_double, ctypes.c_double)
-    _divide_function = _cdll.f64_divide
-    _divide_function.argtypes = (ctypes.c_float, ctypes.c_float)
+    _precision = 17
+    _symbol_prefix = 'f64'
+    _add_function = _Operator('add')
+    _negate_function = _Operator('negate', 1)
+    _subtract_function = _Operator('subtract')
+    _multiply_function = _Operator('multiply')
+    _divide_function = _Operator('divide')
 
     def __init__(self, data, /, readonly=False):
         super().__init__(data, readonly)
@@ -305,7 +412,7 @@ class Float64(Float):
 class Char8(DType):
     _size = 1
     _meta_dtype = Datatypes.CHAR8
-    _type = int
+    _type = ctypes.c_uint8
     def __init__(self, data, /, readonly:bool=False):
         if isinstance(data, self._type):
             self._data = data
@@ -334,4 +441,230 @@ class Char8(DType):
         return self._meta_dtype
     @property
     def type(self):
-        return self._type
\ No newline at end of file
+        return self._type
+
+    def true_repr(self):
+        '''Representation used by DISP'''
+        return str(self.data.value)
+
+DATATYPE_CLASSES:dict = {
+    Datatypes.INT32: Integer32,
+    Datatypes.INT64: Integer64,
+    Datatypes.REAL32: Float32,
+    Datatypes.REAL64: Float64,
+    Datatypes.CHAR8: Char8,
+}
+
+def make_value(dtype:Datatypes, data=0) -> DType:
+    '''
+    @Params
+        dtype:Datatypes     The datatype of the value
+        data:int | float    The python value, wrapped or rounded to fit the datatype
+    '''
+    if dtype in INTEGER_DATATYPES and isinstance(data, float):
+        try:
+            data = int(data) # truncate toward zero, like C
+        except (ValueError, OverflowError):
+            raise InterpreterError(f'Cannot convert {data} to {dtype.name}')
+    return DATATYPE_CLASSES[dtype](data)
+
+def convert(value:DType, dtype:Datatypes) -> DType:
+    '''Convert a value to another datatype, following C conversion rules'''
+    if value.meta_dtype == dtype:
+        return value
+    return make_value(dtype, value.data.value)
+
+def promote(lhs:DType, rhs:DType) -> tuple:
+    '''Convert both operands of an arithmetic operation to their common datatype'''
+    dtype = promote_datatypes(lhs.meta_dtype, rhs.meta_dtype)
+    return convert(lhs, dtype), convert(rhs, dtype)
+
+ARRAY_TYPECODES:dict = {
+    Datatypes.INT32: 'i',
+    Datatypes.INT64: 'q',
+    Datatypes.REAL32: 'f',
+    Datatypes.REAL64: 'd',
+    Datatypes.CHAR8: 'B',
+}
+# kind of the elements of a buffer by struct format character: signed, unsigned or floating point
+FORMAT_KINDS:dict = {**dict.fromkeys('bhilqn', 'i'), **dict.fromkeys('BHILQNc', 'u'), **dict.fromkeys('efd', 'f')}
+BUFFER_KINDS:dict = { # BUFFER_KINDS[Datatypes.[...]] = element kinds a bound buffer may have
+    Datatypes.INT32: 'i',
+    Datatypes.INT64: 'i',
+    Datatypes.REAL32: 'f',
+    Datatypes.REAL64: 'f',
+    Datatypes.CHAR8: 'iu',
+}
+
+MAP_MODES:dict = { # MAP_MODES["mode"] = (mode the file is opened in, access of its mapping)
+    'r+': ('r+b', mmap.ACCESS_WRITE), # writes go to the file
+    'w+': ('w+b', mmap.ACCESS_WRITE), # the file is created or overwritten with zeros
+    'c': ('rb', mmap.ACCESS_COPY), # copy-on-write, writes stay in memory
+}
+
+def buffer_datatype(view:memoryview) -> typing.Optional[Datatypes]:
+    '''The datatype whose elements have the format of a buffer, None if there is none'''
+    kind = FORMAT_KINDS.get(view.format.lstrip('@=' + ('<' if sys.byteorder == 'little' else '>')))
+    for dtype, typecode in ARRAY_TYPECODES.items():
+        if kind in BUFFER_KINDS[dtype] and view.itemsize == array.array(typecode).itemsize:
+            return dtype
+    return None
+
+class Array(object):
+    '''Homogeneous array variable backed by one contiguous buffer of its datatype. CHAR8 arrays hold strings and
+    are backed by a bytearray, so text goes in and out as bytes without a conversion per character. An array made
+    by from_buffer shares the memory of a caller's buffer, e.g. a NumPy array, and one made by map_file the memory of
+    a mapped file. Both keep their dimension'''
+    def __init__(self, dtype:Datatypes, dim:int=0):
+        assert isinstance(dtype, Datatypes)
+        self.dtype:Datatypes = dtype
+        self.buffer = bytearray() if dtype == Datatypes.CHAR8 else array.array(ARRAY_TYPECODES[dtype])
+        self.mapping:typing.Optional[mmap.mmap] = None # the file mapped by map_file
+        self.resize(dim)
+
+    @classmethod
+    def from_buffer(cls, obj, dtype:typing.Optional[Datatypes]=None) -> 'Array':
+        '''
+        An array over the memory of a writable, C-contiguous buffer, without copying it. Multidimensional buffers
+        are seen flat, in C order
+        @Params
+            obj                 Any object supporting the buffer protocol, e.g. a NumPy array, array.array or bytearray
+            dtype:Datatypes     The datatype of the array, by default the one matching the format of the buffer
+        '''
+        view = memoryview(obj)
+        if view.readonly or not view.c_contiguous:
+            raise TypeError('Arrays can only be bound to writable, C-contiguous buffers')
+        if dtype is None:
+            dtype = buffer_datatype(view)
+            if dtype is None:
+                raise TypeError(f'No array datatype has elements of format {view.format!r} and size {view.itemsize}')
+        elif buffer_datatype(view) != dtype and not (dtype == Datatypes.CHAR8 and view.itemsize == 1):
+            raise TypeError(f'A {dtype.name} array cannot be bound to a buffer of format {view.format!r} and size {view.itemsize}')
+        a = cls.__new__(cls)
+        a.dtype = dtype
+        a.buffer = view.cast('B').cast(ARRAY_TYPECODES[dtype])
+        a.mapping = None
+        return a
+
+    @classmethod
+    def map_file(cls, path:typing.Union[os.PathLike, str], dtype:Datatypes, dim:typing.Optional[int]=None, mode:str='r+') -> 'Array':
+        '''
+        An array over a memory-mapped file of raw elements of its datatype in native byte order, as written by
+        numpy.ndarray.tofile. Pages are read on demand, so the file may be larger than memory
+        @Params
+            dim:int     The number of elements, by default as many as the file holds. A shorter file is extended
+                        with zeros, except in mode 'c'
+            mode:str    'r+' writes through to the file, 'w+' creates or overwrites the file with dim zeros and 'c'
+                        maps it copy-on-write, so writes never reach the file
+        '''
+        if mode not in MAP_MODES:
+            raise ValueError(f"Mode must be one of {', '.join(MAP_MODES)}, got {mode!r}")
+        open_mode, access = MAP_MODES[mode]
+        itemsize = array.array(ARRAY_TYPECODES[dtype]).itemsize
+        with open(path, open_mode) as f:
+            size = os.fstat(f.fileno()).st_size
+            if dim is None:
+                if mode == 'w+':
+                    raise ValueError("Mode 'w+' needs the dimension of the array")
+                if size % itemsize != 0:
+                    raise ValueError(f'{path} holds {size} bytes, not a whole number of {dtype.name} elements')
+                dim = size // itemsize
+            elif size < dim * itemsize:
+                if mode == 'c':
+                    raise ValueError(f'{path} holds {size // itemsize} {dtype.name} elements, fewer than {dim}')
+                f.truncate(dim * itemsize)
+            if dim == 0:
+                raise ValueError(f'Cannot map an array of no elements from {path}')
+            mapping = mmap.mmap(f.fileno(), dim * itemsize, access=access) # stays valid once the file is closed
+        a = cls.from_buffer(memoryview(mapping).cast(ARRAY_TYPECODES[dtype]), dtype)
+        a.mapping = mapping
+        return a
+
+    @property
+    def dim(self) -> int:
+        return len(self.buffer)
+    @property
+    def size(self) -> int:
+        return self.dim * self.element_size
+    @property
+    def element_size(self) -> int:
+        return DATATYPE_CLASSES[self.dtype]._size
+    @property
+    def itemsize(self) -> int:
+        return 1 if isinstance(self.buffer, bytearray) else self.buffer.itemsize
+    @property
+    def bound(self) -> bool:
+        '''Whether the array shares the memory of a caller's buffer'''
+        return isinstance(self.buffer, memoryview)
+
+    def resize(self, dim:int):
+        '''Set the number of elements, new elements are zero'''
+        if dim < 0:
+            raise InterpreterError(f'Array dimension must not be negative, got {dim}')
+        if self.bound:
+            if dim != len(self.buffer):
+                raise InterpreterError(f'Array bound to a buffer of {len(self.buffer)} elements cannot be resized to {dim}')
+            return
+        try:
+            if dim < len(self.buffer):
+                del self.buffer[dim:]
+            else:
+                self.frombytes(bytes((dim - len(self.buffer)) * self.itemsize))
+        except BufferError: # a view of the buffer is held, e.g. from Interpreter.array_view, it keeps the old contents
+            self.buffer = self.buffer[:dim]
+            self.frombytes(bytes((dim - len(self.buffer)) * self.itemsize))
+
+    def frombytes(self, data):
+        '''Append elements from the raw bytes of a bytes-like object'''
+        if isinstance(self.buffer, bytearray):
+            self.buffer += data
+        else:
+            self.buffer.frombytes(data)
+
+    def assign_bytes(self, data):
+        '''Replace the contents of a CHAR8 array with the bytes of a bytes-like object, the dimension follows'''
+        if len(data) != len(self.buffer):
+            self.resize(len(data))
+        self.buffer[:] = data
+
+    def flush(self):
+        '''Write the changes to a file mapped with map_file'''
+        if self.mapping is not None:
+            self.mapping.flush()
+
+    def close(self):
+        '''Release a bound buffer and flush its mapped file, which is unmapped once no views of it remain.
+        The array is empty and owns its buffer afterwards'''
+        if self.bound:
+            self.flush()
+            self.buffer.release()
+            self.mapping = None
+            self.buffer = bytearray() if self.dtype == Datatypes.CHAR8 else array.array(ARRAY_TYPECODES[self.dtype])
+
+    def check_index(self, index:int) -> int:
+        if not 0 <= index < len(self.buffer):
+            raise InterpreterError(f'Array index {index} out of range for dimension {len(self.buffer)}')
+        return index
+
+    def get(self, index:int) -> DType:
+        return DATATYPE_CLASSES[self.dtype](self.buffer[self.check_index(index)])
+
+    def set(self, index:int, value:DType):
+        self.buffer[self.check_index(index)] = convert(value, self.dtype).data.value
+
+    def address(self) -> int:
+        '''Address of the first element, only valid until the next resize'''
+        if isinstance(self.buffer, array.array):
+            return self.buffer.buffer_info()[0]
+        if not self.buffer:
+            return 0
+        view = (ctypes.c_char * (len(self.buffer) * self.itemsize)).from_buffer(self.buffer)
+        address = ctypes.addressof(view)
+        del view # releases the export, so the bytearray can be resized again
+        return address
+
+    def __len__(self) -> int:
+        return len(self.buffer)
+
+    def __repr__(self):
+        return f'Array:{self.dtype.name}{list(self.buffer)!r}'
@@ -7,5 +7,22 @@ class ParsingError(Exception):
 class LoweringError(Exception):
     ...
 
+class ImageError(Exception):
+    ...
+
+class LinkingError(Exception):
+    ...
+
 class InterpreterError(Exception):
-    ...
\ No newline at end of file
+    def __init__(self, message:str, line_number:int=None):
+        super().__init__(message if line_number is None else f"{message} (line {line_number})")
+        self.message:str = message
+        self.line_number:int = line_number
+
+class QuotaExceededError(InterpreterError):
+    '''A run went over one of the limits of its Quotas'''
+    def __init__(self, quota:str, limit, used, line_number:int=None):
+        super().__init__(f"{quota} quota of {limit} exceeded, {used} used", line_number)
+        self.quota:str = quota # "instructions", "seconds" or "array_bytes"
+        self.limit = limit
+        self.used = used
@@ -0,0 +1,201 @@
+"""Define the binary program image (.tyb)
+Author: Ty Brennan
+"""
+
+import os, sys
+import mmap
+import array
+import struct
+import typing
+
+from .assembler import Program
+from .error import ImageError
+from .datatypes import Datatypes
+from .metrics import measured
+
+IMAGE_SUFFIX:str = '.tyb'
+IMAGE_MAGIC:bytes = b'TYB\0'
+IMAGE_FORMAT_VERSION:int = 1
+
+# magic, format version, reserved, instructions, constants, variables, array variables,
+# type map entries, labels, version numbers, program name length, string table size
+HEADER = struct.Struct('<4sHHIIIIIIIII')
+# dtype (0 for strings), string length, payload (int64 | double | string table offset)
+CONSTANT_RECORD = struct.Struct('<iI8s')
+# string table offset, length, value (dtype for the type map, instruction pointer for labels)
+NAME_RECORD = struct.Struct('<IIi')
+ALIGNMENT:int = 8
+
+
+def align(offset:int) -> int:
+    return (offset + ALIGNMENT - 1) & ~(ALIGNMENT - 1)
+
+
+class ProgramImage():
+    '''Serialize a Program into a flat, versioned image that is loaded by memory-mapping it.
+    The instruction stream is stored column-wise as little-endian int32 and used in place,
+    only the (small) constant pool, symbol tables and type map are rebuilt as objects.
+
+    Layout, every section aligned to 8 bytes:
+        header | opcodes | operands | line numbers | constants | variables | array variables
+        | type map | labels | version | string table (program name first)'''
+
+    @classmethod
+    def section_sizes(cls, header:tuple) -> list:
+        _, _, _, n_instructions, n_constants, n_variables, n_array_variables, n_types, n_labels, n_version, _, n_strings = header
+        return [
+            4 * n_instructions,
+            4 * n_instructions,
+            4 * n_instructions,
+            CONSTANT_RECORD.size * n_constants,
+            NAME_RECORD.size * n_variables,
+            NAME_RECORD.size * n_array_variables,
+            NAME_RECORD.size * n_types,
+            NAME_RECORD.size * n_labels,
+            4 * n_version,
+            n_strings,
+        ]
+
+    @classmethod
+    def section_offsets(cls, header:tuple) -> list:
+        offsets = []
+        offset = align(HEADER.size)
+        for size in cls.section_sizes(header):
+            offsets.append(offset)
+            offset = align(offset + size)
+        return offsets
+
+    @classmethod
+    def dumps(cls, program:Program) -> bytes:
+        '''
+        @Params
+            program:Program     The assembled program to serialize
+        @Returns
+            bytes               The image of the program
+        '''
+        strings = bytearray()
+        def string(s:str) -> tuple:
+            encoded = s.encode('utf-8')
+            strings.extend(encoded)
+            return (len(strings) - len(encoded), len(encoded))
+
+        name_offset, name_length = string(program.name)
+        constants = bytearray()
+        for value, dtype in zip(program.constants, program.constant_types):
+            if dtype is None:
+                offset, length = string(value)
+                constants += CONSTANT_RECORD.pack(0, length, struct.pack('<Q', offset))
+            elif dtype in {Datatypes.REAL32, Datatypes.REAL64}:
+                constants += CONSTANT_RECORD.pack(dtype.value, 0, struct.pack('<d', value))
+            else:
+                constants += CONSTANT_RECORD.pack(dtype.value, 0, struct.pack('<q', value))
+        variables = b''.join(NAME_RECORD.pack(*string(var), -1) for var in program.variables)
+        array_variables = b''.join(NAME_RECORD.pack(*string(a_var), -1) for a_var in program.array_variables)
+        type_map = b''.join(NAME_RECORD.pack(*string(var), dtype.value) for var, dtype in program.type_map.items())
+        labels = b''.join(NAME_RECORD.pack(*string(label), program.label_table.get(label, -1)) for label in program.labels)
+        version = program.version if program.version is not None else ()
+
+        header = (IMAGE_MAGIC, IMAGE_FORMAT_VERSION, 0, len(program), len(program.constants), len(program.variables),
+                  len(program.array_variables), len(program.type_map), len(program.labels), len(version), name_length, len(strings))
+        assert name_offset == 0
+        sections = [
+            cls.int32_column(program.opcodes),
+            cls.int32_column(program.operands),
+            cls.int32_column(program.line_numbers),
+            bytes(constants),
+            variables,
+            array_variables,
+            type_map,
+            labels,
+            cls.int32_column(version),
+            bytes(strings),
+        ]
+        image = bytearray(HEADER.pack(*header))
+        for offset, section in zip(cls.section_offsets(header), sections):
+            image.extend(bytes(offset - len(image)))
+            image.extend(section)
+        return bytes(image)
+
+    @classmethod
+    def int32_column(cls, values) -> bytes:
+        column = array.array('i', (int(v) for v in values))
+        if sys.byteorder != 'little': column.byteswap()
+        return column.tobytes()
+
+    @classmethod
+    def dump(cls, program:Program, path:typing.Union[os.PathLike, str]):
+        '''Write the image of a program to path'''
+        with open(path, 'wb') as f:
+            f.write(cls.dumps(program))
+
+    @classmethod
+    def load(cls, path:typing.Union[os.PathLike, str]) -> Program:
+        '''Memory-map an image. The instruction columns of the returned Program are read-only views into the file'''
+        with open(path, 'rb') as f:
+            try:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError: # empty file
+                raise ImageError(f"{path} is not a Tython image") from None
+        return cls.loads(buffer, str(path))
+
+    @classmethod
+    @measured('load_image', lambda program: {'instructions': len(program)})
+    def loads(cls, buffer, source:str='<image>') -> Program:
+        '''
+        @Params
+            buffer              Any bytes-like object holding an image (bytes, mmap, ...)
+            source:str          Where the image came from, for error messages
+        @Returns
+            Program             The program, sharing the instruction columns with buffer
+        '''
+        view = memoryview(buffer)
+        if len(view) < HEADER.size or bytes(view[:4]) != IMAGE_MAGIC:
+            raise ImageError(f"{source} is not a Tython image")
+        header = HEADER.unpack_from(view)
+        if header[1] != IMAGE_FORMAT_VERSION:
+            raise ImageError(f"{source} has image format version {header[1]}, expected {IMAGE_FORMAT_VERSION}")
+        offsets = cls.section_offsets(header)
+        sizes = cls.section_sizes(header)
+        if offsets[-1] + sizes[-1] > len(view):
+            raise ImageError(f"{source} is truncated")
+        sections = [view[offset:offset+size] for offset, size in zip(offsets, sizes)]
+        opcodes, operands, line_numbers, constants, variables, array_variables, type_map, labels, version, strings = sections
+        name_length = header[10]
+
+        def string(offset:int, length:int) -> str:
+            return bytes(strings[offset:offset+length]).decode('utf-8')
+        def records(section) -> list:
+            return [NAME_RECORD.unpack_from(section, k) for k in range(0, len(section), NAME_RECORD.size)]
+
+        program = Program(string(0, name_length))
+        program.opcodes = cls.int32_view(opcodes)
+        program.operands = cls.int32_view(operands)
+        program.line_numbers = cls.int32_view(line_numbers)
+        for k in range(0, len(constants), CONSTANT_RECORD.size):
+            dtype_value, length, payload = CONSTANT_RECORD.unpack_from(constants, k)
+            if dtype_value == 0:
+                program.constants.append(string(struct.unpack('<Q', payload)[0], length))
+                program.constant_types.append(None)
+            else:
+                dtype = Datatypes(dtype_value)
+                program.constants.append(struct.unpack('<d' if dtype in {Datatypes.REAL32, Datatypes.REAL64} else '<q', payload)[0])
+                program.constant_types.append(dtype)
+        program.variables = [string(offset, length) for offset, length, _ in records(variables)]
+        program.array_variables = [string(offset, length) for offset, length, _ in records(array_variables)]
+        program.type_map = {string(offset, length): Datatypes(value) for offset, length, value in records(type_map)}
+        for offset, length, ip in records(labels):
+            label = string(offset, length)
+            program.labels.append(label)
+            if ip >= 0: program.label_table[label] = ip
+        if len(version):
+            program.version = tuple(cls.int32_view(version))
+        return program
+
+    @classmethod
+    def int32_view(cls, section:memoryview) -> typing.Sequence[int]:
+        '''A zero-copy int32 view of a section, copied only on big-endian hosts'''
+        if sys.byteorder == 'little':
+            return section.cast('i')
+        column = array.array('i', bytes(section))
+        column.byteswap()
+        return column
@@ -2,28 +2,104 @@
 Author: Ty Brennan
 """
 import os, sys
-import functools
 import time
-import enum
 import typing
-import re
-import abc
 import ctypes
+import operator
 
-from pprint import pprint
 from .token_types import *
-from .token import Token
 from .node import Node
 from .error import InterpreterError
 from .datatypes import *
+from .opcodes import *
+from .assembler import Assembler, Program
+from .linker import Linker, CALL_STACK_DEPTH
+from .snapshot import Snapshot
+from .profiler import Profiler
+from .quotas import Quotas, NO_CHECK
+from .memory import ArrayAccount
+from .output import OutputSink, BufferedSink, BUFFER_LINES, TICK_LABELS, debug
+from .mathlib import ScalarFunctions, DOUBLE_FUNCTIONS
+from . import metrics
+
+if typing.TYPE_CHECKING: # the JIT pulls in the lowerer and a C toolchain, only its users import it
+    from .jit import JIT
+
+DEBUG = False
+
+COMPARISON_FUNCTIONS:dict = {
+    OPCODE.GREATER_THAN: operator.gt,
+    OPCODE.LESS_THAN: operator.lt,
+    OPCODE.GE_THAN: operator.ge,
+    OPCODE.LE_THAN: operator.le,
+    OPCODE.EQUAL_TO: operator.eq,
+    OPCODE.NOT_EQUAL_TO: operator.ne,
+}
+BRANCH_FUNCTIONS:dict = {branch: COMPARISON_FUNCTIONS[comparison] for branch, comparison in BRANCH_COMPARISONS.items()}
+SCALAR_MATH_FUNCTIONS:ScalarFunctions = ScalarFunctions() # SCALAR_MATH_FUNCTIONS[opcode, precision, Datatypes] = (function, result class)
+LOGICAL_FUNCTIONS:dict = {
+    OPCODE.LOGICAL_AND: lambda a, b: a and b,
+    OPCODE.LOGICAL_OR: lambda a, b: a or b,
+    OPCODE.LOGICAL_NAND: lambda a, b: not (a and b),
+    OPCODE.LOGICAL_XOR: lambda a, b: a != b,
+    OPCODE.LOGICAL_NOR: lambda a, b: not (a or b),
+}
+
+class CallFrame(object):
+    '''A preallocated entry of the call stack'''
+    __slots__ = ('loaded', 'return_ip')
+    def __init__(self):
+        self.loaded:typing.Optional[LoadedProgram] = None
+        self.return_ip:int = 0
+
+
+class LoadedProgram(object):
+    '''A program bound to the slots of an interpreter, with its JIT state'''
+    def __init__(self, program:Program):
+        self.program:Program = program
+        self.constants:list = [c if t is None else make_value(t, c) for c, t in zip(program.constants, program.constant_types)]
+        self.slots:list = []
+        self.arrays:list = []
+        self.slot_pointers = None
+        self.label_counts:list = [0] * len(program.labels)
+        self.reported_counts:dict = dict() # label counts already added to Interpreter.label_counts
+        self.native_regions:list = [None] * len(program.labels)
+        self.compile_attempted:list = [False] * len(program.labels)
+        self.profile = None # ProgramProfile while an Interpreter.profiler is set
+        self.jit_thresholds:list = [] # jit_thresholds[label] = executions before its loop is compiled
+
 
 class Interpreter():
-    """Define an interpreter to handle code execution"""
-    type_map = dict() # type_map["A0"] = Datatypes.[...]
-    variables = dict() # variables["A0"] = [...]
-    array_variables = dict() # array_variables["A0"] = [...]
-    jump_table = dict() #jump_table["L"] = int
-    instruction_pointer:int = 0
+    """Define an interpreter to handle code execution. All state belongs to the instance, so interpreters on
+    different threads never share variables. One interpreter runs one program at a time"""
+
+    def __init__(self, jit:typing.Optional['JIT']=None, linker:typing.Optional[Linker]=None, snapshot_path:typing.Union[os.PathLike, str, None]=None):
+        '''
+        @Params
+            jit:JIT                 Compiles hot loops to native code, None to always interpret
+            linker:Linker           Resolves CALLed programs, by default from the working directory
+            snapshot_path:str       Variables are restored from this snapshot (if it exists) and checkpointed to it
+                                    after every interpreted program
+        '''
+        self.type_map:dict = dict() # type_map["A0"] = Datatypes.[...]
+        self.variables:dict = dict() # variables["A0"] = [...]
+        self.array_variables:dict = dict() # array_variables["@A0"] = Array
+        self.jump_table:dict = dict() #jump_table["L"] = int
+        self.instruction_pointer:int = 0
+        self.jit:typing.Optional['JIT'] = jit
+        self.snapshot_path = snapshot_path
+        self.input_stream:typing.TextIO = sys.stdin # PROMPT reads from here
+        self.output_stream:typing.Optional[typing.TextIO] = None # DISP writes here, None for sys.stdout
+        self.output_sink:typing.Optional[OutputSink] = None # replaces output_stream, see output.py
+        self.profiler:typing.Optional[Profiler] = None # counts and times every instruction while set
+        self.quotas:typing.Optional[Quotas] = None # limits of every run, see quotas.py
+        self.high_water:dict = dict() # high_water["array_bytes" | "array_allocated"] = peak of the last run, see memory.py
+        self.linker:Linker = linker if linker is not None else Linker()
+        self.label_counts:dict = dict() # label_counts["L"] = executions of LBL L
+        self.loaded_programs:dict = dict() # loaded_programs["NAME"] = LoadedProgram
+        self.call_stack:list = [CallFrame() for _ in range(CALL_STACK_DEPTH)]
+        if snapshot_path is not None and os.path.exists(snapshot_path):
+            self.restore(snapshot_path)
 
     def clear_variables(self):
         '''Erase information relataing to all variables (including array variables)'''
@@ -31,14 +107,42 @@ class Interpreter():
         self.variables = dict()
         self.array_variables = dict()
 
-    def interpret(self, tree:Node):
-        '''Entry point for the interpreting loop. Wraps 'interpret_block' and handles program meta-data'''
-        root_node = tree
-        print("=" * 8, "Begin interpreter","=" * 8)
-        assert root_node.token.type == TOKEN_TYPE.PROG
-        program_name:str = tree.children[0].children[0].token.value
-        print(f'{program_name=}')
-        self.interpret_block(root_node)
+    def interpret(self, tree:typing.Union[Node, Program]):
+        '''Entry point for the interpreting loop. Assembles the tree (unless given an assembled program, e.g. a
+        loaded image) and handles program meta-data'''
+        program:Program = tree if isinstance(tree, Program) else Assembler.assemble(tree)
+        if DEBUG: debug("=" * 8, "Begin interpreter","=" * 8)
+        program_name:str = program.name
+        if DEBUG: debug(f'{program_name=}')
+        self.execute(program)
+        if self.snapshot_path is not None:
+            self.checkpoint(self.snapshot_path)
+
+    def prompt(self, dtype:Datatypes) -> DType:
+        '''Read one number per line from the input stream'''
+        return self.parse_input(dtype, self.input_stream.readline())
+
+    @staticmethod
+    def parse_input(dtype:Datatypes, line:str) -> DType:
+        '''Value of a line of PROMPT input, integers are read exactly and truncated when written as reals'''
+        if line == '':
+            raise InterpreterError('PROMPT: end of input')
+        text = line.strip()
+        try:
+            if dtype in INTEGER_DATATYPES:
+                try: return make_value(dtype, int(text))
+                except ValueError: return make_value(dtype, float(text))
+            return make_value(dtype, float(text))
+        except (ValueError, OverflowError):
+            raise InterpreterError(f'PROMPT: cannot read a number from {text!r}') from None
+
+    def checkpoint(self, path:typing.Union[os.PathLike, str]):
+        '''Save all variables (including array variables) and their types to a snapshot'''
+        Snapshot.dump(path, self.variables, self.array_variables, self.type_map)
+
+    def restore(self, path:typing.Union[os.PathLike, str]):
+        '''Replace all variables (including array variables) and their types by those of a snapshot'''
+        self.variables, self.array_variables, self.type_map = Snapshot.load(path)
 
     def assign_datatype(self, var:str, dtype:Datatypes):
         '''
@@ -48,66 +152,387 @@ class Interpreter():
         '''
         assert isinstance(var, str) and isinstance(dtype, Datatypes), f"{var.type=}, {dtype.type=}"
         self.type_map[var.upper()] = dtype
-    
-    def evaluate_expression(self, expression_root_node:Node) -> typing.Union[Integer32, Integer64, Float32, Float64]:
+
+    def set_variable(self, var:str, value):
+        '''Set a scalar variable for the next run, converted to its datatype (as declared by the programs run so far,
+        otherwise implied by its name). A program declaring another datatype converts it when it is loaded'''
+        var = var.upper()
+        current = self.variables.get(var)
+        dtype = current.meta_dtype if current is not None else self.type_map.get(var, get_default_type(var))
+        if current is None:
+            self.variables[var] = make_value(dtype, value)
+        else:
+            current.data.value = make_value(dtype, value).data.value # loaded programs keep pointing at the slot
+
+    def get_variable(self, var:str):
+        '''The value of a scalar variable as a Python int or float'''
+        value = self.variables.get(var.upper())
+        if value is None:
+            raise KeyError(f'No variable {var}')
+        return value.data.value
+
+    def bind_array(self, a_var:str, buffer, dtype:typing.Optional[Datatypes]=None) -> Array:
         '''
-        @Param
-            expression_root_node:Node       The node that lies at the root of the expression to be evaluated
-        @Returns
-            value:int | float               The value that the expression evaluates to
+        Bind an array variable to the memory of a caller's buffer, without copying it. Programs read and write the
+        buffer directly and cannot resize it, a program declaring the array with another datatype fails to load
+        @Params
+            a_var:str           The array variable, e.g. "@A0"
+            buffer              A writable, C-contiguous object supporting the buffer protocol, e.g. a NumPy array
+            dtype:Datatypes     The datatype of the array, by default the one matching the format of the buffer
         '''
-        # base case
-        rtt = expression_root_node.token.type # root node token type
-        if rtt == TOKEN_TYPE.EXPR:
-            return self.evaluate_expression(expression_root_node.children[0])
-        elif rtt in NUMERALS: 
-            if rtt == TOKEN_TYPE.INT_LIT:
-                return Integer32(int(expression_root_node.token.value))
-            elif rtt == TOKEN_TYPE.FLOAT_LIT:
-                return Float32(float(expression_root_node.token.value))
-                
-            else:
-                raise InterpreterError(f"Numeral literal type not found: {rtt}")
-        elif rtt in NUMERICAL_OPERATORS:
-            if rtt == TOKEN_TYPE.PLUS:
-                return self.evaluate_expression(expression_root_node.children[0]) + self.evaluate_expression(expression_root_node.children[1])
-            elif rtt == TOKEN_TYPE.MINUS:
-                return self.evaluate_expression(expression_root_node.children[0]) - self.evaluate_expression(expression_root_node.children[1])
-            elif rtt == TOKEN_TYPE.MUL:
-                return self.evaluate_expression(expression_root_node.children[0]) * self.evaluate_expression(expression_root_node.children[1])
-            elif rtt == TOKEN_TYPE.DIV:
-                return self.evaluate_expression(expression_root_node.children[0]) / self.evaluate_expression(expression_root_node.children[1])
-        elif rtt in MATH_FUNCTIONS:
-            raise NotImplementedError()
-        else:
-            raise InterpreterError(f"Could not evaluate expression node {expression_root_node}")
-        
-    def evaluate_boolean_expression(self, expression_root_node:Node) -> bool:
-        # TODO
-        return False
-    
-    def evaluate_logical_expression(self, expression_root_node:Node) -> bool:
-        # TODO
-        return False
-
-    def interpret_block(self, root_node:Node):
-        """Interpret code block. If/Else statements create new blocks"""
-        for node in root_node.children:
-            assert isinstance(node, Node)
-            token = node.token
-            children = node.children
-            if token.type == TOKEN_TYPE.IMPLICIT:
-                dtype = match_token_to_datatype(children[0].token)
-                var = children[1].token.value
-                self.assign_datatype(var, dtype)
-                print(self.type_map)
-            elif token.type == TOKEN_TYPE.ASSIGN:
-                self.variables[children[0].token.value] = self.evaluate_expression(children[1])
-                print(self.variables)
-            elif token.type == TOKEN_TYPE.DISP:
-                c = children[0]
-                if c.token.type == TOKEN_TYPE.VAR:
-                    print(self.variables[c.token.value].true_repr())
+        a_var = a_var.upper()
+        a = Array.from_buffer(buffer, dtype)
+        self.array_variables[a_var] = a
+        self.type_map[a_var] = a.dtype
+        return a
+
+    def map_array(self, a_var:str, path:typing.Union[os.PathLike, str], dtype:typing.Optional[Datatypes]=None,
+                  dim:typing.Optional[int]=None, mode:str='r+') -> Array:
+        '''
+        Bind an array variable to a memory-mapped file of raw elements, see Array.map_file. Programs read and write
+        the file in place, pages are loaded on demand. Array.close flushes and unmaps it
+        @Params
+            dtype:Datatypes     The datatype of the elements, by default the one the array has (as declared by the
+                                programs run so far, otherwise implied by its name)
+        '''
+        a_var = a_var.upper()
+        if dtype is None:
+            dtype = self.type_map.get(a_var, get_default_type(a_var[1:]))
+        a = Array.map_file(path, dtype, dim, mode)
+        self.array_variables[a_var] = a
+        self.type_map[a_var] = dtype
+        return a
+
+    def array_view(self, a_var:str) -> memoryview:
+        '''A view of the elements of an array variable, without copying them. numpy.asarray(view) wraps it as a
+        NumPy array. A later resize of the array leaves the view with the old contents'''
+        a = self.array_variables.get(a_var.upper())
+        if a is None:
+            raise KeyError(f'No array variable {a_var}')
+        return memoryview(a.buffer)
+
+    def bind_variables(self, program:Program) -> list:
+        '''Return the variable slots of a program. Values persist in self.variables across programs'''
+        slots = []
+        for var in program.variables:
+            dtype = program.type_map[var]
+            self.assign_datatype(var, dtype)
+            value = self.variables.get(var)
+            if value is None:
+                value = make_value(dtype)
+            elif value.meta_dtype != dtype:
+                value = convert(value, dtype)
+            self.variables[var] = value
+            slots.append(value)
+        return slots
+
+    def bind_array_variables(self, program:Program) -> list:
+        '''Return the array slots of a program. Arrays persist in self.array_variables across programs'''
+        arrays = []
+        for a_var in program.array_variables:
+            dtype = program.type_map[a_var]
+            self.assign_datatype(a_var, dtype)
+            a = self.array_variables.get(a_var)
+            if a is None:
+                a = Array(dtype)
+            elif a.dtype != dtype and a.bound:
+                raise InterpreterError(f'{a_var} is bound to a {a.dtype.name} buffer but {program.name} declares it {dtype.name}')
+            elif a.dtype != dtype:
+                converted = Array(dtype, a.dim)
+                for i in range(a.dim):
+                    converted.set(i, a.get(i))
+                a = converted
+            self.array_variables[a_var] = a
+            arrays.append(a)
+        return arrays
+
+    @metrics.measured('load', lambda loaded: {'programs': 1, 'variables': len(loaded.slots), 'arrays': len(loaded.arrays)})
+    def load(self, program:Program) -> LoadedProgram:
+        '''Bind a program to the interpreter state. JIT state is kept across executions of the same program'''
+        loaded = self.loaded_programs.get(program.name)
+        if loaded is None or loaded.program is not program:
+            loaded = LoadedProgram(program)
+            self.loaded_programs[program.name] = loaded
+        threshold = self.jit.threshold if self.jit is not None else 0
+        loaded.jit_thresholds = [program.jit_thresholds.get(label, threshold) for label in program.labels]
+        loaded.slots = self.bind_variables(program)
+        loaded.arrays = self.bind_array_variables(program)
+        loaded.slot_pointers = None
+        return loaded
+
+    @metrics.measured('execute')
+    def execute(self, program:Program):
+        '''Run an assembled program and the programs it CALLs, reading the input stream and writing the output sink'''
+        sink:OutputSink = self.output_sink
+        if sink is None:
+            output:typing.TextIO = self.output_stream if self.output_stream is not None else sys.stdout
+            sink = BufferedSink(output, 1 if output.isatty() else BUFFER_LINES) # a terminal sees every line at once
+        steps = self.steps(program, TICK_LABELS if isinstance(sink, BufferedSink) and sink.ticking else None)
+        try:
+            request = next(steps)
+            while True:
+                if request is None:
+                    sink.tick() # lines held back during a long loop
+                    request = next(steps)
+                elif request[0] == OPCODE.DISP:
+                    sink.write_line(request[1])
+                    request = next(steps)
+                elif request[0] == OPCODE.DISP_STR:
+                    sink.write_bytes(request[1])
+                    request = next(steps)
                 else:
-                    print(children[0].token.value.true_repr())        
+                    sink.flush() # show everything written before asking
+                    try:
+                        value = self.prompt(request[1])
+                    except InterpreterError as e:
+                        request = steps.throw(e) # raised at the PROMPT, so it gets its line number
+                    else:
+                        request = steps.send(value)
+        except StopIteration:
+            pass
+        finally:
+            steps.close()
+            sink.flush()
+
+    async def execute_async(self, program:Program, input_stream, output_stream, timeslice:int=1000):
+        '''
+        Run an assembled program as a coroutine. PROMPT and DISP await the streams and the program also yields to
+        the event loop every timeslice loop iterations, so many programs can share one event loop.
+        @Params
+            program:Program         The assembled program
+            input_stream            Has "async readline() -> str", see sessions.py for queues and sockets
+            output_stream           Has "async write(str)"
+            timeslice:int           Executed labels between two yields to the event loop
+        '''
+        import asyncio # imported here, only coroutine users pay for it
+        loop = asyncio.get_running_loop()
+        def compile_region(loaded:LoadedProgram, label:int, label_ip:int):
+            # the C compiler runs on a worker thread, the loop interprets until the region is stored
+            def store(future):
+                if not future.cancelled() and future.exception() is None:
+                    loaded.native_regions[label] = future.result()
+            loop.run_in_executor(None, self.jit.compile_region, loaded.program, label_ip).add_done_callback(store)
+        with metrics.measure('execute'):
+            await loop.run_in_executor(None, self.linker.link, program) # reads and assembles the CALLed files
+            steps = self.steps(program, timeslice, compile_region)
+            try:
+                request = next(steps)
+                while True:
+                    if request is None:
+                        await asyncio.sleep(0)
+                        request = next(steps)
+                    elif request[0] == OPCODE.DISP:
+                        await output_stream.write(request[1] + '\n')
+                        request = next(steps)
+                    elif request[0] == OPCODE.DISP_STR:
+                        await output_stream.write(str(request[1], 'utf-8', 'replace') + '\n')
+                        request = next(steps)
+                    else:
+                        try:
+                            value = self.parse_input(request[1], await input_stream.readline())
+                        except InterpreterError as e:
+                            request = steps.throw(e)
+                        else:
+                            request = steps.send(value)
+            except StopIteration:
+                pass
+            finally:
+                steps.close()
 
+    def steps(self, program:Program, timeslice:typing.Optional[int]=None,
+              compile_region:typing.Optional[typing.Callable]=None) -> typing.Generator:
+        '''The execution loop, suspended at every I/O point so that the caller decides how I/O is done.
+        Expressions are evaluated on a value stack, hot loops may run natively.
+        Yields (OPCODE.DISP, text) to be written, (OPCODE.DISP_STR, memoryview) of UTF-8 bytes to be written before
+        the next step, (OPCODE.PROMPT, Datatypes) to be answered with send(DType),
+        and None every timeslice executed labels if a timeslice is given.
+        Hot loops are compiled in place, unless compile_region(LoadedProgram, label, label_ip) is given to compile
+        them elsewhere: the loop stays interpreted until it stores the region in LoadedProgram.native_regions'''
+        # bind every linked program up front, CALL and return only switch between them
+        linked:dict = {name: self.load(p) for name, p in self.linker.link(program).items()}
+        call_stack:list = self.call_stack
+        depth:int = 0
+        jit = self.jit if self.jit is not None and self.jit.enabled else None
+        current:LoadedProgram = linked[program.name]
+        slots, arrays, constants = current.slots, current.arrays, current.constants
+        opcodes, operands = current.program.opcodes, current.program.operands
+        budget:int = timeslice or 0 # labels left until the next yield, 0 to never yield
+        profile = None # ProgramProfile of the current program while profiling
+        if self.profiler is not None:
+            jit = None # every instruction is counted
+            for loaded in linked.values():
+                loaded.profile = self.profiler.program(loaded.program)
+            profile = current.profile
+            profile_times, profile_ip, profile_time = profile.times, 0, time.perf_counter_ns()
+        stack:list = []
+        ip:int = 0
+        executed:int = 0 # interpreted instructions
+        native_region_calls:int = 0 # calls into native regions
+        native_instructions:int = 0 # charged for the loop iterations of native regions
+        region_budget = ctypes.c_int64() # labels a native region may pass
+        quotas:typing.Optional[Quotas] = self.quotas
+        check_at:int = NO_CHECK # interpreted instructions at which a label checks the quotas
+        if quotas is not None:
+            deadline = quotas.deadline()
+            check_at = quotas.check(0, deadline, 0)
+        account = ArrayAccount([a for loaded in linked.values() for a in loaded.arrays], quotas)
+        try:
+            while True:
+                opcode = opcodes[ip]
+                operand = operands[ip]
+                executed += 1
+                if profile is not None:
+                    now = time.perf_counter_ns()
+                    profile_times[profile_ip] += now - profile_time
+                    profile_times, profile_ip, profile_time = profile.times, ip, now
+                    profile.counts[ip] += 1
+                ip += 1
+                if opcode == OPCODE.PUSH_CONST:
+                    stack.append(constants[operand])
+                elif opcode == OPCODE.LOAD:
+                    stack.append(slots[operand])
+                elif opcode == OPCODE.STORE:
+                    slot = slots[operand]
+                    slot.data.value = convert(stack.pop(), slot.meta_dtype).data.value
+                elif opcode in BRANCH_FUNCTIONS:
+                    rhs = stack.pop()
+                    lhs = stack.pop()
+                    # values of the same kind compare exactly as they are, an integer and a real in the real's precision
+                    if type(lhs) is not type(rhs) and (lhs._meta_dtype in INTEGER_DATATYPES) != (rhs._meta_dtype in INTEGER_DATATYPES):
+                        lhs, rhs = promote(lhs, rhs)
+                    if not BRANCH_FUNCTIONS[opcode](lhs.data.value, rhs.data.value):
+                        if profile is not None: profile.jumps[ip-1] += 1
+                        ip = operand
+                elif opcode == OPCODE.LOAD_ELEMENT:
+                    index = stack.pop()
+                    stack.append(arrays[operand].get(int(index.data.value)))
+                elif opcode == OPCODE.STORE_ELEMENT:
+                    index = stack.pop()
+                    arrays[operand].set(int(index.data.value), stack.pop())
+                elif opcode == OPCODE.LOAD_DIM:
+                    stack.append(Integer32(arrays[operand].dim))
+                elif opcode == OPCODE.STORE_DIM:
+                    account.resize(arrays[operand], int(stack.pop().data.value), current.program.line_numbers[ip-1])
+                elif opcode == OPCODE.STORE_STRING:
+                    account.assign_bytes(arrays[operand], stack.pop().encode('utf-8'), current.program.line_numbers[ip-1])
+                elif opcode == OPCODE.ADD:
+                    rhs = stack.pop()
+                    lhs, rhs = promote(stack.pop(), rhs)
+                    stack.append(lhs + rhs)
+                elif opcode == OPCODE.SUBTRACT:
+                    rhs = stack.pop()
+                    lhs, rhs = promote(stack.pop(), rhs)
+                    stack.append(lhs - rhs)
+                elif opcode == OPCODE.MULTIPLY:
+                    rhs = stack.pop()
+                    lhs, rhs = promote(stack.pop(), rhs)
+                    stack.append(lhs * rhs)
+                elif opcode == OPCODE.DIVIDE:
+                    rhs = stack.pop()
+                    lhs, rhs = promote(stack.pop(), rhs)
+                    stack.append(lhs / rhs)
+                elif opcode in DOUBLE_FUNCTIONS:
+                    value = stack.pop()
+                    function, result = SCALAR_MATH_FUNCTIONS[opcode, operand, value.meta_dtype]
+                    stack.append(result(function(value.data.value)))
+                elif opcode in COMPARISON_FUNCTIONS:
+                    rhs = stack.pop()
+                    lhs, rhs = promote(stack.pop(), rhs)
+                    stack.append(Integer32(int(COMPARISON_FUNCTIONS[opcode](lhs.data.value, rhs.data.value))))
+                elif opcode in LOGICAL_FUNCTIONS:
+                    rhs = stack.pop().data.value != 0
+                    lhs = stack.pop().data.value != 0
+                    stack.append(Integer32(int(LOGICAL_FUNCTIONS[opcode](lhs, rhs))))
+                elif opcode == OPCODE.LOGICAL_NOT:
+                    stack.append(Integer32(int(stack.pop().data.value == 0)))
+                elif opcode == OPCODE.LABEL:
+                    current.label_counts[operand] += 1
+                    if executed >= check_at:
+                        check_at = quotas.check(executed + native_instructions, deadline, current.program.line_numbers[ip-1]) - native_instructions
+                    if budget:
+                        budget -= 1
+                        if not budget:
+                            budget = timeslice
+                            yield None
+                            if profile is not None: profile_time = time.perf_counter_ns() # time away is not charged
+                    if jit is not None:
+                        if not current.compile_attempted[operand] and current.label_counts[operand] >= current.jit_thresholds[operand]:
+                            current.compile_attempted[operand] = True
+                            if compile_region is None:
+                                current.native_regions[operand] = jit.compile_region(current.program, ip-1)
+                            else:
+                                compile_region(current, operand, ip-1)
+                        if current.native_regions[operand] is not None:
+                            if current.slot_pointers is None:
+                                current.slot_pointers = (ctypes.c_void_p * max(len(slots), 1))(*[ctypes.addressof(v.data) for v in slots])
+                            native_region_calls += 1
+                            region = current.native_regions[operand]
+                            labels = (check_at - executed) // region.length + 1 # back in time for the next check
+                            if budget:
+                                labels = min(labels, budget) # and for the next yield
+                            region_budget.value = labels
+                            ip = region(current.slot_pointers, arrays, region_budget)
+                            passed = labels - max(region_budget.value, 0)
+                            charged = passed * region.length
+                            native_instructions += charged
+                            check_at -= charged
+                            if budget:
+                                budget = max(budget - passed, 1) # the label the region returned at yields
+                elif opcode == OPCODE.JUMP:
+                    if profile is not None: profile.jumps[ip-1] += 1
+                    ip = operand
+                elif opcode == OPCODE.JUMP_IF_FALSE:
+                    if stack.pop().data.value == 0:
+                        if profile is not None: profile.jumps[ip-1] += 1
+                        ip = operand
+                elif opcode == OPCODE.HALT:
+                    if depth == 0:
+                        break
+                    # return to the caller
+                    depth -= 1
+                    frame = call_stack[depth]
+                    current, ip = frame.loaded, frame.return_ip
+                    slots, arrays, constants = current.slots, current.arrays, current.constants
+                    opcodes, operands = current.program.opcodes, current.program.operands
+                    if profile is not None: profile = current.profile
+                elif opcode == OPCODE.DISP:
+                    value = stack.pop()
+                    yield (OPCODE.DISP, value if isinstance(value, str) else value.true_repr())
+                    if profile is not None: profile_time = time.perf_counter_ns()
+                elif opcode == OPCODE.DISP_STR:
+                    with memoryview(arrays[operand].buffer) as view: # released before the array can be resized
+                        yield (OPCODE.DISP_STR, view)
+                    if profile is not None: profile_time = time.perf_counter_ns()
+                elif opcode == OPCODE.PROMPT:
+                    slot = slots[operand]
+                    slot.data.value = (yield (OPCODE.PROMPT, slot.meta_dtype)).data.value
+                    if profile is not None: profile_time = time.perf_counter_ns()
+                elif opcode == OPCODE.CALL:
+                    if depth == CALL_STACK_DEPTH:
+                        raise InterpreterError(f"Call stack overflow, CALLs nest deeper than {CALL_STACK_DEPTH}")
+                    frame = call_stack[depth]
+                    frame.loaded, frame.return_ip = current, ip
+                    depth += 1
+                    current, ip = linked[constants[operand]], 0
+                    slots, arrays, constants = current.slots, current.arrays, current.constants
+                    opcodes, operands = current.program.opcodes, current.program.operands
+                    if profile is not None: profile = current.profile
+                else:
+                    raise InterpreterError(f"Unknown opcode {opcode}")
+        except InterpreterError as e:
+            if e.line_number is not None:
+                raise
+            raise InterpreterError(e.message, current.program.line_numbers[ip-1]) from None
+        finally:
+            if profile is not None:
+                profile_times[profile_ip] += time.perf_counter_ns() - profile_time
+            metrics.count(instructions=executed, native_region_calls=native_region_calls)
+            self.high_water = account.high_water()
+            self.instruction_pointer = ip
+            self.jump_table = current.program.label_table
+            for loaded in linked.values():
+                for label, count in zip(loaded.program.labels, loaded.label_counts):
+                    self.label_counts[label] = self.label_counts.get(label, 0) + count - loaded.reported_counts.get(label, 0)
+                    loaded.reported_counts[label] = count
+            for frame in call_stack[:depth]:
+                frame.loaded = None
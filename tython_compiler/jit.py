@@ -0,0 +1,112 @@
+"""Define the tiered JIT compiler
+Author: Ty Brennan
+"""
+
+import os, sys
+import ctypes
+import hashlib
+import pathlib
+import tempfile
+import threading
+import typing
+
+from .opcodes import *
+from .assembler import Program
+from .lowerer import Lowerer, CFLAGS
+from .error import LoweringError, InterpreterError
+from .metrics import measured
+
+JIT_THRESHOLD:int = 100 # executions of a label before its loop is compiled
+CACHE_DIRECTORY:pathlib.Path = pathlib.Path(os.environ.get('TYTHON_CACHE', '~/.cache/tython')).expanduser() / 'jit'
+
+
+class NativeRegion(object):
+    '''A loop of a program compiled to native code, entered at its label'''
+    def __init__(self, library:ctypes.CDLL, start:int, end:int):
+        self.library:ctypes.CDLL = library
+        self.start:int = start
+        self.end:int = end
+        self.length:int = end - start # instructions charged per label passed, see Quotas
+        self.function = library.ty_region
+        self.function.argtypes = (ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p)
+        self.function.restype = ctypes.c_int64
+        self.error_message = library.ty_last_error_message
+        self.error_message.restype = ctypes.c_char_p
+        self.error_line = library.ty_last_error_line
+        self.error_line.restype = ctypes.c_int
+
+    def __call__(self, slot_pointers:ctypes.Array, arrays:list, budget:ctypes.c_int64) -> int:
+        '''
+        @Params
+            slot_pointers:ctypes.Array      Addresses of the ctypes values of the variable slots
+            arrays:list                     The Array of every array slot
+            budget:ctypes.c_int64           Labels the region may pass before it hands back, decremented by each
+        @Returns
+            ip:int                          The instruction pointer to resume interpreting at
+        '''
+        array_pointers = (ctypes.c_void_p * max(len(arrays), 1))(*[a.address() for a in arrays])
+        dims = (ctypes.c_int64 * max(len(arrays), 1))(*[a.dim for a in arrays])
+        ip = self.function(slot_pointers, array_pointers, dims, ctypes.byref(budget))
+        if ip < 0:
+            raise InterpreterError(self.error_message().decode(), self.error_line()) # of this thread
+        return ip
+
+
+class JIT():
+    '''Compile the loops of hot labels to native code through the Lowerer, caching them on disk by content hash'''
+    def __init__(self, threshold:int=JIT_THRESHOLD, cache_directory:typing.Union[os.PathLike, str, None]=None):
+        self.threshold:int = threshold
+        self.cache_directory:pathlib.Path = pathlib.Path(cache_directory) if cache_directory is not None else CACHE_DIRECTORY
+        self.compiler:typing.Optional[str] = Lowerer.find_compiler()
+        self.libraries:dict = dict() # libraries["<sha256>"] = ctypes.CDLL
+        self.lock:threading.Lock = threading.Lock() # interpreters on several threads may share a JIT
+
+    @property
+    def enabled(self) -> bool:
+        '''Without a C compiler every region stays interpreted'''
+        return self.compiler is not None
+
+    @classmethod
+    def find_region(cls, program:Program, label_ip:int) -> typing.Optional[tuple]:
+        '''The loop headed by a label: from the label up to the last jump back to it'''
+        end = None
+        for ip in range(label_ip, len(program)):
+            if program.opcodes[ip] in JUMP_OPCODES and program.operands[ip] == label_ip:
+                end = ip + 1
+        if end is None:
+            return None
+        return (label_ip, end)
+
+    @measured('jit_compile', lambda region: {'regions': int(region is not None)})
+    def compile_region(self, program:Program, label_ip:int) -> typing.Optional[NativeRegion]:
+        '''Native code for the loop headed by the label at label_ip, None if it has to stay interpreted'''
+        if not self.enabled:
+            return None
+        region = self.find_region(program, label_ip)
+        if region is None:
+            return None
+        try:
+            c_source = Lowerer.lower_region(program, *region)
+        except LoweringError:
+            return None
+        key = hashlib.sha256('\0'.join([self.compiler, *CFLAGS, c_source]).encode('utf-8')).hexdigest()
+        with self.lock:
+            return self._load_region(key, c_source, region)
+
+    def _load_region(self, key:str, c_source:str, region:tuple) -> typing.Optional[NativeRegion]:
+        if key not in self.libraries:
+            path = self.cache_directory / f'{key}.so'
+            if not path.exists():
+                try:
+                    self.cache_directory.mkdir(parents=True, exist_ok=True)
+                    handle, temporary_path = tempfile.mkstemp(suffix='.so', dir=self.cache_directory)
+                    os.close(handle)
+                    try:
+                        Lowerer.build_shared_object(c_source, temporary_path)
+                        os.replace(temporary_path, path) # atomic, concurrent interpreters may race here
+                    finally:
+                        if os.path.exists(temporary_path): os.remove(temporary_path)
+                except (LoweringError, OSError):
+                    return None
+            self.libraries[key] = ctypes.CDLL(str(path))
+        return NativeRegion(self.libraries[key], *region)
@@ -0,0 +1,280 @@
+"""Define data-parallel (SPMD) execution over many input lanes
+Author: Ty Brennan
+"""
+
+import os, sys
+import typing
+
+try:
+    import numpy as np
+except ImportError: # optional, only needed for lanes
+    np = None
+
+from .opcodes import *
+from .assembler import Program
+from .datatypes import Datatypes, INTEGER_DATATYPES, promote_datatypes, make_value
+from .error import InterpreterError
+from .mathlib import DOUBLE_FUNCTIONS, evaluate_array, result_datatype
+
+if np is not None:
+    NUMPY_DTYPES:dict = {
+        Datatypes.INT32: np.int32,
+        Datatypes.INT64: np.int64,
+        Datatypes.REAL32: np.float32,
+        Datatypes.REAL64: np.float64,
+        Datatypes.CHAR8: np.uint8,
+    }
+    COMPARISON_UFUNCS:dict = {
+        OPCODE.GREATER_THAN: np.greater,
+        OPCODE.LESS_THAN: np.less,
+        OPCODE.GE_THAN: np.greater_equal,
+        OPCODE.LE_THAN: np.less_equal,
+        OPCODE.EQUAL_TO: np.equal,
+        OPCODE.NOT_EQUAL_TO: np.not_equal,
+    }
+    LOGICAL_UFUNCS:dict = {
+        OPCODE.LOGICAL_AND: np.logical_and,
+        OPCODE.LOGICAL_OR: np.logical_or,
+        OPCODE.LOGICAL_XOR: np.logical_xor,
+        OPCODE.LOGICAL_NAND: lambda a, b: np.logical_not(np.logical_and(a, b)),
+        OPCODE.LOGICAL_NOR: lambda a, b: np.logical_not(np.logical_or(a, b)),
+    }
+    ARITHMETIC_UFUNCS:dict = {
+        OPCODE.ADD: np.add,
+        OPCODE.SUBTRACT: np.subtract,
+        OPCODE.MULTIPLY: np.multiply,
+    }
+EXACT_INTEGER_LIMIT:int = 2**53 # REAL64 inputs beyond it may have lost digits before integer lanes read them
+UNSUPPORTED_OPCODES:set = {
+    OPCODE.CALL, # every lane would need its own call stack
+}
+
+
+class LaneArray(object):
+    '''An array variable with one row per lane. Lanes may have different dimensions, the buffer is as wide as the largest'''
+    def __init__(self, dtype:Datatypes, lanes:int):
+        self.dtype:Datatypes = dtype
+        self.data = np.zeros((lanes, 0), dtype=NUMPY_DTYPES[dtype])
+        self.dims = np.zeros(lanes, dtype=np.int64)
+
+
+class LaneResult(object):
+    '''Outcome of running a program over every lane'''
+    def __init__(self, lanes:int):
+        self.lanes:int = lanes
+        self.variables:dict = dict() # variables["A0"] = numpy array, one value per lane
+        self.array_variables:dict = dict() # array_variables["@A0"] = [numpy array per lane]
+        self.outputs:list = [[] for _ in range(lanes)] # outputs[lane] = lines written by DISP
+        self.errors:list = [None] * lanes # errors[lane] = InterpreterError | None
+
+
+class LaneInterpreter():
+    '''Run one program over many inputs at once: every scalar variable is a vector of lanes and every instruction
+    is one NumPy operation over the lanes executing it. The k-th PROMPT of a lane reads column k of its row of the
+    input matrix. Lanes diverge at IF/GOTO and are scheduled by lane masks: the lanes at the lowest instruction
+    pointer run next, so every lane executes exactly the instructions it would execute on its own and its results
+    match scalar execution. A runtime error stops only the lanes it happened in.'''
+
+    def __init__(self):
+        if np is None:
+            raise ImportError('Lanes need NumPy, install it with "pip install numpy"')
+
+    def run(self, program:Program, inputs) -> LaneResult:
+        '''
+        @Params
+            program:Program     The assembled program
+            inputs              2D array-like, one row per lane and one column per PROMPT. Integer variables read
+                                REAL64 inputs only up to 2**53, give an integer array for larger INT64 inputs
+        @Returns
+            LaneResult
+        '''
+        for ip in range(len(program)):
+            if program.opcodes[ip] in UNSUPPORTED_OPCODES:
+                raise InterpreterError(f"{OPCODE(program.opcodes[ip]).name} is not supported over lanes", program.line_numbers[ip])
+        inputs = np.asarray(inputs)
+        if inputs.ndim == 1: inputs = inputs[:, None]
+        lanes:int = inputs.shape[0]
+        result = LaneResult(lanes)
+        if lanes == 0:
+            return result
+        types:list = [program.type_map[var] for var in program.variables]
+        slots:list = [np.zeros(lanes, dtype=NUMPY_DTYPES[t]) for t in types]
+        arrays:list = [LaneArray(program.type_map[a_var], lanes) for a_var in program.array_variables]
+        constants:list = [c if t is None else np.full(lanes, c, dtype=NUMPY_DTYPES[t]) for c, t in zip(program.constants, program.constant_types)]
+        all_lanes = np.arange(lanes)
+        prompt_columns = np.zeros(lanes, dtype=np.int64) # next input column of every lane
+        live = np.ones(lanes, dtype=bool) # neither halted nor failed
+        ips = np.zeros(lanes, dtype=np.int64) # only meaningful while diverged
+        converged:bool = True # every live lane is at pc
+        pc:int = 0
+        stack:list = [] # stack[-1] = (values, Datatypes | None)
+
+        def fail(lanes_mask, message:typing.Callable, line_number:int):
+            '''Stop the lanes in lanes_mask, message(lane) is the error the scalar interpreter would raise'''
+            nonlocal live
+            for lane in np.flatnonzero(lanes_mask):
+                result.errors[lane] = InterpreterError(message(lane), line_number)
+            live = live & ~lanes_mask
+
+        def promoted(lhs, rhs):
+            dtype = promote_datatypes(lhs[1], rhs[1])
+            t = NUMPY_DTYPES[dtype]
+            return lhs[0].astype(t, copy=False), rhs[0].astype(t, copy=False), dtype
+
+        with np.errstate(all='ignore'): # inactive lanes compute garbage, real errors are checked on the mask
+            while live.any():
+                if converged:
+                    mask = live
+                else:
+                    pc = int(ips[live].min())
+                    mask = live & (ips == pc)
+                    if np.array_equal(mask, live):
+                        converged = True
+                opcode = program.opcodes[pc]
+                operand = program.operands[pc]
+                line_number = program.line_numbers[pc]
+                next_pc:int = pc + 1
+                taken = None # lanes jumping to operand
+
+                if opcode == OPCODE.PUSH_CONST:
+                    stack.append((constants[operand], program.constant_types[operand]))
+                elif opcode == OPCODE.LOAD:
+                    stack.append((slots[operand], types[operand]))
+                elif opcode == OPCODE.STORE:
+                    values, _ = stack.pop()
+                    np.copyto(slots[operand], values.astype(NUMPY_DTYPES[types[operand]], copy=False), where=mask)
+                elif opcode == OPCODE.LOAD_ELEMENT:
+                    a = arrays[operand]
+                    index = stack.pop()[0].astype(np.int64)
+                    bad = mask & ((index < 0) | (index >= a.dims))
+                    if bad.any():
+                        fail(bad, lambda lane: f'Array index {index[lane]} out of range for dimension {a.dims[lane]}', line_number)
+                        mask = mask & ~bad
+                    if a.data.shape[1] == 0:
+                        stack.append((np.zeros(lanes, dtype=a.data.dtype), a.dtype))
+                    else:
+                        stack.append((a.data[all_lanes, np.clip(index, 0, a.data.shape[1] - 1)], a.dtype))
+                elif opcode == OPCODE.STORE_ELEMENT:
+                    a = arrays[operand]
+                    index = stack.pop()[0].astype(np.int64)
+                    values, _ = stack.pop()
+                    bad = mask & ((index < 0) | (index >= a.dims))
+                    if bad.any():
+                        fail(bad, lambda lane: f'Array index {index[lane]} out of range for dimension {a.dims[lane]}', line_number)
+                        mask = mask & ~bad
+                    a.data[all_lanes[mask], index[mask]] = values[mask].astype(a.data.dtype, copy=False)
+                elif opcode == OPCODE.LOAD_DIM:
+                    stack.append((arrays[operand].dims.astype(np.int32), Datatypes.INT32))
+                elif opcode == OPCODE.STORE_DIM:
+                    a = arrays[operand]
+                    dims = stack.pop()[0].astype(np.int64)
+                    bad = mask & (dims < 0)
+                    if bad.any():
+                        fail(bad, lambda lane: f'Array dimension must not be negative, got {dims[lane]}', line_number)
+                        mask = mask & ~bad
+                    width = int(dims[mask].max()) if mask.any() else 0
+                    if width > a.data.shape[1]:
+                        a.data = np.concatenate([a.data, np.zeros((lanes, width - a.data.shape[1]), dtype=a.data.dtype)], axis=1)
+                    a.dims = np.where(mask, dims, a.dims)
+                    a.data[mask[:, None] & (np.arange(a.data.shape[1])[None, :] >= a.dims[:, None])] = 0 # new elements are zero
+                elif opcode == OPCODE.STORE_STRING:
+                    a = arrays[operand]
+                    text = np.frombuffer(stack.pop()[0].encode('utf-8'), dtype=np.uint8)
+                    if len(text) > a.data.shape[1]:
+                        a.data = np.concatenate([a.data, np.zeros((lanes, len(text) - a.data.shape[1]), dtype=a.data.dtype)], axis=1)
+                    a.dims = np.where(mask, len(text), a.dims)
+                    a.data[mask, :len(text)] = text
+                    a.data[mask, len(text):] = 0
+                elif opcode in ARITHMETIC_UFUNCS:
+                    rhs = stack.pop()
+                    lhs, rhs, dtype = promoted(stack.pop(), rhs)
+                    stack.append((ARITHMETIC_UFUNCS[opcode](lhs, rhs), dtype))
+                elif opcode == OPCODE.DIVIDE:
+                    rhs = stack.pop()
+                    lhs, rhs, dtype = promoted(stack.pop(), rhs)
+                    if dtype in INTEGER_DATATYPES:
+                        bad = mask & (rhs == 0)
+                        if bad.any():
+                            fail(bad, lambda lane: 'integer division by zero', line_number)
+                            mask = mask & ~bad
+                        divisor = np.where(rhs == 0, 1, rhs).astype(rhs.dtype)
+                        quotient = np.floor_divide(lhs, divisor)
+                        # C division truncates toward zero, floor division rounds down
+                        quotient = quotient + ((np.remainder(lhs, divisor) != 0) & ((lhs < 0) != (divisor < 0))).astype(quotient.dtype)
+                        stack.append((quotient, dtype))
+                    else:
+                        stack.append((np.true_divide(lhs, rhs), dtype))
+                elif opcode in DOUBLE_FUNCTIONS:
+                    values, dtype = stack.pop()
+                    stack.append((evaluate_array(opcode, values, dtype, operand), result_datatype(dtype)))
+                elif opcode in COMPARISON_UFUNCS:
+                    rhs = stack.pop()
+                    lhs, rhs, _ = promoted(stack.pop(), rhs)
+                    stack.append((COMPARISON_UFUNCS[opcode](lhs, rhs).astype(np.int32), Datatypes.INT32))
+                elif opcode in LOGICAL_UFUNCS:
+                    rhs = stack.pop()[0] != 0
+                    lhs = stack.pop()[0] != 0
+                    stack.append((LOGICAL_UFUNCS[opcode](lhs, rhs).astype(np.int32), Datatypes.INT32))
+                elif opcode == OPCODE.LOGICAL_NOT:
+                    stack.append(((stack.pop()[0] == 0).astype(np.int32), Datatypes.INT32))
+                elif opcode == OPCODE.LABEL:
+                    pass
+                elif opcode == OPCODE.JUMP:
+                    next_pc = operand
+                elif opcode == OPCODE.JUMP_IF_FALSE:
+                    taken = mask & (stack.pop()[0] == 0)
+                elif opcode in BRANCH_COMPARISONS:
+                    rhs = stack.pop()
+                    lhs, rhs, _ = promoted(stack.pop(), rhs)
+                    taken = mask & ~COMPARISON_UFUNCS[BRANCH_COMPARISONS[opcode]](lhs, rhs)
+                elif opcode == OPCODE.HALT:
+                    live = live & ~mask
+                    mask = np.zeros(lanes, dtype=bool)
+                elif opcode == OPCODE.DISP:
+                    values, dtype = stack.pop()
+                    for lane in np.flatnonzero(mask):
+                        result.outputs[lane].append(values if dtype is None else make_value(dtype, values[lane].item()).true_repr())
+                elif opcode == OPCODE.DISP_STR:
+                    a = arrays[operand]
+                    for lane in np.flatnonzero(mask):
+                        result.outputs[lane].append(str(a.data[lane, :a.dims[lane]].tobytes(), 'utf-8', 'replace'))
+                elif opcode == OPCODE.PROMPT:
+                    bad = mask & (prompt_columns >= inputs.shape[1])
+                    if bad.any():
+                        fail(bad, lambda lane: 'PROMPT: end of input', line_number)
+                        mask = mask & ~bad
+                    column = np.clip(prompt_columns, 0, max(inputs.shape[1] - 1, 0))
+                    if inputs.shape[1]:
+                        values, dtype = inputs[all_lanes, column], types[operand]
+                        if dtype in INTEGER_DATATYPES and values.dtype.kind == 'f':
+                            # casting NaN or a float beyond the exact integers is undefined, the scalar interpreter raises
+                            bad = mask & ~np.isfinite(values)
+                            if bad.any():
+                                fail(bad, lambda lane: f'Cannot convert {values[lane].item()} to {dtype.name}', line_number)
+                                mask = mask & ~bad
+                            bad = mask & (np.abs(values) > EXACT_INTEGER_LIMIT)
+                            if bad.any():
+                                fail(bad, lambda lane: f'PROMPT: {values[lane].item()!r} is beyond the integers a REAL64 input holds exactly, give integer input for {dtype.name}', line_number)
+                                mask = mask & ~bad
+                            values = np.where(mask, np.trunc(values), 0).astype(np.int64) # truncated toward zero and wrapped, like C
+                        np.copyto(slots[operand], values.astype(NUMPY_DTYPES[dtype]), where=mask)
+                    prompt_columns = prompt_columns + mask
+                else:
+                    raise InterpreterError(f"Unknown opcode {opcode}", line_number)
+
+                # advance the lanes that executed, splitting them if a jump went both ways
+                if converged and np.array_equal(mask, live) and (taken is None or not taken.any() or np.array_equal(taken, mask)):
+                    pc = operand if taken is not None and taken.any() else next_pc
+                else:
+                    if converged:
+                        ips = np.full(lanes, pc, dtype=np.int64)
+                        converged = False
+                    ips = np.where(mask, next_pc, ips)
+                    if taken is not None:
+                        ips = np.where(taken, operand, ips)
+
+        for var, values in zip(program.variables, slots):
+            result.variables[var] = values
+        for a_var, a in zip(program.array_variables, arrays):
+            result.array_variables[a_var] = [a.data[lane, :a.dims[lane]] for lane in range(lanes)]
+        return result
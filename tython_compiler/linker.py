@@ -0,0 +1,127 @@
+"""Define the program Linker
+Author: Ty Brennan
+"""
+
+import os, sys
+import pathlib
+import threading
+import typing
+
+from .opcodes import *
+from .parser import Parser
+from .assembler import Assembler, Program
+from .image import ProgramImage, IMAGE_SUFFIX
+from .catalog import Catalog
+from .error import LinkingError
+
+CALL_STACK_DEPTH:int = 100 # maximum number of nested CALLs, see rule 5 of the README
+SOURCE_SUFFIX:str = '.ty'
+
+
+class Linker():
+    '''Resolve CALL targets to programs by name. Every program is compiled at most once per Linker and kept
+    in the module cache, so a helper that is called thousands of times is only lexed and parsed once.
+    Given a ProgramCache, files are compiled through it, so Linkers made per run share programs that have not changed.'''
+    def __init__(self, search_path:typing.Optional[list]=None, catalog:typing.Optional[Catalog]=None,
+                 programs:typing.Optional['ProgramCache']=None):
+        self.search_path:list = [pathlib.Path(p) for p in (search_path if search_path is not None else [os.curdir])]
+        self.modules:dict = dict() # modules["NAME"] = Program
+        self.programs:typing.Optional[ProgramCache] = programs
+        # programs whose file is not named after them are found through catalogs, by default of the search path
+        self.catalogs:typing.Optional[list] = [catalog] if catalog is not None else None
+        self.lock:threading.RLock = threading.RLock() # interpreters on several threads may share a Linker
+
+    @classmethod
+    def compile(cls, path:pathlib.Path) -> Program:
+        '''Assemble a source file or load an image'''
+        if path.suffix == IMAGE_SUFFIX:
+            return ProgramImage.load(path)
+        with open(path, 'r') as f:
+            return Assembler.assemble(Parser.syntax_analysis(Parser.lexical_analysis(f.read())))
+
+    def resolve(self, name:str) -> pathlib.Path:
+        '''
+        @Params
+            name:str            The name of a program, as written in CALL "NAME"
+        @Returns
+            pathlib.Path        The file defining it. An image is preferred unless its source is newer
+        '''
+        for directory in self.search_path:
+            source, image = directory / (name + SOURCE_SUFFIX), directory / (name + IMAGE_SUFFIX)
+            if image.exists() and (not source.exists() or image.stat().st_mtime >= source.stat().st_mtime):
+                return image
+            if source.exists():
+                return source
+        if self.catalogs is None:
+            self.catalogs = [Catalog(directory, recursive=False) for directory in self.search_path]
+            for catalog in self.catalogs: catalog.update()
+        for catalog in self.catalogs:
+            entry = catalog.lookup(name)
+            if entry is not None:
+                return pathlib.Path(entry.path)
+        raise LinkingError(f'Cannot find program "{name}" in {[str(p) for p in self.search_path]}')
+
+    def load(self, name:str) -> Program:
+        '''The program called name, from the module cache if it was loaded before'''
+        with self.lock:
+            if name not in self.modules:
+                path = self.resolve(name)
+                program = self.programs.load(path) if self.programs is not None else self.compile(path)
+                if program.name != name:
+                    raise LinkingError(f'{path} defines program "{program.name}", expected "{name}"')
+                self.modules[name] = program
+            return self.modules[name]
+
+    def link(self, program:Program) -> dict:
+        '''Load every program reachable through CALL from program and check the call graph statically:
+        it has to be acyclic, no deeper than CALL_STACK_DEPTH, and a variable has one type across all programs.
+        @Returns
+            dict        linked["NAME"] = Program, including program itself
+        '''
+        with self.lock:
+            return self._link(program)
+
+    def _link(self, program:Program) -> dict:
+        self.modules[program.name] = program
+        linked:dict = dict()
+        depths:dict = dict() # depths["NAME"] = longest chain of CALLs starting at NAME
+        path:list = []
+        def visit(p:Program) -> int:
+            if p.name in depths:
+                return depths[p.name]
+            if p.name in path:
+                cycle = path[path.index(p.name):] + [p.name]
+                raise LinkingError(f'Circular CALL: {" -> ".join(cycle)}')
+            path.append(p.name)
+            linked[p.name] = p
+            depth = 0
+            for name in p.calls():
+                depth = max(depth, 1 + visit(self.load(name)))
+            path.pop()
+            depths[p.name] = depth
+            return depth
+        if visit(program) > CALL_STACK_DEPTH:
+            raise LinkingError(f'CALLs from "{program.name}" nest {depths[program.name]} deep, the limit is {CALL_STACK_DEPTH}')
+        type_map:dict = dict()
+        for p in linked.values():
+            for var, dtype in p.type_map.items():
+                if type_map.setdefault(var, (dtype, p.name))[0] != dtype:
+                    raise LinkingError(f'{var} is {dtype.name} in "{p.name}" but {type_map[var][0].name} in "{type_map[var][1]}"')
+        return linked
+
+
+class ProgramCache():
+    '''Compiled programs by path, recompiled only when their file changes. Safe to share between threads'''
+    def __init__(self):
+        self.programs:dict = dict() # programs["path"] = (mtime, Program)
+        self.lock:threading.Lock = threading.Lock()
+
+    def load(self, path:typing.Union[os.PathLike, str]) -> Program:
+        path = str(path)
+        mtime = os.stat(path).st_mtime
+        with self.lock:
+            cached = self.programs.get(path)
+            if cached is None or cached[0] != mtime:
+                cached = (mtime, Linker.compile(pathlib.Path(path)))
+                self.programs[path] = cached
+            return cached[1]
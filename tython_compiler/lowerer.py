@@ -1,30 +1,531 @@
-"""Define AST->ASM Lowerer
+"""Define AST->C Lowerer
 Author: Ty Brennan
 """
 
 import os, sys
-import functools
-import time
-import enum
+import math
 import typing
-import re
+import shutil
+import subprocess
+import tempfile
 
-from pprint import pprint
 from .token_types import *
-from .token import Token
 from .node import Node
 from .error import LoweringError
+from .opcodes import *
+from .assembler import Assembler, Program
+from .datatypes import Datatypes, INTEGER_DATATYPES, promote_datatypes
+from .metrics import measured
+from . import mathlib
 
+C_TYPES:dict = {
+    Datatypes.INT32: 'int32_t',
+    Datatypes.INT64: 'int64_t',
+    Datatypes.REAL32: 'float',
+    Datatypes.REAL64: 'double',
+    Datatypes.CHAR8: 'uint8_t',
+}
+C_OPERATORS:dict = {
+    OPCODE.ADD: '+',
+    OPCODE.SUBTRACT: '-',
+    OPCODE.MULTIPLY: '*',
+    OPCODE.DIVIDE: '/',
+    OPCODE.GREATER_THAN: '>',
+    OPCODE.LESS_THAN: '<',
+    OPCODE.GE_THAN: '>=',
+    OPCODE.LE_THAN: '<=',
+    OPCODE.EQUAL_TO: '==',
+    OPCODE.NOT_EQUAL_TO: '!=',
+    OPCODE.LOGICAL_AND: '&&',
+    OPCODE.LOGICAL_OR: '||',
+}
+REGION_UNSUPPORTED_OPCODES:set = {
+    OPCODE.STORE_DIM, # buffers belong to the interpreter
+    OPCODE.STORE_STRING,
+    OPCODE.DISP, # output goes through the interpreter
+    OPCODE.DISP_STR,
+    OPCODE.CALL,
+    OPCODE.PROMPT, # input goes through the interpreter
+}
+C_COMPILERS:tuple = ('cc', 'gcc', 'clang')
+BIASED_FRACTION:float = 0.9 # branches taken (or not taken) at least this often are hinted to the C compiler
+# the math functions must not be evaluated at compile time, GCC rounds constant folded ones differently than libm.
+# Signed overflow wraps like in the interpreter, without -fwrapv it is undefined and optimized away
+CFLAGS:list = ['-std=c99', '-O2', '-ffp-contract=off', '-fwrapv',
+               *[f'-fno-builtin-{name}' for name in ('sin', 'cos', 'tan', 'asin', 'acos', 'atan')]]
+LDFLAGS:list = ['-lm']
+
+C_HEADER:str = r'''#include <inttypes.h>
+#include <math.h>
+#include <setjmp.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+/* Branch hints from a profile, see Program.branch_probabilities */
+#if defined(__GNUC__)
+#define TY_LIKELY(x) __builtin_expect(!!(x), 1)
+#define TY_UNLIKELY(x) __builtin_expect(!!(x), 0)
+#else
+#define TY_LIKELY(x) (x)
+#define TY_UNLIKELY(x) (x)
+#endif
+'''
+
+# Standalone executables report runtime errors and exit
+C_FAIL_EXIT:str = r'''
+static void ty_fail(const char *message, int line) {
+    fflush(stdout);
+    fprintf(stderr, "Runtime error on line %d: %s\n", line, message);
+    exit(1);
+}
+'''
+
+# Native regions loaded into the interpreter hand runtime errors back to it
+# Thread local, the same region may run on several threads at once
+C_FAIL_RETURN:str = r'''
+static _Thread_local jmp_buf ty_error_jump;
+static _Thread_local const char *ty_error_message;
+static _Thread_local int ty_error_line;
+
+static void ty_fail(const char *message, int line) {
+    ty_error_message = message;
+    ty_error_line = line;
+    longjmp(ty_error_jump, 1);
+}
+
+const char *ty_last_error_message(void) { return ty_error_message; }
+int ty_last_error_line(void) { return ty_error_line; }
+'''
+
+C_RUNTIME:str = r'''
+/* Shortest representation that reads back as the same value, identical to the interpreter */
+static void ty_disp_real(double value, int max_precision, int single) {
+    char buffer[64];
+    char *e;
+    int precision;
+    if (value != value) { puts("nan"); return; } /* printf writes -nan for some */
+    for (precision = 1; precision <= max_precision; precision++) {
+        snprintf(buffer, sizeof buffer, "%.*g", precision, value);
+        double parsed = strtod(buffer, NULL);
+        if (single ? (float)parsed == (float)value : parsed == value) break;
+    }
+    if (precision > max_precision) precision = max_precision;
+    e = strchr(buffer, 'e');
+    if (e != NULL) {
+        int exponent = atoi(e + 1);
+        if (0 <= exponent && exponent < max_precision)
+            snprintf(buffer, sizeof buffer, "%.*g", precision > exponent + 1 ? precision : exponent + 1, value);
+    }
+    puts(buffer);
+}
+
+static int64_t ty_index(int64_t index, int64_t dim, int line) {
+    if (index < 0 || index >= dim) ty_fail("array index out of range", line);
+    return index;
+}
+
+static void *ty_dim(void *data, int64_t *dim, int64_t new_dim, size_t width, int line) {
+    if (new_dim < 0) ty_fail("array dimension must not be negative", line);
+    data = realloc(data, (size_t)(new_dim > 0 ? new_dim : 1) * width);
+    if (data == NULL) ty_fail("out of memory", line);
+    if (new_dim > *dim) memset((char *)data + *dim * (int64_t)width, 0, (size_t)(new_dim - *dim) * width);
+    *dim = new_dim;
+    return data;
+}
+
+/* A CHAR8 array holding a string, one byte per element */
+static uint8_t *ty_assign_bytes(uint8_t *data, int64_t *dim, const char *bytes, int64_t length, int line) {
+    data = ty_dim(data, dim, length, 1, line);
+    memcpy(data, bytes, (size_t)length);
+    return data;
+}
+
+static void ty_disp_bytes(const uint8_t *data, int64_t dim) {
+    fwrite(data, 1, (size_t)dim, stdout);
+    putchar('\n');
+}
+
+/* One number per line of standard input, integers are read exactly and truncated when written as reals */
+static void ty_prompt_line(char *buffer, size_t size, int line) {
+    if (fgets(buffer, (int)size, stdin) == NULL) ty_fail("PROMPT: end of input", line);
+}
+
+static double ty_prompt_real(int line) {
+    char buffer[128], *end;
+    double value;
+    ty_prompt_line(buffer, sizeof buffer, line);
+    value = strtod(buffer, &end);
+    while (*end == ' ' || *end == '\t' || *end == '\r' || *end == '\n') end++;
+    if (end == buffer || *end != '\0') ty_fail("PROMPT: cannot read a number", line);
+    return value;
+}
+
+static int64_t ty_prompt_int(int line) {
+    char buffer[128], *end;
+    int64_t value;
+    ty_prompt_line(buffer, sizeof buffer, line);
+    value = (int64_t)strtoll(buffer, &end, 10);
+    while (*end == ' ' || *end == '\t' || *end == '\r' || *end == '\n') end++;
+    if (*end != '\0') {
+        double real = strtod(buffer, &end);
+        while (*end == ' ' || *end == '\t' || *end == '\r' || *end == '\n') end++;
+        if (end == buffer || *end != '\0') ty_fail("PROMPT: cannot read a number", line);
+        value = (int64_t)real;
+    }
+    return value;
+}
+
+/* INT32_MIN / -1 and INT64_MIN / -1 trap on most machines, the interpreter wraps them around to INT32_MIN and INT64_MIN */
+static int32_t ty_divide_i32(int32_t a, int32_t b, int line) {
+    if (b == 0) ty_fail("integer division by zero", line);
+    if (b == -1) return (int32_t)(0u - (uint32_t)a);
+    return a / b;
+}
+
+static int64_t ty_divide_i64(int64_t a, int64_t b, int line) {
+    if (b == 0) ty_fail("integer division by zero", line);
+    if (b == -1) return (int64_t)(0u - (uint64_t)a);
+    return a / b;
+}
+'''
+
+
+def _single(value:float) -> str:
+    return f'{value.hex()}f' # exact
+
+# The double precision functions of mathlib.DOUBLE_FUNCTIONS and the single precision operations of
+# mathlib.FAST_FUNCTIONS, in the same order so that every engine gives the same bits
+C_MATH_RUNTIME:str = f'''
+static double ty_cot(double x) {{ return 1.0 / tan(x); }}
+static double ty_sec(double x) {{ return 1.0 / cos(x); }}
+static double ty_csc(double x) {{ return 1.0 / sin(x); }}
+static double ty_asec(double x) {{ return acos(1.0 / x); }}
+static double ty_acsc(double x) {{ return asin(1.0 / x); }}
+static double ty_acot(double x) {{
+    if (fabs(x) > 1.0) {{
+        double y = atan(1.0 / x);
+        return x < 0 ? y + {math.pi!r} : y;
+    }}
+    return {math.pi / 2!r} - atan(x);
+}}
+
+static float ty_fast_sincos(float x, int cosine) {{
+    float j, r, z, s, c;
+    int quadrant;
+    if (!(fabsf(x) <= {_single(mathlib.FAST_REDUCTION_LIMIT)})) return (float)(cosine ? cos((double)x) : sin((double)x));
+    j = (x * {_single(mathlib.TWO_OVER_PI)} + {_single(mathlib.ROUNDING_SHIFTER)}) - {_single(mathlib.ROUNDING_SHIFTER)};
+    r = ((x - j * {_single(mathlib.PI_OVER_TWO[0])}) - j * {_single(mathlib.PI_OVER_TWO[1])}) - j * {_single(mathlib.PI_OVER_TWO[2])};
+    z = r * r;
+    s = (({_single(mathlib.SIN_COEFFICIENTS[0])} * z + {_single(mathlib.SIN_COEFFICIENTS[1])}) * z + {_single(mathlib.SIN_COEFFICIENTS[2])}) * z * r + r;
+    c = (({_single(mathlib.COS_COEFFICIENTS[0])} * z + {_single(mathlib.COS_COEFFICIENTS[1])}) * z + {_single(mathlib.COS_COEFFICIENTS[2])}) * z * z - 0.5f * z + 1.0f;
+    quadrant = ((int)j + cosine) & 3;
+    s = quadrant & 1 ? c : s;
+    return quadrant & 2 ? -s : s;
+}}
+
+static float ty_fast_atan(float x) {{
+    float a = fabsf(x), y = 0.0f, z;
+    if (x != x) return x;
+    if (a > {_single(mathlib.TAN_3PI_8)}) {{ y = {_single(mathlib.SINGLE_PI_OVER_2)}; a = -1.0f / a; }}
+    else if (a > {_single(mathlib.TAN_PI_8)}) {{ y = {_single(mathlib.SINGLE_PI_OVER_4)}; a = (a - 1.0f) / (a + 1.0f); }}
+    z = a * a;
+    y = y + (((({_single(mathlib.ATAN_COEFFICIENTS[0])} * z + {_single(mathlib.ATAN_COEFFICIENTS[1])}) * z + {_single(mathlib.ATAN_COEFFICIENTS[2])}) * z + {_single(mathlib.ATAN_COEFFICIENTS[3])}) * z * a + a);
+    return x < 0 ? -y : y;
+}}
+
+static float ty_fast_acot(float x) {{
+    if (fabsf(x) > 1.0f) {{
+        float y = ty_fast_atan(1.0f / x);
+        return x < 0 ? y + {_single(mathlib.SINGLE_PI)} : y;
+    }}
+    return {_single(mathlib.SINGLE_PI_OVER_2)} - ty_fast_atan(x);
+}}
+
+static float ty_fast_sin(float x) {{ return ty_fast_sincos(x, 0); }}
+static float ty_fast_cos(float x) {{ return ty_fast_sincos(x, 1); }}
+static float ty_fast_tan(float x) {{ return ty_fast_sincos(x, 0) / ty_fast_sincos(x, 1); }}
+static float ty_fast_cot(float x) {{ return ty_fast_sincos(x, 1) / ty_fast_sincos(x, 0); }}
+static float ty_fast_sec(float x) {{ return 1.0f / ty_fast_sincos(x, 1); }}
+static float ty_fast_csc(float x) {{ return 1.0f / ty_fast_sincos(x, 0); }}
+'''
+C_MATH_FUNCTIONS:dict = {
+    OPCODE.SIN: 'sin',
+    OPCODE.COS: 'cos',
+    OPCODE.TAN: 'tan',
+    OPCODE.COT: 'ty_cot',
+    OPCODE.SEC: 'ty_sec',
+    OPCODE.CSC: 'ty_csc',
+    OPCODE.ARCSIN: 'asin',
+    OPCODE.ARCCOS: 'acos',
+    OPCODE.ARCTAN: 'atan',
+    OPCODE.ARCCOT: 'ty_acot',
+    OPCODE.ARCSEC: 'ty_asec',
+    OPCODE.ARCCSC: 'ty_acsc',
+}
+C_FAST_MATH_FUNCTIONS:dict = { # REAL32 operands of MATH_FAST instructions
+    OPCODE.SIN: 'ty_fast_sin',
+    OPCODE.COS: 'ty_fast_cos',
+    OPCODE.TAN: 'ty_fast_tan',
+    OPCODE.COT: 'ty_fast_cot',
+    OPCODE.SEC: 'ty_fast_sec',
+    OPCODE.CSC: 'ty_fast_csc',
+    OPCODE.ARCTAN: 'ty_fast_atan',
+    OPCODE.ARCCOT: 'ty_fast_acot',
+}
 
 class Lowerer():
     @classmethod
     def lower(cls, tree:Node) -> str:
+        '''Lower an AST into the source of a standalone C program'''
         root_node:Node = tree
-        assert root_node.token.type == TOKEN_TYPE.PROGRAM
-        pass
+        assert root_node.token.type == TOKEN_TYPE.PROG
+        return cls.lower_program(Assembler.assemble(root_node))
+
+    @classmethod
+    @measured('lower', lambda c_source: {'bytes': len(c_source)})
+    def lower_program(cls, program:Program) -> str:
+        '''Lower an assembled program. Variables become typed static slots and arrays heap buffers'''
+        ret = f'/* Program "{program.name}", generated by the Tython compiler */\n'
+        ret += C_HEADER + C_FAIL_EXIT + C_RUNTIME + C_MATH_RUNTIME + '\n'
+        for var in program.variables:
+            ret += f'static {C_TYPES[program.type_map[var]]} {cls.variable_name(var)};\n'
+        for a_var in program.array_variables:
+            ret += f'static {C_TYPES[program.type_map[a_var]]} *{cls.array_name(a_var)};\n'
+            ret += f'static int64_t {cls.dim_name(a_var)};\n'
+        ret += '\nint main(void) {\n'
+        for line in cls.lower_instructions(program, 0, len(program)):
+            ret += line + '\n'
+        ret += '}\n'
+        return ret
+
+    @classmethod
+    @measured('lower', lambda c_source: {'bytes': len(c_source)})
+    def lower_region(cls, program:Program, start:int, end:int) -> str:
+        '''
+        Lower the instructions start..end into the source of a shared object exporting
+            int64_t ty_region(void **ty_slots, void **ty_arrays, int64_t *ty_dims, int64_t *ty_budget)
+        which works directly on the interpreter's variable slots and array buffers. It returns the
+        instruction pointer to resume interpreting at, or -1 after a runtime error (see ty_last_error_message).
+        Every label passed takes one from the budget, and the label that finds it empty hands back to the
+        interpreter, so that quotas are checked in native loops too
+        '''
+        for ip in range(start, end):
+            if program.opcodes[ip] in REGION_UNSUPPORTED_OPCODES:
+                raise LoweringError(f"Cannot lower {OPCODE(program.opcodes[ip]).name} into a native region (line {program.line_numbers[ip]})")
+        ret = f'/* Region {start}..{end} of program "{program.name}", generated by the Tython compiler */\n'
+        ret += C_HEADER + C_FAIL_RETURN + C_RUNTIME + C_MATH_RUNTIME + '\n'
+        # Variables are macros onto the shared slots, so the body is lowered exactly like a whole program
+        for slot, var in enumerate(program.variables):
+            ret += f'#define {cls.variable_name(var)} (*({C_TYPES[program.type_map[var]]} *)ty_slots[{slot}])\n'
+        for slot, a_var in enumerate(program.array_variables):
+            ret += f'#define {cls.array_name(a_var)} (({C_TYPES[program.type_map[a_var]]} *)ty_arrays[{slot}])\n'
+            ret += f'#define {cls.dim_name(a_var)} (ty_dims[{slot}])\n'
+        ret += '\nint64_t ty_region(void **ty_slots, void **ty_arrays, int64_t *ty_dims, int64_t *ty_budget) {\n'
+        ret += '    if (setjmp(ty_error_jump)) return -1;\n'
+        for line in cls.lower_instructions(program, start, end, region=True):
+            ret += line + '\n'
+        ret += f'    return {end};\n'
+        exits = {program.operands[ip] for ip in range(start, end) if program.opcodes[ip] in JUMP_OPCODES}
+        for ip in sorted(exits):
+            if not start <= ip < end:
+                ret += f'{cls.jump_label(program, ip)}: return {ip};\n'
+        ret += '}\n'
+        return ret
+
+    @classmethod
+    def variable_name(cls, var:str) -> str:
+        return f'v_{var}'
+
+    @classmethod
+    def array_name(cls, a_var:str) -> str:
+        return f'a_{a_var[1:]}'
+
+    @classmethod
+    def dim_name(cls, a_var:str) -> str:
+        return f'n_{a_var[1:]}'
+
+    @classmethod
+    def jump_label(cls, program:Program, ip:int) -> str:
+        if ip < len(program) and program.opcodes[ip] == OPCODE.LABEL:
+            return f'lbl_{program.labels[program.operands[ip]]}'
+        return f'L{ip}'
+
+    @classmethod
+    def string_literal(cls, string:str) -> str:
+        ret = '"'
+        for char in string.encode('utf-8'):
+            if char in b'"\\': ret += '\\' + chr(char)
+            elif 0x20 <= char < 0x7f: ret += chr(char)
+            else: ret += f'\\{char:03o}'
+        return ret + '"'
+
+    @classmethod
+    def constant_literal(cls, value, dtype:Datatypes) -> str:
+        if dtype == Datatypes.INT64: return f'INT64_C({value})'
+        if dtype == Datatypes.REAL32: return f'{float(value)!r}f'
+        if dtype == Datatypes.REAL64: return f'{float(value)!r}'
+        return str(value)
+
+    @classmethod
+    def lower_instructions(cls, program:Program, start:int, end:int, region:bool=False) -> list:
+        '''
+        Lower the instructions start..end into C statements, rebuilding the expressions from postfix order.
+        In a region HALT hands control back to the interpreter instead of ending the process
+        '''
+        lines = []
+        targets = program.jump_targets()
+        stack = [] # stack[-1] = (C expression, Datatypes | None)
+        for ip in range(start, end):
+            opcode = program.opcodes[ip]
+            operand = program.operands[ip]
+            line_number = program.line_numbers[ip]
+            if ip in targets and opcode != OPCODE.LABEL:
+                lines.append(f'{cls.jump_label(program, ip)}: ;')
+            if opcode == OPCODE.PUSH_CONST:
+                value = program.constants[operand]
+                dtype = program.constant_types[operand]
+                if dtype is None: stack.append((cls.string_literal(value), None))
+                else: stack.append((cls.constant_literal(value, dtype), dtype))
+            elif opcode == OPCODE.LOAD:
+                var = program.variables[operand]
+                stack.append((cls.variable_name(var), program.type_map[var]))
+            elif opcode == OPCODE.STORE:
+                var = program.variables[operand]
+                value, _ = stack.pop()
+                lines.append(f'    {cls.variable_name(var)} = ({C_TYPES[program.type_map[var]]})({value});')
+            elif opcode == OPCODE.LOAD_ELEMENT:
+                a_var = program.array_variables[operand]
+                index, _ = stack.pop()
+                stack.append((f'{cls.array_name(a_var)}[ty_index((int64_t)({index}), {cls.dim_name(a_var)}, {line_number})]', program.type_map[a_var]))
+            elif opcode == OPCODE.STORE_ELEMENT:
+                a_var = program.array_variables[operand]
+                index, _ = stack.pop()
+                value, _ = stack.pop()
+                lines.append(f'    {cls.array_name(a_var)}[ty_index((int64_t)({index}), {cls.dim_name(a_var)}, {line_number})] = ({C_TYPES[program.type_map[a_var]]})({value});')
+            elif opcode == OPCODE.LOAD_DIM:
+                stack.append((f'((int32_t){cls.dim_name(program.array_variables[operand])})', Datatypes.INT32))
+            elif opcode == OPCODE.STORE_DIM:
+                a_var = program.array_variables[operand]
+                value, _ = stack.pop()
+                lines.append(f'    {cls.array_name(a_var)} = ty_dim({cls.array_name(a_var)}, &{cls.dim_name(a_var)}, (int64_t)({value}), sizeof *{cls.array_name(a_var)}, {line_number});')
+            elif opcode == OPCODE.STORE_STRING:
+                a_var = program.array_variables[operand]
+                value, _ = stack.pop()
+                lines.append(f'    {cls.array_name(a_var)} = ty_assign_bytes({cls.array_name(a_var)}, &{cls.dim_name(a_var)}, {value}, sizeof {value} - 1, {line_number});')
+            elif opcode in {OPCODE.ADD, OPCODE.SUBTRACT, OPCODE.MULTIPLY, OPCODE.DIVIDE}:
+                rhs, rhs_type = stack.pop()
+                lhs, lhs_type = stack.pop()
+                dtype = promote_datatypes(lhs_type, rhs_type)
+                if opcode == OPCODE.DIVIDE and dtype in INTEGER_DATATYPES:
+                    suffix = 'i64' if dtype == Datatypes.INT64 else 'i32'
+                    stack.append((f'ty_divide_{suffix}({lhs}, {rhs}, {line_number})', dtype))
+                else:
+                    stack.append((f'({lhs} {C_OPERATORS[opcode]} {rhs})', dtype))
+            elif opcode in C_OPERATORS:
+                rhs, _ = stack.pop()
+                lhs, _ = stack.pop()
+                stack.append((f'({lhs} {C_OPERATORS[opcode]} {rhs})', Datatypes.INT32))
+            elif opcode == OPCODE.LOGICAL_NOT:
+                value, _ = stack.pop()
+                stack.append((f'(!{value})', Datatypes.INT32))
+            elif opcode == OPCODE.LOGICAL_NAND:
+                rhs, _ = stack.pop()
+                lhs, _ = stack.pop()
+                stack.append((f'(!({lhs} && {rhs}))', Datatypes.INT32))
+            elif opcode == OPCODE.LOGICAL_NOR:
+                rhs, _ = stack.pop()
+                lhs, _ = stack.pop()
+                stack.append((f'(!({lhs} || {rhs}))', Datatypes.INT32))
+            elif opcode == OPCODE.LOGICAL_XOR:
+                rhs, _ = stack.pop()
+                lhs, _ = stack.pop()
+                stack.append((f'(!{lhs} != !{rhs})', Datatypes.INT32))
+            elif opcode in C_MATH_FUNCTIONS:
+                value, dtype = stack.pop()
+                if dtype == Datatypes.REAL32 and operand == MATH_FAST and opcode in C_FAST_MATH_FUNCTIONS:
+                    stack.append((f'{C_FAST_MATH_FUNCTIONS[opcode]}({value})', dtype))
+                elif dtype == Datatypes.REAL32:
+                    stack.append((f'((float){C_MATH_FUNCTIONS[opcode]}((double)({value})))', dtype))
+                else:
+                    stack.append((f'{C_MATH_FUNCTIONS[opcode]}((double)({value}))', Datatypes.REAL64))
+            elif opcode == OPCODE.LABEL:
+                if region: lines.append(f'{cls.jump_label(program, ip)}: if (--*ty_budget < 0) return {ip};')
+                else: lines.append(f'{cls.jump_label(program, ip)}: ;')
+            elif opcode == OPCODE.JUMP:
+                lines.append(f'    goto {cls.jump_label(program, operand)};')
+            elif opcode in CONDITIONAL_JUMP_OPCODES:
+                if opcode in BRANCH_COMPARISONS:
+                    rhs, _ = stack.pop()
+                    lhs, _ = stack.pop()
+                    condition = f'({lhs} {C_OPERATORS[BRANCH_COMPARISONS[opcode]]} {rhs})'
+                else:
+                    condition, _ = stack.pop()
+                taken = program.branch_probabilities.get(ip)
+                if taken is not None and taken >= BIASED_FRACTION:
+                    lines.append(f'    if (TY_LIKELY(!{condition})) goto {cls.jump_label(program, operand)};')
+                elif taken is not None and taken <= 1 - BIASED_FRACTION:
+                    lines.append(f'    if (TY_UNLIKELY(!{condition})) goto {cls.jump_label(program, operand)};')
+                else:
+                    lines.append(f'    if (!{condition}) goto {cls.jump_label(program, operand)};')
+            elif opcode == OPCODE.HALT:
+                lines.append(f'    return {ip};' if region else '    return 0;')
+            elif opcode == OPCODE.DISP:
+                value, dtype = stack.pop()
+                if dtype is None: lines.append(f'    puts({value});')
+                elif dtype == Datatypes.INT64: lines.append(f'    printf("%" PRId64 "\\n", (int64_t)({value}));')
+                elif dtype == Datatypes.REAL32: lines.append(f'    ty_disp_real((double)({value}), 9, 1);')
+                elif dtype == Datatypes.REAL64: lines.append(f'    ty_disp_real({value}, 17, 0);')
+                else: lines.append(f'    printf("%" PRId32 "\\n", (int32_t)({value}));')
+            elif opcode == OPCODE.DISP_STR:
+                a_var = program.array_variables[operand]
+                lines.append(f'    ty_disp_bytes({cls.array_name(a_var)}, {cls.dim_name(a_var)});')
+            elif opcode == OPCODE.PROMPT:
+                var = program.variables[operand]
+                dtype = program.type_map[var]
+                read = f'ty_prompt_int({line_number})' if dtype in INTEGER_DATATYPES else f'ty_prompt_real({line_number})'
+                lines.append(f'    {cls.variable_name(var)} = ({C_TYPES[dtype]}){read};')
+            elif opcode == OPCODE.CALL:
+                raise LoweringError(f"CALL \"{program.constants[operand]}\" cannot be lowered to C (line {line_number})")
+            else:
+                raise LoweringError(f"Cannot lower instruction {OPCODE(opcode).name} on line {line_number}")
+        return lines
+
+    @classmethod
+    def find_compiler(cls) -> typing.Optional[str]:
+        '''Locate the system C compiler, honouring the CC environment variable'''
+        if os.environ.get('CC'):
+            return shutil.which(os.environ['CC'])
+        for compiler in C_COMPILERS:
+            path = shutil.which(compiler)
+            if path is not None:
+                return path
+        return None
+
+    @classmethod
+    @measured('build', lambda result: {'builds': 1})
+    def build_executable(cls, c_source:str, output_path:typing.Union[os.PathLike, str], extra_flags:list=None) -> None:
+        '''Compile C source into a standalone executable with the system C compiler'''
+        compiler = cls.find_compiler()
+        if compiler is None:
+            raise LoweringError("No C compiler found, install cc/gcc/clang or set CC")
+        if extra_flags is None: extra_flags = []
+        with tempfile.TemporaryDirectory() as directory:
+            source_path = os.path.join(directory, 'program.c')
+            cls.write_to_file(source_path, c_source)
+            command = [compiler, *CFLAGS, *extra_flags, '-o', os.fspath(output_path), source_path, *LDFLAGS]
+            result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise LoweringError(f"C compiler failed with exit code {result.returncode}:\n{result.stderr}")
+
+    @classmethod
+    def build_shared_object(cls, c_source:str, output_path:typing.Union[os.PathLike, str]) -> None:
+        '''Compile C source into a shared object that can be loaded with ctypes'''
+        cls.build_executable(c_source, output_path, extra_flags=['-shared', '-fPIC'])
 
     @classmethod
-    def write_to_file(cls, filepath:typing.Union[typing.FilePath, str], assembly_string:str) -> None:
+    def write_to_file(cls, filepath:typing.Union[os.PathLike, str], assembly_string:str) -> None:
         assert isinstance(assembly_string, str)
         with open(filepath, 'w', encoding='utf-8') as file_handle:
-            file_handle.write(assembly_string)
\ No newline at end of file
+            file_handle.write(assembly_string)
@@ -0,0 +1,236 @@
+"""Define the math runtime of the trigonometric functions
+Author: Ty Brennan
+"""
+
+import math
+import array
+import struct
+import typing
+
+from .opcodes import *
+from .datatypes import Datatypes, DATATYPE_CLASSES
+
+_SINGLE = struct.Struct('f')
+
+def round_single(x:float) -> float:
+    '''Round a double to the nearest REAL32, like a C cast to float'''
+    try:
+        return _SINGLE.unpack(_SINGLE.pack(x))[0]
+    except OverflowError:
+        return math.copysign(math.inf, x)
+
+def _reciprocal(x:float) -> float:
+    try:
+        return 1.0 / x
+    except ZeroDivisionError:
+        return math.copysign(math.inf, x)
+
+def _ieee(function:typing.Callable) -> typing.Callable:
+    '''function with the semantics of C: NaN outside of its domain instead of ValueError'''
+    def wrapper(x:float) -> float:
+        try:
+            return function(x)
+        except ValueError:
+            return math.nan
+    return wrapper
+
+def _arccot(x:float) -> float:
+    if abs(x) > 1.0: # pi/2 - atan(x) would cancel
+        y = math.atan(1.0 / x)
+        return y + math.pi if x < 0 else y
+    return math.pi / 2 - math.atan(x)
+
+# Every function is computed in double precision with exactly the operations of the C runtime of the Lowerer
+# (see C_MATH_FUNCTIONS), so interpreted, JIT compiled and lowered programs print the same digits.
+# ARCCOT is continuous with values in (0, pi)
+DOUBLE_FUNCTIONS:dict = {
+    OPCODE.SIN: _ieee(math.sin),
+    OPCODE.COS: _ieee(math.cos),
+    OPCODE.TAN: _ieee(math.tan),
+    OPCODE.COT: _ieee(lambda x: _reciprocal(math.tan(x))),
+    OPCODE.SEC: _ieee(lambda x: _reciprocal(math.cos(x))),
+    OPCODE.CSC: _ieee(lambda x: _reciprocal(math.sin(x))),
+    OPCODE.ARCSIN: _ieee(math.asin),
+    OPCODE.ARCCOS: _ieee(math.acos),
+    OPCODE.ARCTAN: _ieee(math.atan),
+    OPCODE.ARCCOT: _ieee(_arccot),
+    OPCODE.ARCSEC: _ieee(lambda x: math.acos(_reciprocal(x))),
+    OPCODE.ARCCSC: _ieee(lambda x: math.asin(_reciprocal(x))),
+}
+
+def result_datatype(dtype:Datatypes) -> Datatypes:
+    '''Datatype of a math function of an operand: REAL32 stays REAL32, everything else is computed in REAL64'''
+    return Datatypes.REAL32 if dtype == Datatypes.REAL32 else Datatypes.REAL64
+
+"""====> REDUCED PRECISION REAL32 <===="""
+# Cody-Waite reduction by pi/2 and the minimax polynomials of Cephes, evaluated in single precision. The
+# Python versions round after every operation, which gives the result of the C float operations bit for bit.
+# Errors stay within a few units in the last place, operands beyond FAST_REDUCTION_LIMIT, infinities and NaN
+# take the exact path
+FAST_REDUCTION_LIMIT:float = 8192.0
+ROUNDING_SHIFTER:float = 12582912.0 # 1.5 * 2**23, adding and subtracting it rounds to an integer, ties to even
+TWO_OVER_PI:float = round_single(2 / math.pi)
+PI_OVER_TWO:tuple = (1.5703125, round_single(4.837512969970703125e-4), round_single(7.54978995489188216e-8)) # sums to pi/2
+SIN_COEFFICIENTS:tuple = tuple(map(round_single, (-1.9515295891e-4, 8.3321608736e-3, -1.6666654611e-1)))
+COS_COEFFICIENTS:tuple = tuple(map(round_single, (2.443315711809948e-5, -1.388731625493765e-3, 4.166664568298827e-2)))
+ATAN_COEFFICIENTS:tuple = tuple(map(round_single, (8.05374449538e-2, -1.38776856032e-1, 1.99777106478e-1, -3.33329491539e-1)))
+TAN_3PI_8:float = round_single(2.414213562373095)
+TAN_PI_8:float = round_single(0.4142135623730950)
+SINGLE_PI_OVER_2:float = round_single(math.pi / 2)
+SINGLE_PI_OVER_4:float = round_single(math.pi / 4)
+SINGLE_PI:float = round_single(math.pi)
+
+def _fast_sincos(x:float, cosine:int) -> float:
+    f = round_single
+    if not abs(x) <= FAST_REDUCTION_LIMIT:
+        return f(math.cos(x) if cosine else math.sin(x)) if math.isfinite(x) else math.nan
+    j = f(f(f(x * TWO_OVER_PI) + ROUNDING_SHIFTER) - ROUNDING_SHIFTER)
+    r = f(f(f(x - f(j * PI_OVER_TWO[0])) - f(j * PI_OVER_TWO[1])) - f(j * PI_OVER_TWO[2]))
+    z = f(r * r)
+    s0, s1, s2 = SIN_COEFFICIENTS
+    c0, c1, c2 = COS_COEFFICIENTS
+    s = f(f(f(f(f(f(f(s0 * z) + s1) * z) + s2) * z) * r) + r)
+    c = f(f(f(f(f(f(f(f(c0 * z) + c1) * z) + c2) * z) * z) - f(0.5 * z)) + 1.0)
+    quadrant = (int(j) + cosine) & 3
+    value = c if quadrant & 1 else s
+    return -value if quadrant & 2 else value
+
+def _fast_atan(x:float) -> float:
+    f = round_single
+    if math.isnan(x):
+        return x
+    a = abs(x)
+    if a > TAN_3PI_8:
+        y, a = SINGLE_PI_OVER_2, f(-1.0 / a)
+    elif a > TAN_PI_8:
+        y, a = SINGLE_PI_OVER_4, f(f(a - 1.0) / f(a + 1.0))
+    else:
+        y = 0.0
+    z = f(a * a)
+    t0, t1, t2, t3 = ATAN_COEFFICIENTS
+    y = f(y + f(f(f(f(f(f(f(f(f(t0 * z) + t1) * z) + t2) * z) + t3) * z) * a) + a))
+    return -y if x < 0 else y
+
+def _fast_arccot(x:float) -> float:
+    if abs(x) > 1.0:
+        y = _fast_atan(round_single(1.0 / x))
+        return round_single(y + SINGLE_PI) if x < 0 else y
+    return round_single(SINGLE_PI_OVER_2 - _fast_atan(x))
+
+def _fast_quotient(a:float, b:float) -> float:
+    '''REAL32 division of the fast results, IEEE 754 at poles'''
+    try:
+        return round_single(a / b)
+    except ZeroDivisionError:
+        return math.nan if a == 0 or math.isnan(a) else math.copysign(math.inf, a) * math.copysign(1.0, b)
+
+# REAL32 functions of MATH_FAST instructions, the inverse functions other than ARCTAN and ARCCOT always run exactly
+FAST_FUNCTIONS:dict = {
+    OPCODE.SIN: lambda x: _fast_sincos(x, 0),
+    OPCODE.COS: lambda x: _fast_sincos(x, 1),
+    OPCODE.TAN: lambda x: _fast_quotient(_fast_sincos(x, 0), _fast_sincos(x, 1)),
+    OPCODE.COT: lambda x: _fast_quotient(_fast_sincos(x, 1), _fast_sincos(x, 0)),
+    OPCODE.SEC: lambda x: _fast_quotient(1.0, _fast_sincos(x, 1)),
+    OPCODE.CSC: lambda x: _fast_quotient(1.0, _fast_sincos(x, 0)),
+    OPCODE.ARCTAN: _fast_atan,
+    OPCODE.ARCCOT: _fast_arccot,
+}
+
+"""====> SCALAR AND VECTORIZED EVALUATION <===="""
+
+def scalar_function(opcode:OPCODE, dtype:Datatypes, precision:int=MATH_EXACT) -> typing.Callable:
+    '''The function from the Python value of an operand to the Python value of the result, already rounded to
+    result_datatype(dtype), so only the result needs to be boxed'''
+    if dtype == Datatypes.REAL32:
+        if precision == MATH_FAST and opcode in FAST_FUNCTIONS:
+            return FAST_FUNCTIONS[opcode]
+        double = DOUBLE_FUNCTIONS[opcode]
+        return lambda x: round_single(double(x))
+    return DOUBLE_FUNCTIONS[opcode]
+
+class ScalarFunctions(dict):
+    '''ScalarFunctions()[opcode, precision, dtype] = (scalar function, DType class of the result), built on first use'''
+    def __missing__(self, key:tuple) -> tuple:
+        opcode, precision, dtype = key
+        self[key] = (scalar_function(opcode, dtype, precision), DATATYPE_CLASSES[result_datatype(dtype)])
+        return self[key]
+
+def evaluate_array(opcode:OPCODE, values, dtype:Datatypes, precision:int=MATH_EXACT):
+    '''
+    A math function of every element of a typed array
+    @Params
+        opcode:OPCODE       The function
+        values              An array.array or NumPy array of operands, all of datatype dtype
+        dtype:Datatypes     The datatype of the operands
+        precision:int       MATH_EXACT or MATH_FAST
+    @Returns
+        array.array 'f'/'d' of an array.array, a NumPy float32/float64 array of a NumPy array, with the same
+        elements as scalar_function gives one by one. Fast REAL32 functions run as NumPy operations when NumPy
+        is installed, everything else maps the scalar function: NumPy's own sin and cos do not round like libm
+    '''
+    typecode = 'f' if result_datatype(dtype) == Datatypes.REAL32 else 'd'
+    if isinstance(values, array.array):
+        np = _numpy()
+        if np is None or not (precision == MATH_FAST and dtype == Datatypes.REAL32 and opcode in _FAST_UFUNCS):
+            return array.array(typecode, map(scalar_function(opcode, dtype, precision), values))
+        return array.array(typecode, evaluate_array(opcode, np.frombuffer(values, dtype=np.float32), dtype, precision).tobytes())
+    np = _numpy()
+    if precision == MATH_FAST and dtype == Datatypes.REAL32 and opcode in _FAST_UFUNCS:
+        with np.errstate(all='ignore'):
+            return _FAST_UFUNCS[opcode](np, values.astype(np.float32, copy=False))
+    function = scalar_function(opcode, dtype, precision)
+    return np.fromiter(map(function, values.tolist()), dtype=np.float32 if typecode == 'f' else np.float64, count=len(values))
+
+def _numpy():
+    try:
+        import numpy as np # optional, imported on the first vectorized call so that importing mathlib stays cheap
+    except ImportError:
+        return None
+    return np
+
+def _vector_sincos(np, x, cosine:int):
+    f = np.float32
+    small = np.abs(x) <= f(FAST_REDUCTION_LIMIT)
+    reduced = np.where(small, x, f(0))
+    j = (reduced * f(TWO_OVER_PI) + f(ROUNDING_SHIFTER)) - f(ROUNDING_SHIFTER)
+    r = ((reduced - j * f(PI_OVER_TWO[0])) - j * f(PI_OVER_TWO[1])) - j * f(PI_OVER_TWO[2])
+    z = r * r
+    s0, s1, s2 = map(f, SIN_COEFFICIENTS)
+    c0, c1, c2 = map(f, COS_COEFFICIENTS)
+    s = ((s0 * z + s1) * z + s2) * z * r + r
+    c = ((c0 * z + c1) * z + c2) * z * z - f(0.5) * z + f(1.0)
+    quadrant = (j.astype(np.int64) + cosine) & 3
+    value = np.where(quadrant & 1, c, s)
+    value = np.where(quadrant & 2, -value, value)
+    if not small.all(): # large operands, infinities and NaN take the exact path like the scalar version
+        exact = np.flatnonzero(~small)
+        value[exact] = [_fast_sincos(v, cosine) for v in x[exact].tolist()]
+    return value
+
+def _vector_atan(np, x):
+    f = np.float32
+    a = np.abs(x)
+    large, medium = a > f(TAN_3PI_8), (a > f(TAN_PI_8)) & (a <= f(TAN_3PI_8))
+    y = np.where(large, f(SINGLE_PI_OVER_2), np.where(medium, f(SINGLE_PI_OVER_4), f(0)))
+    a = np.where(large, f(-1.0) / a, np.where(medium, (a - f(1.0)) / (a + f(1.0)), a))
+    z = a * a
+    t0, t1, t2, t3 = map(f, ATAN_COEFFICIENTS)
+    y = y + ((((t0 * z + t1) * z + t2) * z + t3) * z * a + a)
+    return np.where(np.isnan(x), x, np.where(x < 0, -y, y))
+
+def _vector_arccot(np, x):
+    f = np.float32
+    outer = np.abs(x) > f(1.0)
+    inverse = _vector_atan(np, f(1.0) / np.where(outer, x, f(1.0)))
+    return np.where(outer, np.where(x < 0, inverse + f(SINGLE_PI), inverse), f(SINGLE_PI_OVER_2) - _vector_atan(np, x))
+
+_FAST_UFUNCS:dict = {
+    OPCODE.SIN: lambda np, x: _vector_sincos(np, x, 0),
+    OPCODE.COS: lambda np, x: _vector_sincos(np, x, 1),
+    OPCODE.TAN: lambda np, x: _vector_sincos(np, x, 0) / _vector_sincos(np, x, 1),
+    OPCODE.COT: lambda np, x: _vector_sincos(np, x, 1) / _vector_sincos(np, x, 0),
+    OPCODE.SEC: lambda np, x: np.float32(1.0) / _vector_sincos(np, x, 1),
+    OPCODE.CSC: lambda np, x: np.float32(1.0) / _vector_sincos(np, x, 0),
+    OPCODE.ARCTAN: _vector_atan,
+    OPCODE.ARCCOT: _vector_arccot,
+}
@@ -0,0 +1,196 @@
+"""Define memory accounting of interpreter state and compiled artifacts
+Author: Ty Brennan
+"""
+
+import os, sys
+import enum
+import json
+import types
+import array
+import typing
+
+from .datatypes import Array, DATATYPE_CLASSES
+
+MEMORY_REPORT_FORMAT_VERSION:int = 1
+CATEGORIES:tuple = ('scalar', 'array', 'program', 'native', 'tokens', 'ast')
+INSTRUCTION_SIZE:int = 12 # opcode, operand and line number as int32, like in a program image
+# shared with the rest of the process, never counted as part of an object
+SHARED_TYPES:tuple = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+                      enum.Enum, bool, type(None))
+LEAF_TYPES:tuple = (int, float, complex, str, bytes, bytearray, array.array, memoryview)
+
+try:
+    import resource
+except ImportError: # not on Windows
+    resource = None
+
+
+def deep_size(obj, exclude:typing.Iterable=()) -> int:
+    '''
+    Bytes Python allocated for obj and everything it references, each object counted once. Classes, functions,
+    modules, enum members and cached small integers are shared with the rest of the process and not counted
+    @Params
+        exclude:Iterable    Objects accounted for elsewhere, not counted and not followed
+    '''
+    seen = {id(o) for o in exclude}
+    size, pending = 0, [obj]
+    while pending:
+        o = pending.pop()
+        if id(o) in seen or isinstance(o, SHARED_TYPES) or (type(o) is int and -5 <= o <= 256):
+            continue
+        seen.add(id(o))
+        size += sys.getsizeof(o)
+        if isinstance(o, LEAF_TYPES):
+            continue
+        if isinstance(o, dict):
+            pending.extend(o.keys())
+            pending.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            pending.extend(o)
+        else:
+            attributes = getattr(o, '__dict__', None)
+            if attributes is not None and id(attributes) not in seen:
+                seen.add(id(attributes))
+                size += sys.getsizeof(attributes)
+                pending.extend(attributes.values()) # attribute names are interned and shared
+            for slot in getattr(type(o), '__slots__', ()):
+                if hasattr(o, slot):
+                    pending.append(getattr(o, slot))
+    return size
+
+
+def program_size(program) -> int:
+    '''Declared size of an assembled program: its instructions and constants (DType.size, strings as UTF-8)'''
+    constants = sum(len(c.encode('utf-8')) if t is None else DATATYPE_CLASSES[t]._size
+                    for c, t in zip(program.constants, program.constant_types))
+    return len(program) * INSTRUCTION_SIZE + constants
+
+
+def peak_rss() -> typing.Optional[int]:
+    '''High-water mark of the resident memory of this process in bytes, None where it is unknown'''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024 # kilobytes on Linux
+
+
+class ArrayAccount(object):
+    '''Logical (DType.size) and allocated bytes of the arrays of one run, with their high-water marks.
+    Arrays only grow and shrink through resize and assign_bytes, which also enforce the array memory quota'''
+    def __init__(self, arrays:typing.Iterable, quotas=None):
+        unique = {id(a): a for a in arrays}.values() # programs linked together share their arrays
+        self.quotas = quotas
+        self.logical:int = sum(a.size for a in unique)
+        self.allocated:int = sum(sys.getsizeof(a.buffer) for a in unique)
+        self.peak_logical:int = self.logical
+        self.peak_allocated:int = self.allocated
+
+    def resize(self, a:Array, dim:int, line_number:int):
+        if self.quotas is not None:
+            self.quotas.charge_array(self.logical, a, dim, line_number)
+        logical, allocated = a.size, sys.getsizeof(a.buffer)
+        a.resize(dim)
+        self.charge(a, logical, allocated)
+
+    def assign_bytes(self, a:Array, data:bytes, line_number:int):
+        if self.quotas is not None:
+            self.quotas.charge_array(self.logical, a, len(data), line_number)
+        logical, allocated = a.size, sys.getsizeof(a.buffer)
+        a.assign_bytes(data)
+        self.charge(a, logical, allocated)
+
+    def charge(self, a:Array, logical:int, allocated:int):
+        '''Account for an array that had logical and allocated bytes before it changed'''
+        self.logical += a.size - logical
+        self.allocated += sys.getsizeof(a.buffer) - allocated
+        self.peak_logical = max(self.peak_logical, self.logical)
+        self.peak_allocated = max(self.peak_allocated, self.allocated)
+
+    def high_water(self) -> dict:
+        return {'array_bytes': self.peak_logical, 'array_allocated': self.peak_allocated}
+
+
+class MemoryReport(object):
+    '''Bytes used by interpreter state and compiled artifacts. Every entry has a logical size, from the declared
+    DType.size of its values (None where there are none, e.g. tokens), and a real size, what Python allocated for it:
+
+        report = tc.MemoryReport()
+        report.add_tokens(tokens)
+        report.add_tree(tree)
+        report.add_interpreter(interpreter)
+        print(report.report())
+    '''
+    def __init__(self):
+        self.entries:list = [] # entries[k] = {"category", "name", "logical", "real", "detail"}
+        self.high_water:dict = dict() # peaks of the last run of an added interpreter
+
+    def add(self, category:str, name:str, logical:typing.Optional[int], real:int, detail:str=''):
+        assert category in CATEGORIES, category
+        self.entries.append({'category': category, 'name': name, 'logical': logical, 'real': real, 'detail': detail})
+
+    def add_tokens(self, tokens:list, name:str='<source>'):
+        self.add('tokens', name, None, deep_size(tokens), f'{len(tokens)} tokens')
+
+    def add_tree(self, tree, name:str='<source>'):
+        self.add('ast', name, None, deep_size(tree), f'{tree.size()} nodes')
+
+    def add_program(self, program, loaded=None, exclude:typing.Iterable=()):
+        '''An assembled program, with the JIT state and native regions of a LoadedProgram if given'''
+        real = deep_size(program, exclude)
+        if loaded is not None: # the slots and arrays are reported as variables
+            real += deep_size(loaded, [program, *loaded.slots, *loaded.arrays, *exclude])
+        self.add('program', program.name, program_size(program), real, f'{len(program)} instructions')
+        for label, region in zip(program.labels, loaded.native_regions if loaded is not None else ()):
+            if region is not None:
+                self.add('native', f'{program.name}:{label}', None, os.path.getsize(region.library._name),
+                         f'{region.length} instructions')
+
+    def add_interpreter(self, interpreter):
+        '''The variables, loaded programs, programs cached by the linker and high-water marks of an Interpreter'''
+        for var, value in sorted(interpreter.variables.items()):
+            self.add('scalar', var, value.size, deep_size(value), value.meta_dtype.name)
+        for a_var, a in sorted(interpreter.array_variables.items()):
+            self.add('array', a_var, a.size, deep_size(a), f'{a.dtype.name}[{a.dim}]')
+        shared = [*interpreter.variables.values(), *interpreter.array_variables.values()]
+        reported = set()
+        for loaded in interpreter.loaded_programs.values():
+            self.add_program(loaded.program, loaded, shared)
+            reported.add(id(loaded.program))
+        for program in list(interpreter.linker.modules.values()):
+            if id(program) not in reported:
+                self.add_program(program, exclude=shared)
+        self.high_water = dict(interpreter.high_water)
+
+    def totals(self) -> dict:
+        '''totals["category"] = {"count", "logical" (None if no entry has one), "real"}'''
+        totals = {}
+        for entry in self.entries:
+            total = totals.setdefault(entry['category'], {'count': 0, 'logical': None, 'real': 0})
+            total['count'] += 1
+            if entry['logical'] is not None:
+                total['logical'] = (total['logical'] or 0) + entry['logical']
+            total['real'] += entry['real']
+        return totals
+
+    def to_dict(self) -> dict:
+        return {'version': MEMORY_REPORT_FORMAT_VERSION, 'entries': self.entries, 'totals': self.totals(),
+                'high_water': self.high_water, 'peak_rss': peak_rss()}
+
+    def dump(self, path:typing.Union[os.PathLike, str]):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+    def report(self) -> str:
+        '''The report as a table, sizes in bytes'''
+        out = [f'{"category":<9} {"name":<20} {"logical":>10} {"real":>10}  detail']
+        for e in self.entries:
+            logical = '-' if e['logical'] is None else e['logical']
+            out.append(f'{e["category"]:<9} {e["name"]:<20} {logical:>10} {e["real"]:>10}  {e["detail"]}')
+        for category, total in self.totals().items():
+            logical = '-' if total['logical'] is None else total['logical']
+            out.append(f'{"total":<9} {category:<20} {logical:>10} {total["real"]:>10}  {total["count"]} entries')
+        for mark, value in self.high_water.items():
+            out.append(f'{"peak":<9} {mark:<20} {value:>21}')
+        if peak_rss() is not None:
+            out.append(f'{"peak":<9} {"process rss":<20} {peak_rss():>21}')
+        return '\n'.join(out)
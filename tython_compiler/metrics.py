@@ -0,0 +1,141 @@
+"""Define pipeline metrics
+Author: Ty Brennan
+"""
+
+import os, sys
+import gc
+import json
+import time
+import typing
+import functools
+import threading
+import contextlib
+import contextvars
+
+METRICS_FORMAT_VERSION:int = 1
+
+_active:contextvars.ContextVar = contextvars.ContextVar('tython_metrics', default=None) # the recording Metrics
+_running:contextvars.ContextVar = contextvars.ContextVar('tython_phases', default=()) # phases entered, innermost last
+
+
+class PhaseMetrics(object):
+    '''Totals of one phase over every time it ran'''
+    def __init__(self, name:str):
+        self.name:str = name
+        self.calls:int = 0
+        self.wall_time:int = 0 # nanoseconds
+        self.allocated_blocks:int = 0 # net memory blocks allocated by the interpreter, sys.getallocatedblocks
+        self.collections:int = 0 # garbage collector runs
+        self.items:dict = dict() # items["tokens"] = count
+
+    def to_dict(self) -> dict:
+        return {'calls': self.calls, 'wall_time': self.wall_time, 'allocated_blocks': self.allocated_blocks,
+                'collections': self.collections, 'items': dict(self.items)}
+
+
+class Metrics(object):
+    '''Records wall time, allocations and item counts of every pipeline phase run while it is active:
+
+        with tc.Metrics() as metrics:
+            program = tc.Assembler.assemble(tc.Parser.syntax_analysis(tc.Parser.lexical_analysis(text)))
+            tc.Interpreter().execute(program)
+        print(metrics.to_dict())
+
+    Recording follows the context (contextvars), so it covers the calling thread and its asyncio tasks.
+    Phases include the phases they call, e.g. execute includes the load of every linked program.
+    While no Metrics is active every measured function pays one context variable lookup per call'''
+    def __init__(self):
+        self.phases:dict = dict() # phases["lexical_analysis"] = PhaseMetrics, in order of first run
+        self.lock:threading.Lock = threading.Lock()
+        self._tokens:list = []
+
+    def __enter__(self) -> 'Metrics':
+        self._tokens.append(_active.set(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        _active.reset(self._tokens.pop())
+
+    def phase(self, name:str) -> PhaseMetrics:
+        with self.lock:
+            phase = self.phases.get(name)
+            if phase is None:
+                phase = self.phases[name] = PhaseMetrics(name)
+            return phase
+
+    @contextlib.contextmanager
+    def measure(self, name:str) -> typing.Iterator[PhaseMetrics]:
+        '''Record the enclosed code as one run of phase name'''
+        phase = self.phase(name)
+        token = _running.set(_running.get() + (phase,))
+        blocks, collections, start = sys.getallocatedblocks(), _collections(), time.perf_counter_ns()
+        try:
+            yield phase
+        finally:
+            wall_time = time.perf_counter_ns() - start
+            with self.lock:
+                phase.calls += 1
+                phase.wall_time += wall_time
+                phase.allocated_blocks += sys.getallocatedblocks() - blocks
+                phase.collections += _collections() - collections
+            _running.reset(token)
+
+    def add(self, phase:PhaseMetrics, items:dict):
+        with self.lock:
+            for item, count in items.items():
+                phase.items[item] = phase.items.get(item, 0) + count
+
+    def to_dict(self) -> dict:
+        return {'version': METRICS_FORMAT_VERSION, 'phases': {name: p.to_dict() for name, p in self.phases.items()}}
+
+    def dump(self, path:typing.Union[os.PathLike, str]):
+        '''Write the metrics as JSON, times are in nanoseconds'''
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+    def report(self) -> str:
+        '''The metrics as a table'''
+        out = [f'{"phase":<20} {"calls":>7} {"time (ms)":>12} {"blocks":>10} {"gc":>4}  items']
+        for name, p in self.phases.items():
+            items = ', '.join(f'{item}={count}' for item, count in p.items.items())
+            out.append(f'{name:<20} {p.calls:>7} {p.wall_time / 1e6:>12.3f} {p.allocated_blocks:>10} {p.collections:>4}  {items}')
+        return '\n'.join(out)
+
+
+def _collections() -> int:
+    return sum(generation['collections'] for generation in gc.get_stats())
+
+
+def measure(name:str) -> typing.ContextManager:
+    '''Record the enclosed code as one run of phase name of the active Metrics, if any'''
+    metrics = _active.get()
+    return metrics.measure(name) if metrics is not None else contextlib.nullcontext()
+
+
+def measured(name:str, items:typing.Optional[typing.Callable]=None) -> typing.Callable:
+    '''
+    Decorator recording every call of a function as a run of phase name of the active Metrics
+    @Params
+        name:str            The phase
+        items:Callable      items(result) -> {"item": count} added to the phase after each call
+    '''
+    def decorator(function:typing.Callable) -> typing.Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            metrics = _active.get()
+            if metrics is None:
+                return function(*args, **kwargs)
+            with metrics.measure(name) as phase:
+                result = function(*args, **kwargs)
+                if items is not None:
+                    metrics.add(phase, items(result))
+            return result
+        return wrapper
+    return decorator
+
+
+def count(**items):
+    '''Add to the item counts of the innermost running phase, if metrics are being recorded'''
+    metrics, running = _active.get(), _running.get()
+    if metrics is not None and running:
+        metrics.add(running[-1], items)
@@ -1,12 +1,7 @@
 "Define Node Class"
 import os, sys
-import functools
-import time
-import enum
 import typing
-import re
 
-from pprint import pprint
 from .token_types import *
 from .token import Token
 
@@ -20,6 +15,15 @@ class Node(object):
         self.token:Token = token
         self.children:list = children
 
+    def size(self) -> int:
+        '''Number of nodes in the tree rooted here'''
+        size, pending = 0, [self]
+        while pending:
+            node = pending.pop()
+            size += 1
+            pending.extend(node.children)
+        return size
+
     def is_leaf(self) -> bool:
         return (len(self.children) == 0)
 
@@ -45,4 +49,54 @@ class Node(object):
         return ret
 
     def __repr__(self):
-        return self._repr_helper(1)
\ No newline at end of file
+        return self._repr_helper(1)
+
+class NodeTable(object):
+    '''Hash-consing of expression subtrees. Structurally identical subtrees (same token types and values, same
+    children) are interned as one shared Node, so a program repeating an expression holds it once, and two interned
+    subtrees are equal exactly when they are the same object. Interned nodes are shared and must not be modified.
+    An interned node keeps the token of its first occurrence, the line number of an expression is the one of its
+    statement. A table may be shared by the trees of several programs, but not by threads'''
+    def __init__(self):
+        self.nodes:dict = dict() # nodes[(token type, token value, ids of the interned children)] = the shared node
+        self.hits:int = 0 # subtrees replaced by a shared node
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def intern(self, node:Node) -> Node:
+        '''The shared node structurally identical to node, whose subtrees are interned first'''
+        interned = {} # interned[id(n)] = the shared node of n, for the nodes under node
+        pending = [(node, False)]
+        while pending: # post-order, expressions may be deeper than the recursion limit
+            n, expanded = pending.pop()
+            if id(n) in interned:
+                continue
+            if not expanded:
+                pending.append((n, True))
+                pending.extend((c, False) for c in n.children)
+                continue
+            children = [interned[id(c)] for c in n.children]
+            key = (n.token.type, n.token.value, tuple(id(c) for c in children))
+            shared = self.nodes.get(key)
+            if shared is None:
+                n.children = children
+                self.nodes[key] = shared = n
+            else:
+                self.hits += 1
+            interned[id(n)] = shared
+        return interned[id(node)]
+
+    def intern_tree(self, root:Node) -> Node:
+        '''Intern the operands of every statement of a PROG or BLOCK node in place. Statements keep their own
+        nodes, and with them their line numbers'''
+        pending = [root]
+        while pending:
+            block = pending.pop()
+            for statement in block.children:
+                for k, c in enumerate(statement.children):
+                    if c.token.type == TOKEN_TYPE.BLOCK:
+                        pending.append(c)
+                    else:
+                        statement.children[k] = self.intern(c)
+        return root
@@ -0,0 +1,126 @@
+'''Enum containing the instruction set of assembled programs'''
+'''Author: Ty Brennan'''
+
+import enum
+
+from .token_types import TOKEN_TYPE
+
+@enum.unique
+class OPCODE(enum.IntEnum):
+        # STACK (operand: constant / slot / array index)
+        PUSH_CONST = 1
+        LOAD = 2
+        STORE = 3
+        LOAD_ELEMENT = 4
+        STORE_ELEMENT = 5
+        LOAD_DIM = 6
+        STORE_DIM = 7
+        STORE_STRING = 8 # the UTF-8 bytes of a string constant into a CHAR8 array, resizing it
+        # MATHEMATICAL OPERATORS
+        ADD = 10
+        SUBTRACT = 11
+        MULTIPLY = 12
+        DIVIDE = 13
+        # BOOLEAN OPERATORS
+        GREATER_THAN = 20
+        LESS_THAN = 21
+        GE_THAN = 22
+        LE_THAN = 23
+        EQUAL_TO = 24
+        NOT_EQUAL_TO = 25
+        # LOGICAL OPERATORS
+        LOGICAL_AND = 30
+        LOGICAL_OR = 31
+        LOGICAL_NOT = 32
+        LOGICAL_NAND = 33
+        LOGICAL_XOR = 34
+        LOGICAL_NOR = 35
+        # FLOW CONTROL (operand: label index / instruction pointer)
+        LABEL = 40
+        JUMP = 41
+        JUMP_IF_FALSE = 42
+        HALT = 43
+        # COMPARE AND BRANCH (operand: instruction pointer, jumped to unless the comparison of the two top values holds)
+        JUMP_UNLESS_GREATER = 44
+        JUMP_UNLESS_LESS = 45
+        JUMP_UNLESS_GE = 46
+        JUMP_UNLESS_LE = 47
+        JUMP_UNLESS_EQUAL = 48
+        JUMP_UNLESS_NOT_EQUAL = 49
+        # COMMANDS (operand: constant index of the program name for CALL, slot for PROMPT, array slot for DISP_STR)
+        DISP = 50
+        CALL = 51
+        PROMPT = 52
+        DISP_STR = 53
+        # MATH FUNCTIONS (operand: MATH_EXACT / MATH_FAST precision of REAL32 operands)
+        SIN = 60
+        COS = 61
+        TAN = 62
+        COT = 63
+        SEC = 64
+        CSC = 65
+        ARCSIN = 66
+        ARCCOS = 67
+        ARCTAN = 68
+        ARCCOT = 69
+        ARCSEC = 70
+        ARCCSC = 71
+
+MATH_EXACT:int = 0 # correctly rounded from the double precision result
+MATH_FAST:int = 1 # single precision approximations for REAL32 operands, see mathlib
+
+"""====> CATEGORIES <===="""
+
+ARITHMETIC_OPCODES:dict = {
+    TOKEN_TYPE.PLUS: OPCODE.ADD,
+    TOKEN_TYPE.MINUS: OPCODE.SUBTRACT,
+    TOKEN_TYPE.MUL: OPCODE.MULTIPLY,
+    TOKEN_TYPE.DIV: OPCODE.DIVIDE,
+}
+COMPARISON_OPCODES:dict = {
+    TOKEN_TYPE.GREATER_THAN: OPCODE.GREATER_THAN,
+    TOKEN_TYPE.LESS_THAN: OPCODE.LESS_THAN,
+    TOKEN_TYPE.GE_THAN: OPCODE.GE_THAN,
+    TOKEN_TYPE.LE_THAN: OPCODE.LE_THAN,
+    TOKEN_TYPE.EQUAL_TO: OPCODE.EQUAL_TO,
+    TOKEN_TYPE.NOT_EQUAL_TO: OPCODE.NOT_EQUAL_TO,
+}
+LOGICAL_OPCODES:dict = {
+    TOKEN_TYPE.LOGICAL_AND: OPCODE.LOGICAL_AND,
+    TOKEN_TYPE.LOGICAL_OR: OPCODE.LOGICAL_OR,
+    TOKEN_TYPE.LOGICAL_NOT: OPCODE.LOGICAL_NOT,
+    TOKEN_TYPE.LOGICAL_NAND: OPCODE.LOGICAL_NAND,
+    TOKEN_TYPE.LOGICAL_XOR: OPCODE.LOGICAL_XOR,
+    TOKEN_TYPE.LOGICAL_NOR: OPCODE.LOGICAL_NOR,
+}
+MATH_OPCODES:dict = {
+    TOKEN_TYPE.SIN: OPCODE.SIN,
+    TOKEN_TYPE.COS: OPCODE.COS,
+    TOKEN_TYPE.TAN: OPCODE.TAN,
+    TOKEN_TYPE.COT: OPCODE.COT,
+    TOKEN_TYPE.SEC: OPCODE.SEC,
+    TOKEN_TYPE.CSC: OPCODE.CSC,
+    TOKEN_TYPE.ARCSIN: OPCODE.ARCSIN,
+    TOKEN_TYPE.ARCCOS: OPCODE.ARCCOS,
+    TOKEN_TYPE.ARCTAN: OPCODE.ARCTAN,
+    TOKEN_TYPE.ARCCOT: OPCODE.ARCCOT,
+    TOKEN_TYPE.ARCSEC: OPCODE.ARCSEC,
+    TOKEN_TYPE.ARCCSC: OPCODE.ARCCSC,
+}
+BRANCH_OPCODES:dict = { # comparison: the compare and branch instruction jumping unless it holds
+    OPCODE.GREATER_THAN: OPCODE.JUMP_UNLESS_GREATER,
+    OPCODE.LESS_THAN: OPCODE.JUMP_UNLESS_LESS,
+    OPCODE.GE_THAN: OPCODE.JUMP_UNLESS_GE,
+    OPCODE.LE_THAN: OPCODE.JUMP_UNLESS_LE,
+    OPCODE.EQUAL_TO: OPCODE.JUMP_UNLESS_EQUAL,
+    OPCODE.NOT_EQUAL_TO: OPCODE.JUMP_UNLESS_NOT_EQUAL,
+}
+BRANCH_COMPARISONS:dict = {branch: comparison for comparison, branch in BRANCH_OPCODES.items()}
+CONDITIONAL_JUMP_OPCODES:set = {
+    OPCODE.JUMP_IF_FALSE,
+    *BRANCH_COMPARISONS,
+}
+JUMP_OPCODES:set = {
+    OPCODE.JUMP,
+    *CONDITIONAL_JUMP_OPCODES,
+}
@@ -0,0 +1,101 @@
+"""Define the profile-guided optimizer
+Author: Ty Brennan
+"""
+
+import os, sys
+import typing
+
+from .opcodes import *
+from .assembler import Program
+from .jit import JIT_THRESHOLD
+from .metrics import measured
+
+COLD_FRACTION:float = 0.01 # blocks executed less often than this fraction of the hottest block are cold
+TERMINATORS:set = {OPCODE.JUMP, OPCODE.HALT} # never fall through to the next instruction
+
+
+class BasicBlock(object):
+    '''Instructions start..end that are only entered at start'''
+    def __init__(self, start:int, end:int, count:int):
+        self.start:int = start
+        self.end:int = end
+        self.count:int = count # executions of the first instruction
+
+
+class Optimizer():
+    '''Rewrite assembled programs using an execution profile recorded by the Profiler (main.py -i --profile).
+    Every rewrite keeps the observable behaviour, a program optimized with a profile prints exactly what it
+    prints without one'''
+
+    @classmethod
+    @measured('optimize', lambda program: {'instructions': len(program)})
+    def optimize(cls, program:Program, profile:dict) -> Program:
+        '''
+        @Params
+            program:Program     The assembled program
+            profile:dict        A profile, see Profiler.load. Ignored unless it was recorded for this program
+        @Returns
+            Program             The program with its hot blocks laid out contiguously, branch probabilities and
+                                JIT thresholds, or program itself if the profile does not match it
+        '''
+        entry = profile.get('programs', {}).get(program.name)
+        if entry is None or entry.get('fingerprint') != program.fingerprint():
+            return program
+        counts, jumps = entry['counts'], entry['jumps']
+        optimized, new_ips = cls.layout(program, cls.basic_blocks(program, counts))
+        for ip in range(len(program)):
+            if program.opcodes[ip] in CONDITIONAL_JUMP_OPCODES and counts[ip]:
+                optimized.branch_probabilities[new_ips[ip]] = jumps[ip] / counts[ip]
+        for label, ip in program.label_table.items():
+            if counts[ip] >= JIT_THRESHOLD: # compile the loops that became hot on their first entry
+                optimized.jit_thresholds[label] = 1
+        return optimized
+
+    @classmethod
+    @measured('optimize.basic_blocks', lambda blocks: {'blocks': len(blocks)})
+    def basic_blocks(cls, program:Program, counts:list) -> list:
+        '''The basic blocks of a program in order. Labels always start a block so that JIT regions keep their entry'''
+        leaders = {0} | program.jump_targets()
+        for ip in range(len(program)):
+            if program.opcodes[ip] in JUMP_OPCODES or program.opcodes[ip] == OPCODE.HALT:
+                leaders.add(ip + 1)
+            elif program.opcodes[ip] == OPCODE.LABEL:
+                leaders.add(ip)
+        starts = sorted(ip for ip in leaders if ip < len(program))
+        return [BasicBlock(start, starts[k+1] if k+1 < len(starts) else len(program), counts[start]) for k, start in enumerate(starts)]
+
+    @classmethod
+    @measured('optimize.layout', lambda result: {'instructions': len(result[0])})
+    def layout(cls, program:Program, blocks:list) -> tuple:
+        '''
+        Move cold blocks behind the hot ones, keeping the order within each group. A block whose successor is
+        no longer next to it jumps there explicitly, so hot loops become contiguous and cold code (e.g. a
+        rarely taken DISP) no longer keeps a loop from being compiled to native code.
+        @Returns
+            (Program, new_ips)      new_ips[ip] = instruction pointer of the old instruction ip in the new program
+        '''
+        hottest = max(block.count for block in blocks)
+        cold = [k > 0 and block.count < hottest * COLD_FRACTION for k, block in enumerate(blocks)] # the entry stays first
+        order = [k for k in range(len(blocks)) if not cold[k]] + [k for k in range(len(blocks)) if cold[k]]
+        optimized = Program(program.name)
+        optimized.version = program.version
+        optimized.constants, optimized.constant_types = list(program.constants), list(program.constant_types)
+        optimized.variables, optimized.array_variables = list(program.variables), list(program.array_variables)
+        optimized.type_map, optimized.labels = dict(program.type_map), list(program.labels)
+        new_ips = [0] * len(program)
+        fallthroughs = [] # (ip of the added JUMP, old ip of its target)
+        for position, k in enumerate(order):
+            block = blocks[k]
+            for ip in range(block.start, block.end):
+                new_ips[ip] = optimized.emit(program.opcodes[ip], program.operands[ip], program.line_numbers[ip])
+            last = block.end - 1
+            falls_through = program.opcodes[last] not in TERMINATORS and block.end < len(program)
+            if falls_through and (position + 1 == len(order) or order[position+1] != k + 1):
+                fallthroughs.append((optimized.emit(OPCODE.JUMP, 0, program.line_numbers[last]), block.end))
+        for ip in range(len(program)):
+            if program.opcodes[ip] in JUMP_OPCODES:
+                optimized.operands[new_ips[ip]] = new_ips[program.operands[ip]]
+        for ip, target in fallthroughs:
+            optimized.operands[ip] = new_ips[target]
+        optimized.label_table = {label: new_ips[ip] for label, ip in program.label_table.items()}
+        return optimized, new_ips
@@ -0,0 +1,97 @@
+"""Define output sinks for DISP and the debug channel
+Author: Ty Brennan
+"""
+
+import os, sys
+import time
+import typing
+
+BUFFER_LINES:int = 4096 # lines a BufferedSink holds before writing them out
+FLUSH_INTERVAL:float = 0.1 # seconds a BufferedSink holds a line at most, checked on every write and tick
+TICK_LABELS:int = 10000 # executed labels between two ticks of a BufferedSink, so lines come out during long loops
+
+
+class OutputSink(object):
+    '''Where DISP writes its lines. The interpreter flushes the sink before every PROMPT and after every program'''
+    def write_line(self, text:str):
+        raise NotImplementedError
+
+    def write_bytes(self, data:memoryview):
+        '''Write one line of UTF-8 bytes from DISPSTR. The view is only valid during the call'''
+        self.write_line(str(data, 'utf-8', 'replace')) # one decode of the whole buffer
+
+    def flush(self):
+        pass
+
+    def tick(self):
+        '''Called by the interpreter while a program runs without output, see BufferedSink'''
+        pass
+
+
+class BufferedSink(OutputSink):
+    '''Collect lines and write them to a text stream in one call, when buffer_lines lines are pending or the oldest
+    one has waited flush_interval seconds. buffer_lines=1 writes every line as it comes. The interpreter ticks the sink
+    every TICK_LABELS executed labels, so a line written before a long loop does not wait for the loop to end'''
+    def __init__(self, stream:typing.Optional[typing.TextIO]=None, buffer_lines:int=BUFFER_LINES, flush_interval:typing.Optional[float]=FLUSH_INTERVAL):
+        self.stream:typing.Optional[typing.TextIO] = stream # None for the current sys.stdout
+        self.buffer_lines:int = buffer_lines
+        self.flush_interval:typing.Optional[float] = flush_interval
+        self.pending:list = []
+        self.deadline:float = 0.0
+
+    def write_line(self, text:str):
+        pending = self.pending
+        pending.append(text)
+        if len(pending) == 1 and self.flush_interval is not None:
+            self.deadline = time.monotonic() + self.flush_interval
+        if len(pending) >= self.buffer_lines or (self.flush_interval is not None and time.monotonic() >= self.deadline):
+            self.flush()
+
+    def tick(self):
+        if self.pending and self.flush_interval is not None and time.monotonic() >= self.deadline:
+            self.flush()
+
+    @property
+    def ticking(self) -> bool:
+        '''Whether lines can be held back, and so the sink needs ticks'''
+        return self.buffer_lines > 1 and self.flush_interval is not None
+
+    def flush(self):
+        if self.pending:
+            stream = self.stream if self.stream is not None else sys.stdout
+            stream.write('\n'.join(self.pending) + '\n')
+            stream.flush()
+            self.pending.clear()
+
+
+class CaptureSink(OutputSink):
+    '''Keep every line in memory'''
+    def __init__(self):
+        self.lines:list = []
+
+    def write_line(self, text:str):
+        self.lines.append(text)
+
+    def getvalue(self) -> str:
+        return ''.join(line + '\n' for line in self.lines)
+
+
+class NullSink(OutputSink):
+    '''Discard every line, for benchmarks'''
+    def write_line(self, text:str):
+        pass
+
+    def write_bytes(self, data:memoryview):
+        pass
+
+
+def pretty(value) -> str:
+    '''pprint.pformat of a value for the debug channel, pprint is only imported once it is used'''
+    from pprint import pformat
+    return pformat(value)
+
+
+def debug(*values):
+    '''The debug channel, standard error. Call sites check their module's DEBUG first so that a disabled channel
+    does not even format its message'''
+    print(*values, file=sys.stderr)
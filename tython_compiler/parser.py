@@ -3,30 +3,30 @@ Author: Ty Brennan
 """
 
 import os, sys
-import functools
-import time
-import enum
 import typing
 import re
 
-from pprint import pprint
 from .token_types import *
 from .token import Token
-from .node import Node
+from .node import Node, NodeTable
 from .error import ParsingError
+from .output import debug, pretty
+from .metrics import measured
 
 COMMENT_DELIM = '#'
 DEBUG = False
 
 
 class Parser(object):
-    '''Parse code into AST'''
+    '''Parse code into AST. The parser holds no state, every analysis keeps it in locals and DEBUG is only read,
+    so any number of threads may parse at once'''
 
     @classmethod
+    @measured('lexical_analysis', lambda tokens: {'tokens': len(tokens)})
     def lexical_analysis(cls, text:str) -> list:
         '''Responsible for taking raw text input and generating a list of tokens.'''
         # buffers = list(filter(lambda x: x != '' and x != ' ', buffers))
-        if DEBUG: print(text)
+        if DEBUG: debug(text)
         buffers = []
         tokens = []
         buffer = ''
@@ -58,6 +58,16 @@ class Parser(object):
                         tokens.append(cls.analyze_buffer(buffer[:-1], current_line_number))
                     tokens.append(cls.analyze_buffer(')', current_line_number))
                     buffer = ''
+                elif curr_char == '[' and not in_str_lit:
+                    if buffer[:-1] != '':
+                        tokens.append(cls.analyze_buffer(buffer[:-1], current_line_number))
+                    tokens.append(Token(TOKEN_TYPE.L_BRACKET, current_line_number))
+                    buffer = ''
+                elif curr_char == ']' and not in_str_lit:
+                    if buffer[:-1] != '':
+                        tokens.append(cls.analyze_buffer(buffer[:-1], current_line_number))
+                    tokens.append(Token(TOKEN_TYPE.R_BRACKET, current_line_number))
+                    buffer = ''
                 elif curr_char == ',' and not in_str_lit:
                     if buffer[:-1] != '' and not in_str_lit:
                         tokens.append(cls.analyze_buffer(buffer[:-1], current_line_number))
@@ -85,7 +95,7 @@ class Parser(object):
                 if buffer != '':
                     tokens.append(cls.analyze_buffer(buffer, current_line_number))
             i += 1
-        if DEBUG: pprint(buffers)
+        if DEBUG: debug(pretty(buffers))
         for buffer in buffers:
             cls.analyze_buffer(buffer, tokens)
         # digest leading newlines
@@ -103,7 +113,7 @@ class Parser(object):
             else: break
         tokens = tokens[:-i]
         tokens.append(Token(TOKEN_TYPE.EOF, current_line_number))
-        if DEBUG: pprint(tokens)
+        if DEBUG: debug(pretty(tokens))
         return tokens
 
     @classmethod
@@ -137,19 +147,30 @@ class Parser(object):
         new_nodes = []
         scan = []
         depth = 0
+        opening = None # type of the outermost bracket currently being scanned
         for node in nodes:
-            if node.token.type == TOKEN_TYPE.L_PAREN:
+            if node.token.type in {TOKEN_TYPE.L_PAREN, TOKEN_TYPE.L_BRACKET}:
+                if depth == 0: opening = node.token.type
                 depth += 1
-            elif node.token.type == TOKEN_TYPE.R_PAREN:
+            elif node.token.type in {TOKEN_TYPE.R_PAREN, TOKEN_TYPE.R_BRACKET}:
                 depth -= 1
                 if depth < 0:
                     raise ParsingError("Too many right parentheses")
                 if depth == 0:
                     scan.append(node)
             if depth == 0:
-                if node.token.type != TOKEN_TYPE.R_PAREN:
+                if node.token.type not in {TOKEN_TYPE.R_PAREN, TOKEN_TYPE.R_BRACKET}:
                     new_nodes.append(node)
                 if len(scan) > 0:
+                    if (opening == TOKEN_TYPE.L_BRACKET) != (scan[-1].token.type == TOKEN_TYPE.R_BRACKET):
+                        raise ParsingError(f"Mismatched brackets on line {scan[0].token.line_number}")
+                    if opening == TOKEN_TYPE.L_BRACKET:
+                        # Array subscript: the index expression becomes the child of the array variable
+                        if len(new_nodes) == 0 or new_nodes[-1].token.type != TOKEN_TYPE.ARRAY_VAR or not new_nodes[-1].is_leaf():
+                            raise ParsingError(f"Subscript must follow an array variable on line {scan[0].token.line_number}")
+                        new_nodes[-1].children = [cls.handle_expr([s.token for s in scan][1:-1])]
+                        scan = []
+                        continue
                     if mode == "EXPR":
                         new_node = cls.handle_expr([s.token for s in scan][1:-1])
                     elif mode == "LOGIC":
@@ -175,11 +196,13 @@ class Parser(object):
         NUM -> (0-9)+
         '''
         # Steps
-        # 1. Recursively evaluate parentheses
-        # 2. In reverse order of operation precedence, find all operations and combine left to right,
+        # 1. Recursively evaluate parentheses and array subscripts
+        # 2. In order of operation precedence, find all operations and combine left to right,
         #    calling this function recursively to generate the node below
         # Only this function can create EXPR nodes
 
+        if len(tokens) == 0:
+            raise ParsingError("Expected expression, got nothing instead")
         # quick return for lone number
         if len(tokens) == 1:
             if tokens[0].type in NUMERALS:
@@ -191,8 +214,23 @@ class Parser(object):
         
         root_node = Node(Token(TOKEN_TYPE.EXPR, tokens[0].line_number))
         new_nodes = cls.handle_parenthesis(tokens, mode="EXPR")
+        # Attempt to assign expressions to functions (binds tighter than any operator)
+        i = 0
+        while i < len(new_nodes):
+            node:Node = new_nodes[i]
+            if (node.token.type in MATH_FUNCTIONS or node.token.type == TOKEN_TYPE.DIM) and node.is_leaf():
+                if i == len(new_nodes)-1:
+                    raise ParsingError(f"Function is last node in expression: {new_nodes}")
+                next_node:Node = new_nodes[i+1]
+                if next_node.token.type not in NUMERALS and next_node.token.type != TOKEN_TYPE.EXPR:
+                    raise ParsingError(f"Expected some input parameter to {node}, but got {next_node} instead")
+                new_node:Node = node
+                new_node.children = [next_node]
+                new_nodes = new_nodes[0:i] + new_nodes[i+2:]
+                new_nodes.insert(i, new_node)
+            i += 1
         # Smushes together operation nodes in order of operations
-        for op_level in reversed(ORDER_OF_OPERATIONS):
+        for op_level in ORDER_OF_OPERATIONS:
             i = 0
             while i < len(new_nodes):
                 node:Node = new_nodes[i]
@@ -203,9 +241,9 @@ class Parser(object):
                         assert i-1 >= 0
                     except:
                         raise ParsingError("Structure of expression invalid")
-                    if not (lhs.token.type in NUMERALS or lhs.token.type == TOKEN_TYPE.EXPR) and len(lhs.children) == 0:
+                    if not cls.is_operand(lhs):
                         raise ParsingError(f"Structure of expression invalid, got {lhs.token.type} instead")
-                    if not (rhs.token.type in NUMERALS or rhs.token.type == TOKEN_TYPE.EXPR) and len(lhs.children) == 0:
+                    if not cls.is_operand(rhs):
                         raise ParsingError(f"Structure of expression invalid, got {rhs.token.type} instead")
                     new_node = node
                     new_node.children = [lhs, rhs]
@@ -213,21 +251,6 @@ class Parser(object):
                     new_nodes.insert(i-1, new_node)
                     i -= 3
                 i += 1
-        # Attempt to assign expressions to functions
-        i = 0
-        while i < len(new_nodes):
-            node:Node = new_nodes[i]
-            if node.token.type in MATH_FUNCTIONS:
-                if i == len(new_nodes)-1:
-                    raise ParsingError(f"Function is last node in expression: {new_nodes}")
-                next_node:Node = new_nodes[i+1]
-                if next_node.token.type not in NUMERALS and next_node.token.type != TOKEN_TYPE.EXPR:
-                    raise ParsingError(f"Expected some input parameter to {node}, but got {next_node} instead")
-                new_node:Node = node
-                new_node.children = [next_node]
-                new_nodes = new_nodes[0:i] + new_nodes[i+2:]
-                new_nodes.insert(i, new_node)
-            i += 1
         # make sure there aren't any orphaned numbers left
         if len([n for n in new_nodes if n.token.type in NUMERALS]) != 1:
             for node in new_nodes:
@@ -236,6 +259,13 @@ class Parser(object):
         root_node.children = new_nodes
         return root_node
 
+    @classmethod
+    def is_operand(cls, node:Node) -> bool:
+        '''Whether a node can stand on either side of a numerical operator'''
+        if not node.is_leaf():
+            return True
+        return node.token.type in NUMERALS or node.token.type in {TOKEN_TYPE.EXPR, TOKEN_TYPE.VAR}
+
     @classmethod
     def handle_bool_expr(cls, tokens:list) -> Node:
         '''
@@ -289,14 +319,35 @@ class Parser(object):
         return root_node
 
     @classmethod
-    def syntax_analysis(cls, tokens:list):
-        '''Take list of tokens and create a (potentially illegal) AST'''
+    def handle_assign_target(cls, tokens:list) -> Node:
+        '''
+        Handles the right hand side of an assignment that is not a plain variable, of the form
+        @A[EXPR], @A (a whole CHAR8 array, from a string literal) or DIM(@A)
+        and returns the ARRAY_VAR or DIM node
+        '''
+        expr_node = cls.handle_expr(tokens)
+        if len(expr_node.children) != 1:
+            raise ParsingError(f"Invalid assignment target {tokens}")
+        target_node:Node = expr_node.children[0]
+        if target_node.token.type == TOKEN_TYPE.ARRAY_VAR:
+            return target_node
+        if target_node.token.type == TOKEN_TYPE.DIM:
+            return target_node
+        raise ParsingError(f"Expected array element or array dimension as assignment target, got {target_node.token} instead")
+
+    @classmethod
+    @measured('syntax_analysis', lambda tree: {'nodes': tree.size()})
+    def syntax_analysis(cls, tokens:list, table:typing.Optional[NodeTable]=None):
+        '''Take list of tokens and create a (potentially illegal) AST. With a table, identical expressions
+        share their nodes, the AST becomes a DAG'''
 
         if tokens[0].type is not TOKEN_TYPE.PROGRAM or tokens[1].type is not TOKEN_TYPE.STR_LIT:
             raise ParsingError(f"Program must begin with a program name, got {tokens[0]} and {tokens[1]} instead")
 
         root_node = Node(Token(TOKEN_TYPE.PROG, 0), [])
         cls.analyze_block(tokens, root_node)
+        if table is not None:
+            table.intern_tree(root_node)
         return root_node
 
 
@@ -306,7 +357,7 @@ class Parser(object):
         i = 0
         while i < len(tokens):
             prev_prev:Token = tokens[i-2] if i-2>=0 else None
-            prev:Token = tokens[i-1] if i-1>=0 else None
+            prev:Token = tokens[i-1] if i-1>=0 else Token(TOKEN_TYPE.LINE_BREAK, tokens[i].line_number) # a block starts on a fresh line
             curr:Token = tokens[i]
             next:Token = tokens[i+1] if i+1<len(tokens) else None
             next_next:Token = tokens[i+2] if i+2<len(tokens) else None
@@ -315,43 +366,54 @@ class Parser(object):
             # INT32 = 'INT32'
             elif curr.type == TOKEN_TYPE.INT32:
                 if prev.type != TOKEN_TYPE.LINE_BREAK: raise ParsingError(f"Token INT32 must be first token in line")
-                if next.type != TOKEN_TYPE.VAR: raise ParsingError(f"Expected VAR after INT32, got {next} instead")
+                if next.type not in {TOKEN_TYPE.VAR, TOKEN_TYPE.ARRAY_VAR}: raise ParsingError(f"Expected VAR or ARRAY_VAR after INT32, got {next} instead")
                 root_node.append_child(Node(curr, [Node(next, [])]))
                 i += 2
             # INT64 = 'INT64'
             elif curr.type == TOKEN_TYPE.INT64:
                 if prev.type != TOKEN_TYPE.LINE_BREAK: raise ParsingError(f"Token INT64 must be first token in line")
-                if next.type != TOKEN_TYPE.VAR: raise ParsingError(f"Expected VAR after INT64, got {next} instead")
+                if next.type not in {TOKEN_TYPE.VAR, TOKEN_TYPE.ARRAY_VAR}: raise ParsingError(f"Expected VAR or ARRAY_VAR after INT64, got {next} instead")
                 root_node.append_child(Node(curr, [Node(next, [])]))
                 i += 2
             # REAL32 = 'REAL32'
             elif curr.type == TOKEN_TYPE.REAL32:
                 if prev.type != TOKEN_TYPE.LINE_BREAK: raise ParsingError(f"Token REAL32 must be first token in line")
-                if next.type != TOKEN_TYPE.VAR: raise ParsingError(f"Expected VAR after REAL32, got {next} instead")
+                if next.type not in {TOKEN_TYPE.VAR, TOKEN_TYPE.ARRAY_VAR}: raise ParsingError(f"Expected VAR or ARRAY_VAR after REAL32, got {next} instead")
                 root_node.append_child(Node(curr, [Node(next, [])]))
                 i += 2
             # REAL64 = 'REAL64'
             elif curr.type == TOKEN_TYPE.REAL64:
                 if prev.type != TOKEN_TYPE.LINE_BREAK: raise ParsingError(f"Token REAL64 must be first token in line")
-                if next.type != TOKEN_TYPE.VAR: raise ParsingError(f"Expected VAR after REAL32, got {next} instead")
+                if next.type not in {TOKEN_TYPE.VAR, TOKEN_TYPE.ARRAY_VAR}: raise ParsingError(f"Expected VAR or ARRAY_VAR after REAL64, got {next} instead")
                 root_node.append_child(Node(curr, [Node(next, [])]))
                 i += 2
             # CHAR8 = 'CHAR8'
             elif curr.type == TOKEN_TYPE.CHAR8:
                 if prev.type != TOKEN_TYPE.LINE_BREAK: raise ParsingError(f"Token CHAR8 must be first token in line")
-                if next.type != TOKEN_TYPE.VAR: raise ParsingError(f"Expected VAR after CHAR8, got {next} instead")
+                if next.type not in {TOKEN_TYPE.VAR, TOKEN_TYPE.ARRAY_VAR}: raise ParsingError(f"Expected VAR or ARRAY_VAR after CHAR8, got {next} instead")
                 root_node.append_child(Node(curr, [Node(next, [])]))
                 i += 2
             # # MATHEMATICAL OPERATORS
             # ASSIGN = '\-\>'
             elif curr.type == TOKEN_TYPE.ASSIGN:
-                if next.type != TOKEN_TYPE.VAR:
-                    raise ParsingError("Expected variable after variable instance")
-                if root_node.children[-1].token.type != TOKEN_TYPE.EXPR:
+                if len(root_node.children) == 0 or root_node.children[-1].token.type != TOKEN_TYPE.EXPR:
                     raise ParsingError("Expected expression before assignment operator")
+                if next.type == TOKEN_TYPE.VAR:
+                    target_node = Node(next)
+                    j = i+2
+                elif next.type in {TOKEN_TYPE.ARRAY_VAR, TOKEN_TYPE.DIM}:
+                    # Array element or array dimension, scan rest of line
+                    j = i+1
+                    scan = []
+                    while j < len(tokens) and tokens[j].type not in {TOKEN_TYPE.LINE_BREAK, TOKEN_TYPE.EOF}:
+                        scan.append(tokens[j])
+                        j += 1
+                    target_node = cls.handle_assign_target(scan)
+                else:
+                    raise ParsingError(f"Expected variable after assignment operator, got {next} instead")
                 expr_node = root_node.children.pop()
-                root_node.append_child(Node(curr, [Node(next), expr_node]))
-                i += 2
+                root_node.append_child(Node(curr, [target_node, expr_node]))
+                i = j
             # PLUS = '\+':
             # MINUS = '\-'
             # MUL = '\*'
@@ -379,7 +441,7 @@ class Parser(object):
                             raise ParsingError("IF-THEN clause not closed with END token")
                         scan.append(tokens[j])
                         j += 1
-                    if DEBUG: print(f"1{scan=}")
+                    if DEBUG: debug(f"1{scan=}")
                     cls.analyze_block(scan, block_node)
                 else:
                     block_node = Node(Token(TOKEN_TYPE.BLOCK, -1))
@@ -390,7 +452,7 @@ class Parser(object):
                     while tokens[j].type not in {TOKEN_TYPE.EOF, TOKEN_TYPE.LINE_BREAK}:
                         scan.append(tokens[j])
                         j += 1
-                    if DEBUG: print(f"2{scan=}")
+                    if DEBUG: debug(f"2{scan=}")
                     cls.analyze_block(scan, block_node)
                 if len(block_node.children) == 0:
                     raise ParsingError("IF statement must be followed by code")
@@ -444,6 +506,10 @@ class Parser(object):
             # # VARIABLE LITERALS
             # CHAR_LIT = '\'.\''
             # STR_LIT = '\\".*\\"'
+            elif curr.type == TOKEN_TYPE.STR_LIT and next is not None and next.type == TOKEN_TYPE.ASSIGN:
+                # the value of a string assignment, "TEXT" -> @A
+                root_node.append_child(Node(Token(TOKEN_TYPE.EXPR, curr.line_number), [Node(curr)]))
+                i += 1
             # INT_LIT = '\\d+'
             # FLOAT_LIT = '\\d+\.\\d*'
             # HEX_LIT = '0x[A-F0-9]+'
@@ -454,11 +520,32 @@ class Parser(object):
             # # COMMANDS
             # DISP = 'DISP'
             elif curr.type == TOKEN_TYPE.DISP:
-                if next.type != TOKEN_TYPE.VAR and next.type not in REQUIRES_VALUE:
-                    raise ParsingError(f"Display command expects variable or literal after, got {next} instead")
-                root_node.append_child(Node(curr, [Node(next, [])])) #BUG Causes a circular reference curr->next->curr->next &c.
-                i += 2
+                if next.type in {TOKEN_TYPE.STR_LIT, TOKEN_TYPE.CHAR_LIT}:
+                    root_node.append_child(Node(curr, [Node(next, [])])) #BUG Causes a circular reference curr->next->curr->next &c.
+                    i += 2
+                else:
+                    # Display the value of an expression
+                    scan = []
+                    j = i+1
+                    while j < len(tokens) and is_expr_type(tokens[j].type):
+                        scan.append(tokens[j])
+                        j += 1
+                    if len(scan) == 0:
+                        raise ParsingError(f"Display command expects expression or literal after, got {next} instead")
+                    root_node.append_child(Node(curr, [cls.handle_expr(scan)]))
+                    i = j
             # DISP_STR = 'DISPSTR'
+            elif curr.type == TOKEN_TYPE.DISP_STR:
+                if next.type != TOKEN_TYPE.ARRAY_VAR:
+                    raise ParsingError(f"Expected ARRAY_VAR after DISPSTR, got {next.type} instead")
+                root_node.append_child(Node(curr, [Node(next, [])]))
+                i += 2
+            # PROMPT = 'PROMPT'
+            elif curr.type == TOKEN_TYPE.PROMPT:
+                if next.type != TOKEN_TYPE.VAR:
+                    raise ParsingError(f"Expected VAR after PROMPT, got {next.type} instead")
+                root_node.append_child(Node(curr, [Node(next, [])]))
+                i += 2
             # # TRIG FUNCTIONS
             # SIN = 'SIN'
             # COS = 'COS'
@@ -493,14 +580,13 @@ class Parser(object):
                 # root_node.append_child(Node(curr, [Node(next), expr_node]))
                 scan = []
                 j = i
-                while (is_expr_type(tokens[j].type)):
+                while j < len(tokens) and is_expr_type(tokens[j].type):
                     scan.append(tokens[j])
                     j += 1
-                print(scan)
                 expr_node = cls.handle_expr(scan)
                 root_node.append_child(expr_node)
                 i = j
             else:
-                if DEBUG: print(f'failed to parse token {curr}.')
+                if DEBUG: debug(f'failed to parse token {curr}.')
                 i += 1
         return root_node
@@ -0,0 +1,126 @@
+"""Define the execution profiler
+Author: Ty Brennan
+"""
+
+import os, sys
+import json
+import typing
+
+from .opcodes import *
+from .assembler import Program
+
+PROFILE_FORMAT_VERSION:int = 1
+REPORT_ROWS:int = 10 # rows of every table of the hot-spot report
+
+
+class ProgramProfile(object):
+    '''Counters of one program, indexed by instruction pointer'''
+    def __init__(self, program:Program):
+        self.program:Program = program
+        self.counts:list = [0] * len(program) # counts[ip] = executions
+        self.times:list = [0] * len(program) # times[ip] = nanoseconds until the next instruction started
+        self.jumps:list = [0] * len(program) # jumps[ip] = times the jump at ip was taken
+
+    def lines(self) -> list:
+        '''[{"line", "count", "time"}] with count the executions of the first instruction of the line'''
+        lines:dict = dict()
+        for ip, line_number in enumerate(self.program.line_numbers):
+            entry = lines.get(line_number)
+            if entry is None:
+                lines[line_number] = {'line': line_number, 'count': self.counts[ip], 'time': self.times[ip]}
+            else:
+                entry['time'] += self.times[ip]
+        return list(lines.values())
+
+    def labels(self) -> list:
+        '''[{"label", "line", "entries", "instructions", "time"}], a label's region lasting until the next label'''
+        program = self.program
+        starts = sorted(program.label_table.values())
+        regions = []
+        for k, start in enumerate(starts):
+            end = starts[k+1] if k+1 < len(starts) else len(program)
+            regions.append({
+                'label': program.labels[program.operands[start]],
+                'line': program.line_numbers[start],
+                'entries': self.counts[start],
+                'instructions': sum(self.counts[start:end]),
+                'time': sum(self.times[start:end]),
+            })
+        return regions
+
+    def edges(self) -> list:
+        '''[{"line", "kind", "target_line", "label"?, "count"}] of every jump that was taken'''
+        program = self.program
+        edges = []
+        for ip, count in enumerate(self.jumps):
+            if count == 0:
+                continue
+            target = program.operands[ip]
+            edge = {'line': program.line_numbers[ip], 'kind': 'GOTO' if program.opcodes[ip] == OPCODE.JUMP else 'IF',
+                    'target_line': program.line_numbers[target] if target < len(program) else None, 'count': count}
+            if target < len(program) and program.opcodes[target] == OPCODE.LABEL:
+                edge['label'] = program.labels[program.operands[target]]
+            edges.append(edge)
+        return edges
+
+
+class Profiler(object):
+    '''Collects execution counts and times per instruction while an Interpreter runs with it.
+    Profiled programs are interpreted instruction by instruction, native regions are not used, so every count
+    is exact. Without a profiler the interpreter pays one check per instruction'''
+    def __init__(self):
+        self.programs:dict = dict() # programs["NAME"] = ProgramProfile
+
+    def program(self, program:Program) -> ProgramProfile:
+        profile = self.programs.get(program.name)
+        if profile is None or profile.program is not program:
+            profile = ProgramProfile(program)
+            self.programs[program.name] = profile
+        return profile
+
+    def to_dict(self) -> dict:
+        return {
+            'version': PROFILE_FORMAT_VERSION,
+            'total_time': sum(sum(p.times) for p in self.programs.values()),
+            'programs': {name: {
+                'lines': p.lines(), 'labels': p.labels(), 'edges': p.edges(),
+                # raw counters for profile-guided optimization, see optimizer.py
+                'fingerprint': p.program.fingerprint(), 'counts': p.counts, 'jumps': p.jumps,
+            } for name, p in self.programs.items()},
+        }
+
+    def dump(self, path:typing.Union[os.PathLike, str]):
+        '''Write the machine-readable profile, times are in nanoseconds'''
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+    @classmethod
+    def load(cls, path:typing.Union[os.PathLike, str]) -> dict:
+        '''A profile written by dump'''
+        with open(path, 'r') as f:
+            profile = json.load(f)
+        if not isinstance(profile, dict) or profile.get('version') != PROFILE_FORMAT_VERSION:
+            raise ValueError(f'{path} is not a Tython profile of format version {PROFILE_FORMAT_VERSION}')
+        return profile
+
+    def report(self, rows:int=REPORT_ROWS) -> str:
+        '''The hottest lines, labels and jumps of every program, as text'''
+        total = max(sum(sum(p.times) for p in self.programs.values()), 1)
+        out = []
+        for name, p in self.programs.items():
+            out.append(f'Profile of "{name}"')
+            out.append(f'  {"line":>6} {"count":>12} {"time (ms)":>12} {"%":>6}')
+            for entry in sorted(p.lines(), key=lambda e: e['time'], reverse=True)[:rows]:
+                out.append(f'  {entry["line"]:>6} {entry["count"]:>12} {entry["time"] / 1e6:>12.3f} {100 * entry["time"] / total:>6.1f}')
+            labels = sorted(p.labels(), key=lambda e: e['time'], reverse=True)[:rows]
+            if labels:
+                out.append(f'  {"label":>6} {"entries":>12} {"time (ms)":>12} {"%":>6}')
+                for entry in labels:
+                    out.append(f'  {entry["label"]:>6} {entry["entries"]:>12} {entry["time"] / 1e6:>12.3f} {100 * entry["time"] / total:>6.1f}')
+            edges = sorted(p.edges(), key=lambda e: e['count'], reverse=True)[:rows]
+            if edges:
+                out.append(f'  {"jump":>16} {"taken":>12}')
+                for edge in edges:
+                    jump = f'{edge["kind"]} {edge["line"]}->{edge.get("label", edge["target_line"])}'
+                    out.append(f'  {jump:>16} {edge["count"]:>12}')
+        return '\n'.join(out)
@@ -0,0 +1,65 @@
+"""Define the framed protocol of the interpreter daemon
+Author: Ty Brennan
+"""
+
+import os, sys
+import json
+import socket
+import struct
+import tempfile
+import typing
+
+# Every message is a JSON object preceded by its length as a 4 byte big-endian unsigned integer.
+# While running a request the daemon may ask for a line of input with {"input": true}, the client answers
+# {"line": "..."} ("" at the end of its input) and the exchange ends with the response.
+FRAME_HEADER = struct.Struct('>I')
+MAX_FRAME_SIZE:int = 1 << 30
+DEFAULT_SOCKET_PATH:str = os.environ.get('TYTHON_SOCKET', os.path.join(tempfile.gettempdir(), f'tython-{os.getuid()}.sock'))
+
+
+class ProtocolError(Exception):
+    ...
+
+def receive_exactly(connection:socket.socket, size:int) -> typing.Optional[bytes]:
+    '''size bytes from the connection, None if it was closed before the first byte'''
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = connection.recv(min(remaining, 1 << 20))
+        if not chunk:
+            if remaining == size: return None
+            raise ProtocolError(f'Connection closed in the middle of a frame ({size - remaining}/{size} bytes)')
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+def send_frame(connection:socket.socket, message:dict):
+    payload = json.dumps(message).encode('utf-8')
+    connection.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+
+def receive_frame(connection:socket.socket) -> typing.Optional[dict]:
+    '''The next message, None once the peer closed the connection'''
+    header = receive_exactly(connection, FRAME_HEADER.size)
+    if header is None:
+        return None
+    (size,) = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ProtocolError(f'Frame of {size} bytes exceeds the limit of {MAX_FRAME_SIZE}')
+    payload = receive_exactly(connection, size) if size else b''
+    if payload is None:
+        raise ProtocolError('Connection closed after a frame header')
+    return json.loads(payload.decode('utf-8'))
+
+def request(message:dict, socket_path:typing.Optional[str]=None, input_stream:typing.Optional[typing.TextIO]=None) -> dict:
+    '''Send one request to the daemon and wait for its response, answering its PROMPTs from input_stream (sys.stdin)'''
+    input_stream = input_stream if input_stream is not None else sys.stdin
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path or DEFAULT_SOCKET_PATH)
+        send_frame(connection, message)
+        while True:
+            response = receive_frame(connection)
+            if response is None:
+                raise ProtocolError('The daemon closed the connection without responding')
+            if not response.get('input'):
+                return response
+            send_frame(connection, {'line': input_stream.readline() if input_stream is not None else ''})
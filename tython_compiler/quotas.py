@@ -0,0 +1,59 @@
+"""Define execution quotas, the limits of one run of an untrusted program
+Author: Ty Brennan
+"""
+
+import os, sys
+import time
+import typing
+
+from .datatypes import Array
+from .error import QuotaExceededError
+
+NO_CHECK:int = 1 << 62 # instruction count that is never reached
+TIME_CHECK_INTERVAL:int = 10000 # instructions between two looks at the clock
+
+
+class Quotas(object):
+    '''
+    Limits of every run of an Interpreter, None for no limit. Instructions and wall time are only checked when
+    a label is executed, so every loop iteration is accounted for while straight code runs unchecked and costs
+    nothing. Loops running as native code hand control back in time for every check, and are charged the length
+    of their loop body per iteration. Array memory is checked before every resize, with element sizes of DType.size
+    '''
+    def __init__(self, max_instructions:typing.Optional[int]=None, max_seconds:typing.Optional[float]=None,
+                 max_array_bytes:typing.Optional[int]=None):
+        self.max_instructions:typing.Optional[int] = max_instructions
+        self.max_seconds:typing.Optional[float] = max_seconds # wall time, including time waiting for PROMPT input
+        self.max_array_bytes:typing.Optional[int] = max_array_bytes
+
+    def deadline(self) -> typing.Optional[float]:
+        '''time.monotonic() at which a run starting now is out of time'''
+        return None if self.max_seconds is None else time.monotonic() + self.max_seconds
+
+    def check(self, instructions:int, deadline:typing.Optional[float], line_number:int) -> int:
+        '''
+        Raise QuotaExceededError if a run is over its instruction or time limit
+        @Returns
+            int     The instruction count at which to check again
+        '''
+        if self.max_instructions is not None and instructions > self.max_instructions:
+            raise QuotaExceededError('instructions', self.max_instructions, instructions, line_number)
+        if deadline is not None:
+            now = time.monotonic()
+            if now > deadline:
+                raise QuotaExceededError('seconds', self.max_seconds, round(self.max_seconds + now - deadline, 3), line_number)
+        check_at = NO_CHECK if self.max_instructions is None else self.max_instructions + 1
+        return check_at if deadline is None else min(check_at, instructions + TIME_CHECK_INTERVAL)
+
+    def charge_array(self, array_bytes:int, a:Array, dim:int, line_number:int) -> int:
+        '''
+        Raise QuotaExceededError if resizing an array to dim elements takes the total array memory over the limit
+        @Returns
+            int     The total array memory in bytes after the resize
+        '''
+        if dim < 0:
+            return array_bytes # the resize fails by itself
+        total = array_bytes + (dim - a.dim) * a.element_size
+        if self.max_array_bytes is not None and total > self.max_array_bytes:
+            raise QuotaExceededError('array_bytes', self.max_array_bytes, total, line_number)
+        return total
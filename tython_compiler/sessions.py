@@ -0,0 +1,97 @@
+"""Define asyncio program sessions
+Author: Ty Brennan
+"""
+
+import os, sys
+import asyncio
+import typing
+
+from .assembler import Program
+from .linker import Linker, ProgramCache
+from .jit import JIT
+from .interpreter import Interpreter
+
+
+class QueueInput(object):
+    '''PROMPT input taken from an asyncio.Queue of lines, None ends the input'''
+    def __init__(self, queue:asyncio.Queue):
+        self.queue:asyncio.Queue = queue
+
+    async def readline(self) -> str:
+        line = await self.queue.get()
+        return '' if line is None else line
+
+
+class QueueOutput(object):
+    '''DISP output put on an asyncio.Queue, one line at a time'''
+    def __init__(self, queue:asyncio.Queue):
+        self.queue:asyncio.Queue = queue
+
+    async def write(self, text:str):
+        await self.queue.put(text)
+
+
+class StreamInput(object):
+    '''PROMPT input read from an asyncio.StreamReader, e.g. a socket'''
+    def __init__(self, reader:asyncio.StreamReader):
+        self.reader:asyncio.StreamReader = reader
+
+    async def readline(self) -> str:
+        return (await self.reader.readline()).decode('utf-8', errors='replace')
+
+
+class StreamOutput(object):
+    '''DISP output written to an asyncio.StreamWriter, waiting for the peer when its buffer is full'''
+    def __init__(self, writer:asyncio.StreamWriter):
+        self.writer:asyncio.StreamWriter = writer
+
+    async def write(self, text:str):
+        self.writer.write(text.encode('utf-8'))
+        await self.writer.drain()
+
+
+class Session(object):
+    '''One run of a program with its own variables, multiplexed with other sessions on the event loop'''
+    def __init__(self, program:Program, input_stream, output_stream, jit:typing.Optional[JIT]=None,
+                 linker:typing.Optional[Linker]=None, timeslice:int=1000):
+        self.program:Program = program
+        self.timeslice:int = timeslice
+        self.input_stream = input_stream
+        self.output_stream = output_stream
+        self.interpreter:Interpreter = Interpreter(jit=jit, linker=linker)
+        self.interpreter.clear_variables()
+
+    async def run(self):
+        await self.interpreter.execute_async(self.program, self.input_stream, self.output_stream, self.timeslice)
+
+
+async def serve_sessions(path:typing.Union[os.PathLike, str], socket_path:str, jit:bool=True):
+    '''
+    Start a session of the program at path for every connection to the Unix socket. The connection is the
+    terminal of the session: lines sent to it answer PROMPTs and DISP output is sent back, errors end with
+    "ERROR: ...". Serves until cancelled.
+    '''
+    programs = ProgramCache()
+    linker = Linker([os.path.dirname(os.path.abspath(path))])
+    shared_jit = JIT() if jit else None
+
+    async def handle(reader:asyncio.StreamReader, writer:asyncio.StreamWriter):
+        output = StreamOutput(writer)
+        try:
+            session = Session(programs.load(path), StreamInput(reader), output, shared_jit, linker)
+            await session.run()
+        except Exception as e: # e.g. IndexError from an empty program, reported like any other error
+            try:
+                await output.write(f'ERROR: {type(e).__name__}: {e}\n')
+            except OSError: # the peer is gone
+                pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_unix_server(handle, socket_path)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
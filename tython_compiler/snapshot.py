@@ -0,0 +1,140 @@
+"""Define binary snapshots of the interpreter state
+Author: Ty Brennan
+"""
+
+import os, sys
+import mmap
+import struct
+import typing
+
+from .datatypes import Datatypes, Array, make_value, INTEGER_DATATYPES
+from .error import ImageError
+
+SNAPSHOT_SUFFIX:str = '.tys'
+SNAPSHOT_MAGIC:bytes = b'TYS\0'
+SNAPSHOT_FORMAT_VERSION:int = 1
+
+# magic, format version, byte order (0 little, 1 big), scalars, arrays, type map entries, string table size
+HEADER = struct.Struct('<4sHHIIII')
+# string table offset, length, dtype, payload (int64 | double)
+SCALAR_RECORD = struct.Struct('<IIi4x8s')
+# string table offset, length, dtype, number of elements, offset of the raw buffer
+ARRAY_RECORD = struct.Struct('<IIi4xQQ')
+# string table offset, length, dtype
+TYPE_RECORD = struct.Struct('<IIi')
+ALIGNMENT:int = 8
+
+
+def align(offset:int) -> int:
+    return (offset + ALIGNMENT - 1) & ~(ALIGNMENT - 1)
+
+
+class Snapshot():
+    '''Save and restore Interpreter.variables, array_variables and type_map.
+    Scalars are stored as typed 8 byte slots, arrays as their raw native buffers, so restoring an array is one
+    bulk copy out of the memory-mapped file instead of decoding it element by element.
+
+    Layout:
+        header | scalar records | array records | type map records | string table | array buffers (8-byte aligned)'''
+
+    @classmethod
+    def dumps(cls, variables:dict, array_variables:dict, type_map:dict) -> bytes:
+        '''
+        @Params
+            variables:dict          variables["A0"] = DType
+            array_variables:dict    array_variables["@A0"] = Array
+            type_map:dict           type_map["A0"] = Datatypes
+        @Returns
+            bytes                   The snapshot
+        '''
+        strings = bytearray()
+        def string(s:str) -> tuple:
+            encoded = s.encode('utf-8')
+            strings.extend(encoded)
+            return (len(strings) - len(encoded), len(encoded))
+
+        scalars = bytearray()
+        for var, value in variables.items():
+            fmt = '<q' if value.meta_dtype in INTEGER_DATATYPES else '<d'
+            scalars += SCALAR_RECORD.pack(*string(var), value.meta_dtype.value, struct.pack(fmt, value.data.value))
+        types = b''.join(TYPE_RECORD.pack(*string(var), dtype.value) for var, dtype in type_map.items())
+        arrays = list(array_variables.items())
+        array_names = [string(a_var) for a_var, _ in arrays] # before the string table's size is used
+        data_offset = align(HEADER.size + len(scalars) + ARRAY_RECORD.size * len(arrays) + len(types) + len(strings))
+        records = bytearray()
+        buffers = []
+        for (a_var, a), name in zip(arrays, array_names):
+            records += ARRAY_RECORD.pack(*name, a.dtype.value, a.dim, data_offset)
+            buffers.append((data_offset, a.buffer))
+            data_offset = align(data_offset + a.dim * a.itemsize)
+        header = HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, int(sys.byteorder != 'little'),
+                             len(variables), len(arrays), len(type_map), len(strings))
+        snapshot = bytearray(header + scalars + records + types + strings)
+        for offset, buffer in buffers:
+            snapshot.extend(bytes(offset - len(snapshot)))
+            snapshot.extend(memoryview(buffer).cast('B'))
+        return bytes(snapshot)
+
+    @classmethod
+    def dump(cls, path:typing.Union[os.PathLike, str], variables:dict, array_variables:dict, type_map:dict):
+        '''Write a snapshot atomically, a crash while checkpointing leaves the previous snapshot intact'''
+        temporary_path = str(path) + '.tmp'
+        with open(temporary_path, 'wb') as f:
+            f.write(cls.dumps(variables, array_variables, type_map))
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path:typing.Union[os.PathLike, str]) -> tuple:
+        '''
+        @Returns
+            (variables, array_variables, type_map)      Restored from the memory-mapped snapshot at path
+        '''
+        with open(path, 'rb') as f:
+            try:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError: # empty file
+                raise ImageError(f"{path} is not a Tython snapshot") from None
+        with buffer:
+            return cls.loads(buffer, str(path))
+
+    @classmethod
+    def loads(cls, buffer, source:str='<snapshot>') -> tuple:
+        '''Restore from any bytes-like object, see load'''
+        view = memoryview(buffer)
+        try:
+            if len(view) < HEADER.size or bytes(view[:4]) != SNAPSHOT_MAGIC:
+                raise ImageError(f"{source} is not a Tython snapshot")
+            magic, version, byte_order, n_scalars, n_arrays, n_types, n_strings = HEADER.unpack_from(view)
+            if version != SNAPSHOT_FORMAT_VERSION:
+                raise ImageError(f"{source} has snapshot format version {version}, expected {SNAPSHOT_FORMAT_VERSION}")
+            if byte_order != int(sys.byteorder != 'little'):
+                raise ImageError(f"{source} was written on a host of different byte order")
+            offset = HEADER.size
+            scalar_records = [SCALAR_RECORD.unpack_from(view, offset + k * SCALAR_RECORD.size) for k in range(n_scalars)]
+            offset += n_scalars * SCALAR_RECORD.size
+            array_records = [ARRAY_RECORD.unpack_from(view, offset + k * ARRAY_RECORD.size) for k in range(n_arrays)]
+            offset += n_arrays * ARRAY_RECORD.size
+            type_records = [TYPE_RECORD.unpack_from(view, offset + k * TYPE_RECORD.size) for k in range(n_types)]
+            offset += n_types * TYPE_RECORD.size
+            strings = bytes(view[offset:offset+n_strings])
+            def string(offset:int, length:int) -> str:
+                return strings[offset:offset+length].decode('utf-8')
+
+            variables = dict()
+            for name_offset, length, dtype_value, payload in scalar_records:
+                dtype = Datatypes(dtype_value)
+                variables[string(name_offset, length)] = make_value(dtype, struct.unpack('<q' if dtype in INTEGER_DATATYPES else '<d', payload)[0])
+            array_variables = dict()
+            for name_offset, length, dtype_value, dim, data_offset in array_records:
+                a = Array(Datatypes(dtype_value))
+                end = data_offset + dim * a.itemsize
+                if end > len(view):
+                    raise ImageError(f"{source} is truncated")
+                a.frombytes(view[data_offset:end]) # one memcpy out of the mapping
+                array_variables[string(name_offset, length)] = a
+            type_map = {string(name_offset, length): Datatypes(dtype_value) for name_offset, length, dtype_value in type_records}
+            return variables, array_variables, type_map
+        except struct.error:
+            raise ImageError(f"{source} is truncated") from None
+        finally:
+            view.release()
@@ -59,6 +59,7 @@ class TOKEN_TYPE(enum.Enum):
         # COMMANDS
         DISP = 'DISP'
         DISP_STR = 'DISPSTR'
+        PROMPT = 'PROMPT'
         # TRIG FUNCTIONS
         SIN = 'SIN'
         COS = 'COS'
@@ -77,6 +78,8 @@ class TOKEN_TYPE(enum.Enum):
         DIM = 'DIM'
         # STRUCTURE TOKENS
         COMMA = '\,'
+        L_BRACKET = '\['
+        R_BRACKET = '\]'
         LINE_BREAK = 1
         EOF = 2
         EXPR = 3
@@ -155,5 +158,9 @@ def is_expr_type(type):
         or type in MATH_FUNCTIONS \
         or type == TOKEN_TYPE.L_PAREN \
         or type == TOKEN_TYPE.R_PAREN \
+        or type == TOKEN_TYPE.L_BRACKET \
+        or type == TOKEN_TYPE.R_BRACKET \
         or type in NUMERICAL_OPERATORS \
-        or type == TOKEN_TYPE.VAR
\ No newline at end of file
+        or type == TOKEN_TYPE.VAR \
+        or type == TOKEN_TYPE.ARRAY_VAR \
+        or type == TOKEN_TYPE.DIM
\ No newline at end of file
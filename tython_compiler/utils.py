@@ -1,7 +1,5 @@
 '''Helper functions to help visualize and debug'''
 from .token_types import *
-from .token import Token
-from .node import Node
 
 def print_plain_string(tokens:list) -> str:
     '''Take in a list of tokens and print them as a nice, human-readable string'''